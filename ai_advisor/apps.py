@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class AiAdvisorConfig(AppConfig):
+    name = 'ai_advisor'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,29 @@
+"""Cached study tips per grade band (see ``sims.catalog``)."""
+from sims.catalog import cached
+
+from .models import StudyTip
+
+CATALOG = 'study-tips'
+
+
+def grade_band(grade_level):
+    """The ``StudyTip.grade_level`` band ('1-2', '3-4', ...) of a numeric grade."""
+    try:
+        grade = int(grade_level)
+    except (TypeError, ValueError):
+        return 'all'
+    low = grade - (grade - 1) % 2
+    band = f'{low}-{low + 1}'
+    return band if band in dict(StudyTip._meta.get_field('grade_level').choices) else 'all'
+
+
+def study_tips(band='all'):
+    """Contents of the active tips for ``band`` plus the tips for all grades."""
+    def build():
+        bands = {'all', band}
+        return list(
+            StudyTip.objects.filter(is_active=True, grade_level__in=bands)
+            .order_by('category', 'id').values_list('content', flat=True)
+        )
+
+    return cached(CATALOG, band, build)
@@ -0,0 +1,13 @@
+"""Invalidate the cached study tips when tips change."""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from sims.catalog import bump
+from .catalog import CATALOG
+from .models import StudyTip
+
+
+@receiver(post_save, sender=StudyTip)
+@receiver(post_delete, sender=StudyTip)
+def study_tip_changed(sender, **kwargs):
+    bump(CATALOG)
@@ -2,6 +2,7 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from .catalog import grade_band, study_tips
 from .models import AIConversation, AIMessage, SubjectRecommendation
 from .serializers import AIConversationSerializer, AIMessageSerializer, SubjectRecommendationSerializer
 from ranks.models import Grade
@@ -176,7 +177,11 @@ class StudyTipsViewSet(viewsets.ReadOnlyModelViewSet):
     def list(self, request):
         """Get study tips appropriate for the student's grade level"""
         try:
-            # Simple study tips for elementary students
+            # Tips entered by staff (cached per grade band), else a built-in set
+            profile = getattr(request.user, 'studentprofile', None)
+            tips = study_tips(grade_band(getattr(profile, 'grade_level', None)))
+            if tips:
+                return Response({"tips": tips})
             tips = [
                 "Find a quiet place to do your homework",
                 "Take short breaks between subjects",
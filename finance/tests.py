@@ -1,3 +1,4 @@
+from django.core.cache import caches
 from django.test import TestCase, Client
 from django.urls import reverse
 from users.models import User
@@ -8,6 +9,7 @@ import finance.views as finance_views
 
 class FinanceViewsTests(TestCase):
     def setUp(self):
+        caches['catalog'].clear()
         # finance user
         self.finance = User.objects.create_user(username='fin1', password='pass', role='finance', email='fin@example.com')
         # create a student and fee structure and a completed payment
@@ -25,3 +27,155 @@ class FinanceViewsTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         content = resp.content.decode('utf-8')
         self.assertIn('Finance Dashboard', content)
+
+    def test_fee_catalog_is_cached_until_a_fee_changes(self):
+        from payments.catalog import active_fee_structures
+
+        self.assertEqual([f.name for f in active_fee_structures()], ['Tuition'])
+        with self.assertNumQueries(0):
+            active_fee_structures()
+        with self.captureOnCommitCallbacks(execute=True):
+            FeeStructure.objects.create(name='Library', amount='50.00', description='Library fee', created_by=self.finance)
+        self.assertEqual([f.name for f in active_fee_structures()], ['Tuition', 'Library'])
+        self.fee.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fee.save()
+        self.assertEqual([f.name for f in active_fee_structures()], ['Library'])
+
+
+class FeeLedgerTests(TestCase):
+    def setUp(self):
+        from users.models import StudentProfile
+
+        caches['catalog'].clear()
+        self.finance = User.objects.create_user(username='ledger_fin', password='pass', role='finance')
+        self.tuition = FeeStructure.objects.create(name='Tuition', amount='1000.00', description='Tuition', created_by=self.finance)
+        self.library = FeeStructure.objects.create(name='Library', amount='50.00', description='Library', created_by=self.finance)
+        self.students = []
+        for idx, grade in enumerate((3, 3, 4)):
+            user = User.objects.create_user(username=f'ledger_student{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'LG{idx:04d}', grade_level=grade)
+            self.students.append(user)
+
+    def _pay(self, student, fee, amount, status='completed', txn='tx'):
+        return Payment.objects.create(student=student, fee_structure=fee, amount_paid=amount, payment_method='card',
+                                      transaction_id=f'{txn}-{student.id}-{fee.id}-{amount}', status=status)
+
+    def test_postings_keep_the_balance_row_current(self):
+        import datetime
+        from decimal import Decimal
+        from payments.ledger import adjust, balance_for, bill_fee
+        from payments.models import Invoice, StudentBalance
+
+        due = datetime.date(2024, 9, 1)
+        with self.assertNumQueries(8):  # billed check, balances (2), invoices, entries, balance update + savepoint pair
+            self.assertEqual(bill_fee(self.tuition, self.students, due), 3)
+        self.assertEqual(bill_fee(self.tuition, self.students, due), 0)
+        bill_fee(self.library, self.students[:1], due + datetime.timedelta(days=30))
+
+        student = self.students[0]
+        self._pay(student, self.library, '50.00')
+        payment = self._pay(student, self.tuition, '400.00', status='pending')
+        payment.status = 'completed'
+        payment.save()
+
+        with self.assertNumQueries(1):
+            balance = balance_for(student)
+        self.assertEqual((balance.balance, balance.total_charged, balance.total_paid), (Decimal('600.00'), Decimal('1050.00'), Decimal('450.00')))
+        self.assertEqual(balance.oldest_due, due)
+        self.assertEqual(balance.days_overdue(due + datetime.timedelta(days=45)), 45)
+        self.assertEqual(balance.aging_bucket(due + datetime.timedelta(days=45)), '31-60')
+        library = Invoice.objects.get(student=student, fee_structure=self.library)
+        self.assertEqual(library.outstanding, 0)
+
+        # a waiver settles the rest; overpaying leaves a credit for the next charge
+        adjust(student, '-600.00', 'Scholarship')
+        self._pay(student, self.tuition, '30.00', txn='extra')
+        balance = StudentBalance.objects.get(student=student)
+        self.assertEqual((balance.balance, balance.oldest_due), (Decimal('-30.00'), None))
+        bill_fee(FeeStructure.objects.create(name='Trip', amount='20.00', description='Trip', created_by=self.finance), [student])
+        self.assertEqual(StudentBalance.objects.get(student=student).balance, Decimal('-10.00'))
+        self.assertEqual(Invoice.objects.get(student=student, description='Trip').outstanding, 0)
+
+        # a completed payment that fails later is owed again
+        payment.status = 'failed'
+        payment.save()
+        self.assertEqual(StudentBalance.objects.get(student=student).balance, Decimal('390.00'))
+        self.assertEqual(list(student.ledger_entries.values_list('balance_after', flat=True))[-1], Decimal('390.00'))
+
+    def test_deleting_a_completed_payment_reverses_it(self):
+        from decimal import Decimal
+        from payments.ledger import balance_for, bill_fee
+        from payments.models import LedgerEntry, StudentBalance
+
+        bill_fee(self.tuition, self.students)
+        bill_fee(self.library, self.students[2:])
+        first, second, third = self.students
+        self._pay(first, self.tuition, '400.00')
+        self._pay(first, self.tuition, '100.00', status='failed')
+        Payment.objects.filter(student=first).delete()
+        self.assertEqual(balance_for(first).balance, Decimal('1000.00'))
+        self.assertEqual(LedgerEntry.objects.filter(student=first, kind='adjustment').count(), 1)
+
+        # cascades: the student's ledger goes with them; a deleted fee structure leaves its invoices
+        self._pay(second, self.tuition, '1000.00')
+        second.delete()
+        self.assertFalse(StudentBalance.objects.filter(student_id=second.pk).exists())
+        self._pay(third, self.library, '50.00')
+        self.library.delete()
+        self.assertEqual(balance_for(third).balance, Decimal('1050.00'))
+
+    def test_paying_a_fee_settles_its_open_invoice(self):
+        from decimal import Decimal
+        from payments.ledger import balance_for, bill_fee
+
+        student = self.students[0]
+        bill_fee(self.tuition, [student])
+        payment = self._pay(student, self.tuition, '1000.00')
+        # the payment bounced: tuition is owed again on a new invoice
+        payment.status = 'failed'
+        payment.save()
+        client = Client()
+        client.force_login(student)
+        client.post(reverse('pay_fees'), {'fee_structure_id': self.tuition.id})
+        self.assertEqual(balance_for(student).balance, Decimal('0.00'))
+        self.assertEqual(Payment.objects.filter(student=student, status='completed').count(), 1)
+
+    def test_outstanding_by_grade_is_one_query(self):
+        import datetime
+        from decimal import Decimal
+        from payments.ledger import bill_fee, outstanding_by_grade
+
+        today = datetime.date(2024, 12, 1)
+        bill_fee(self.tuition, self.students, datetime.date(2024, 11, 15))
+        bill_fee(self.library, self.students[2:], datetime.date(2024, 8, 1))
+        self._pay(self.students[1], self.tuition, '1000.00')
+        with self.assertNumQueries(1):
+            rows = outstanding_by_grade(today)
+        self.assertEqual([(row['grade_level'], row['students'], row['outstanding']) for row in rows], [
+            (3, 1, Decimal('1000.00')), (4, 1, Decimal('1050.00')),
+        ])
+        self.assertEqual((rows[0]['days_1_30'], rows[1]['days_over_90']), (Decimal('1000.00'), Decimal('1050.00')))
+
+    def test_pages_show_balances(self):
+        from payments.ledger import bill_fee
+        from users.models import StudentParent
+
+        bill_fee(self.tuition, self.students[:1])
+        client = Client()
+        client.force_login(self.students[0])
+        response = client.post(reverse('pay_fees'), {'fee_structure_id': self.library.id})
+        self.assertEqual(response.status_code, 302)
+        response = client.get(reverse('pay_fees'))
+        self.assertEqual(response.context['balance'].balance, 1000)
+        self.assertEqual([i.description for i in response.context['open_invoices']], ['Tuition'])
+
+        parent = User.objects.create_user(username='ledger_parent', password='pass', role='parent')
+        StudentParent.objects.create(parent=parent, student=self.students[0], relationship='Mother')
+        client.force_login(parent)
+        self.assertEqual(client.get(reverse('parent_fees_summary')).context['summary'][0]['balance'], 1000)
+        self.assertContains(client.get(reverse('child_fees', args=[self.students[0].id])), 'Statement')
+
+        client.force_login(self.finance)
+        response = client.get(reverse('outstanding_report'))
+        self.assertEqual(response.context['total_outstanding'], 1000)
@@ -6,5 +6,6 @@ urlpatterns = [
     path('fee-tracking/', views.fee_tracking, name='fee_tracking'),
     path('process-payments/', views.process_payments, name='process_payments'),
     path('fee-policies/', views.update_fee_policies, name='update_fee_policies'),
+    path('outstanding/', views.outstanding_report, name='outstanding_report'),
     path('financial-reports/', views.generate_financial_reports, name='financial_reports'),
 ]
\ No newline at end of file
@@ -1,16 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db.models import Sum, Count
-from django.http import HttpResponse
+from django.utils.dateparse import parse_date
 from users.decorators import finance_required
 from users.models import User
-from payments.models import Payment, FeeStructure
+from payments.models import Payment, FeeStructure, StudentBalance
+from payments.catalog import active_fee_structures
+from payments.ledger import bill_fee, outstanding_by_grade
 # `courses` app may not be present in all deployments; import defensively
 try:
     from courses.models import Course
 except Exception:
     Course = None
-import csv
+from reports.exports import iter_values, stream_csv
 from datetime import datetime, timedelta
 
 @finance_required
@@ -18,7 +20,8 @@ def finance_dashboard(request):
     # Financial statistics
     total_revenue = Payment.objects.filter(status='completed').aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0
     pending_payments = Payment.objects.filter(status='pending').count()
-    total_fee_structures = FeeStructure.objects.filter(is_active=True).count()
+    total_outstanding = StudentBalance.objects.filter(balance__gt=0).aggregate(Sum('balance'))['balance__sum'] or 0
+    total_fee_structures = len(active_fee_structures())
     
     # Recent payments
     recent_payments = Payment.objects.select_related('student', 'fee_structure').order_by('-payment_date')[:10]
@@ -26,6 +29,7 @@ def finance_dashboard(request):
     context = {
         'total_revenue': total_revenue,
         'pending_payments': pending_payments,
+        'total_outstanding': total_outstanding,
         'total_fee_structures': total_fee_structures,
         'recent_payments': recent_payments,
     }
@@ -33,7 +37,7 @@ def finance_dashboard(request):
 
 @finance_required
 def fee_tracking(request):
-    payments = Payment.objects.all().select_related('student', 'fee_structure').order_by('-payment_date')
+    payments = Payment.objects.all().select_related('student__fee_balance', 'fee_structure').order_by('-payment_date')
     
     # Filters
     status_filter = request.GET.get('status')
@@ -101,6 +105,13 @@ def update_fee_policies(request):
             fee_structure.save()
             messages.success(request, 'Fee structure updated successfully!')
         
+        elif 'bill' in request.POST:
+            fee_id = request.POST.get('fee_id')
+            fee_structure = get_object_or_404(FeeStructure, id=fee_id, is_active=True)
+            students = User.objects.filter(role='student', is_approved=True).values_list('id', flat=True)
+            billed = bill_fee(fee_structure, students, parse_date(request.POST.get('due_date') or ''))
+            messages.success(request, f'{fee_structure.name} billed to {billed} students.')
+        
         elif 'toggle' in request.POST:
             fee_id = request.POST.get('fee_id')
             fee_structure = get_object_or_404(FeeStructure, id=fee_id)
@@ -116,6 +127,24 @@ def update_fee_policies(request):
     }
     return render(request, 'finance/update_fee_policies.html', context)
 
+OUTSTANDING_COLUMNS = ('grade_level', 'students', 'outstanding', 'current', 'days_1_30', 'days_31_60', 'days_61_90', 'days_over_90')
+
+@finance_required
+def outstanding_report(request):
+    """Outstanding fees and their aging by grade level."""
+    rows = outstanding_by_grade()
+    if request.GET.get('format') == 'csv':
+        return stream_csv(
+            'outstanding_by_grade.csv',
+            [['Grade', 'Students', 'Outstanding', 'Current', '1-30 days', '31-60 days', '61-90 days', 'Over 90 days']],
+            ([row[key] for key in OUTSTANDING_COLUMNS] for row in rows),
+        )
+    context = {
+        'rows': rows,
+        'total_outstanding': sum(row['outstanding'] for row in rows),
+    }
+    return render(request, 'finance/outstanding_report.html', context)
+
 @finance_required
 def generate_financial_reports(request):
     # Date range for reports
@@ -141,6 +170,9 @@ def generate_financial_reports(request):
         count=Count('id')
     )
     
+    if request.GET.get('format') == 'csv':
+        return generate_financial_csv(revenue_data, fee_type_data)
+    
     context = {
         'revenue_data': list(revenue_data),
         'fee_type_data': list(fee_type_data),
@@ -148,25 +180,14 @@ def generate_financial_reports(request):
         'end_date': end_date,
     }
     
-    if request.GET.get('format') == 'csv':
-        return generate_financial_csv(revenue_data, fee_type_data)
-    
     return render(request, 'finance/financial_reports.html', context)
 
 def generate_financial_csv(revenue_data, fee_type_data):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Revenue'])
-    
-    for item in revenue_data:
-        writer.writerow([item['payment_date__date'], item['total']])
-    
-    writer.writerow([])
-    writer.writerow(['Fee Type', 'Total Revenue', 'Payment Count'])
-    
-    for item in fee_type_data:
-        writer.writerow([item['fee_structure__name'], item['total'], item['count']])
-    
-    return response
\ No newline at end of file
+    return stream_csv(
+        'financial_report.csv',
+        [['Date', 'Revenue']],
+        iter_values(revenue_data, 'payment_date__date', 'total'),
+        None,
+        [['Fee Type', 'Total Revenue', 'Payment Count']],
+        iter_values(fee_type_data, 'fee_structure__name', 'total', 'count'),
+    )
\ No newline at end of file
@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+
+from .unread import unread_summary
+
+DASHBOARD_COUNT = 5
+
+
+def unread_notifications(request):
+    """``unread_count`` and the newest ``unread_notifications`` for every
+    template; looked up only when a template uses them."""
+    user = getattr(request, 'user', None)
+    summary = SimpleLazyObject(lambda: unread_summary(user))
+    return {
+        'unread_count': SimpleLazyObject(lambda: summary['count']),
+        'unread_notifications': SimpleLazyObject(lambda: summary['latest'][:DASHBOARD_COUNT]),
+    }
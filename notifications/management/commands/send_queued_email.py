@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import BATCH_SIZE, send_pending
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox in batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Messages to send per SMTP connection')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_pending(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} email(s), {total_failed} failed or deferred'))
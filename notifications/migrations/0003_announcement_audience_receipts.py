@@ -0,0 +1,65 @@
+# Generated by Django 4.2 on 2026-10-18 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import json
+
+
+def _roles(value):
+    # same rules as notifications.models.parse_target_roles
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.split(',')
+        if isinstance(value, str):
+            value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return []
+    return sorted({str(role).strip() for role in value if str(role).strip()})
+
+
+def backfill_audience(apps, schema_editor):
+    Announcement = apps.get_model('notifications', 'Announcement')
+    AnnouncementAudience = apps.get_model('notifications', 'AnnouncementAudience')
+    rows = []
+    for announcement_id, target_roles in Announcement.objects.values_list('id', 'target_roles').iterator():
+        for role in _roles(target_roles) or ['all']:
+            rows.append(AnnouncementAudience(announcement_id=announcement_id, role=role))
+    AnnouncementAudience.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnouncementReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(auto_now_add=True)),
+                ('announcement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='notifications.announcement')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='announcement_receipts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'announcement')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnouncementAudience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=20)),
+                ('announcement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience', to='notifications.announcement')),
+            ],
+            options={
+                'unique_together': {('role', 'announcement')},
+            },
+        ),
+        migrations.RunPython(backfill_audience, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import json
+
+
+def _roles(value):
+    # same rules as notifications.models.parse_target_roles
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.split(',')
+        if isinstance(value, str):
+            value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return []
+    roles = []
+    for role in value:
+        role = str(role).strip()
+        if role == 'all':
+            return []
+        if role and role not in roles:
+            roles.append(role)
+    return roles
+
+
+def normalize_target_roles(apps, schema_editor):
+    """Rewrite JSON-string / comma-separated target_roles as plain lists and
+    rebuild the audience rows of every announcement that changed."""
+    Announcement = apps.get_model('notifications', 'Announcement')
+    AnnouncementAudience = apps.get_model('notifications', 'AnnouncementAudience')
+    for announcement in Announcement.objects.only('id', 'target_roles').iterator():
+        roles = _roles(announcement.target_roles)
+        if roles == announcement.target_roles:
+            continue
+        Announcement.objects.filter(pk=announcement.pk).update(target_roles=roles)
+        AnnouncementAudience.objects.filter(announcement_id=announcement.pk).delete()
+        AnnouncementAudience.objects.bulk_create(
+            [AnnouncementAudience(announcement_id=announcement.pk, role=role) for role in roles or ['all']]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_announcement_audience_receipts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['is_active', '-created_at'], name='notif_ann_active_recent_idx'),
+        ),
+        migrations.RunPython(normalize_target_roles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 05:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_counters(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadCounter = apps.get_model('notifications', 'UnreadCounter')
+    counts = (
+        Notification.objects.filter(is_read=False)
+        .values_list('user_id').annotate(n=models.Count('id')).order_by()
+    )
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=user_id, unread=n) for user_id, n in counts.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('notifications', '0005_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_unread_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
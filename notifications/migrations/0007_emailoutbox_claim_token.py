@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_unread_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='claim_token',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,5 +1,61 @@
-from django.db import models
+import json
+
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from users.models import User
+
+# Audience row meaning "every role"
+ALL_ROLES = 'all'
+
+
+def parse_target_roles(value):
+    """Normalize ``Announcement.target_roles`` to a list of roles.
+
+    Older rows store it as a JSON list, a JSON-encoded string or a
+    comma-separated string; an empty value means everyone.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.split(',')
+        if isinstance(value, str):
+            value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return []
+    roles = []
+    for role in value:
+        role = str(role).strip()
+        if role == ALL_ROLES:
+            return []
+        if role and role not in roles:
+            roles.append(role)
+    return roles
+
+
+class AnnouncementQuerySet(models.QuerySet):
+    def targeting(self, role):
+        """Announcements addressed to ``role`` (or to everyone), via the audience index."""
+        return self.filter(Exists(AnnouncementAudience.objects.filter(
+            announcement=OuterRef('pk'), role__in=[role, ALL_ROLES],
+        )))
+
+    def unread_by(self, user):
+        """Active announcements addressed to ``user`` that they have no read receipt for."""
+        return self.filter(is_active=True).targeting(user.role).exclude(Exists(
+            AnnouncementReceipt.objects.filter(announcement=OuterRef('pk'), user=user)
+        ))
+
+    def visible_to(self, role):
+        """Active announcements addressed to ``role`` or to everyone, newest first.
+
+        Filtering happens in the database, so callers can slice or paginate
+        the result directly.
+        """
+        return self.filter(is_active=True).targeting(role).order_by('-created_at', '-id')
+
+
 class Announcement(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
@@ -7,10 +63,109 @@ class Announcement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     target_roles = models.JSONField(default=list)  # List of roles that should see this
+
+    objects = AnnouncementQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', '-created_at'], name='notif_ann_active_recent_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # always store the plain list form; [] means everyone
+        self.target_roles = parse_target_roles(self.target_roles)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_audience()
+
+    def sync_audience(self):
+        """Mirror ``target_roles`` into the indexed AnnouncementAudience rows.
+
+        An announcement is stored once and matched to readers by role at read
+        time, so posting costs a handful of writes whatever the audience size.
+        """
+        roles = set(parse_target_roles(self.target_roles)) or {ALL_ROLES}
+        current = set(self.audience.values_list('role', flat=True))
+        if roles == current:
+            return
+        self.audience.exclude(role__in=roles).delete()
+        AnnouncementAudience.objects.bulk_create(
+            [AnnouncementAudience(announcement=self, role=role) for role in roles - current],
+            ignore_conflicts=True,
+        )
+
+
+class AnnouncementAudience(models.Model):
+    """One row per role an announcement is addressed to ('all' for everyone)."""
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='audience')
+    role = models.CharField(max_length=20)
+
+    class Meta:
+        unique_together = ['role', 'announcement']
+
+    def __str__(self):
+        return f"{self.announcement_id} -> {self.role}"
+
+
+class AnnouncementReceipt(models.Model):
+    """Marks an announcement as read by a user."""
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='receipts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='announcement_receipts')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'announcement']
+
+    def __str__(self):
+        return f"{self.user_id} read {self.announcement_id}"
+
+    @classmethod
+    def mark_read(cls, user, announcements):
+        """Record receipts for ``announcements`` (objects or ids); existing ones are kept."""
+        cls.objects.bulk_create(
+            [cls(user=user, announcement_id=getattr(a, 'pk', a)) for a in announcements],
+            ignore_conflicts=True,
+        )
+
+
+class NotificationQuerySet(models.QuerySet):
+    """Keeps ``UnreadCounter`` in step with bulk writes, which send no signals.
+
+    Single saves and deletes are covered by ``notifications.signals``.
+    """
+
+    def unread(self):
+        return self.filter(is_read=False)
+
+    def mark_read(self):
+        return self.unread().update(is_read=True)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .unread import adjust_unread
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        deltas = {}
+        for notification in objs:
+            if not notification.is_read:
+                deltas[notification.user_id] = deltas.get(notification.user_id, 0) + 1
+        adjust_unread(deltas)
+        return objs
+
+    def update(self, **kwargs):
+        if 'is_read' not in kwargs and 'user' not in kwargs and 'user_id' not in kwargs:
+            return super().update(**kwargs)
+        from .unread import recount_unread
+
+        user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        user_ids.update(filter(None, [getattr(kwargs.get('user'), 'pk', None), kwargs.get('user_id')]))
+        recount_unread(*user_ids)
+        return rows
+
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -18,6 +173,72 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.CharField(max_length=200, blank=True)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_unread_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username}: {self.title}"
\ No newline at end of file
+        return f"{self.user.username}: {self.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded owner and read state so the counter signals can
+        tell what a save or delete changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = (instance.user_id, instance.is_read)
+        return instance
+
+
+class UnreadCounter(models.Model):
+    """Denormalized count of a user's unread notifications.
+
+    Read through ``notifications.unread.unread_summary``, together with the
+    latest unread notifications.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+
+class EmailOutbox(models.Model):
+    """An email waiting to be sent by the ``send_queued_email`` worker.
+
+    Views queue messages here instead of talking to SMTP on the request
+    thread; the worker sends them in batches over one connection and records
+    the outcome of every message.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # set by the claiming worker; it sends only the rows carrying its token
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notif_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,134 @@
+"""Durable email outbox.
+
+``queue_email`` stores a message in ``EmailOutbox`` and returns immediately,
+so request latency no longer depends on SMTP. ``send_pending`` (run by the
+``send_queued_email`` management command) sends due messages in batches over
+a single connection and retries failures with exponential backoff:
+``EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (attempt - 1)``, giving up after
+``EMAIL_OUTBOX_MAX_ATTEMPTS``.
+
+Claiming a batch moves ``next_attempt_at`` forward by
+``EMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS``; a message still 'sending' after that
+was claimed by a worker that died, and is put back to 'pending'.
+"""
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+BATCH_SIZE = 100
+
+
+def _message(subject, body, to, html_body='', from_email=None):
+    if isinstance(to, str):
+        to = [to]
+    return EmailOutbox(
+        subject=subject[:255],
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', '') or '',
+        to=[address for address in to if address],
+    )
+
+
+def queue_email(subject, body, to, html_body='', from_email=None):
+    """Queue one message (to all of ``to`` together). Returns the outbox row,
+    or None when there is nobody to send to."""
+    message = _message(subject, body, to, html_body, from_email)
+    if not message.to:
+        return None
+    message.save()
+    return message
+
+
+def queue_emails(messages):
+    """Queue many messages at once; ``messages`` yields ``queue_email`` kwargs.
+    Returns the number queued."""
+    rows = [_message(**kwargs) for kwargs in messages]
+    rows = [row for row in rows if row.to]
+    EmailOutbox.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def _due_ids(batch_size, now):
+    return list(
+        EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+
+
+def _claim(batch_size):
+    """Take up to ``batch_size`` due messages for this worker; of several
+    workers that read the same ids, only the one whose token landed on a
+    row gets it."""
+    now = timezone.now()
+    EmailOutbox.objects.filter(status='sending', next_attempt_at__lte=now).update(status='pending')
+    ids = _due_ids(batch_size, now)
+    if not ids:
+        return []
+    timeout = getattr(settings, 'EMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS', 600)
+    token = uuid.uuid4()
+    EmailOutbox.objects.filter(id__in=ids, status='pending').update(
+        status='sending', next_attempt_at=now + datetime.timedelta(seconds=timeout), claim_token=token,
+    )
+    return list(EmailOutbox.objects.filter(claim_token=token, status='sending').order_by('id'))
+
+
+def _record_failure(message, error, now):
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    retry_seconds = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60)
+    message.attempts += 1
+    message.last_error = str(error)[:2000]
+    if message.attempts >= max_attempts:
+        message.status = 'failed'
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = now + datetime.timedelta(seconds=retry_seconds * 2 ** (message.attempts - 1))
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """Send one batch of due messages. Returns (sent, failed) counts for the batch;
+    a message that will be retried counts as failed."""
+    batch = _claim(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    now = timezone.now()
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # nothing can go out this round; every message gets retried later
+        for message in batch:
+            _record_failure(message, e, now)
+        EmailOutbox.objects.bulk_update(batch, ['status', 'attempts', 'last_error', 'next_attempt_at'])
+        return 0, len(batch)
+
+    try:
+        for message in batch:
+            email = EmailMultiAlternatives(
+                message.subject, message.body, message.from_email or None, message.to, connection=connection,
+            )
+            if message.html_body:
+                email.attach_alternative(message.html_body, 'text/html')
+            try:
+                email.send(fail_silently=False)
+            except Exception as e:
+                _record_failure(message, e, now)
+                failed += 1
+            else:
+                message.attempts += 1
+                message.status = 'sent'
+                message.sent_at = timezone.now()
+                message.last_error = ''
+                sent += 1
+    finally:
+        connection.close()
+
+    EmailOutbox.objects.bulk_update(batch, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at'])
+    return sent, failed
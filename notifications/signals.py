@@ -0,0 +1,42 @@
+"""Keep ``UnreadCounter`` in step with single notification saves and deletes,
+and tell the notification streams when announcements change."""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Announcement, Notification
+from .stream import bump_announcements_version
+from .unread import adjust_unread, recount_unread
+
+
+def _unread_deltas(before, after):
+    deltas = {}
+    for (user_id, is_read), sign in ((before, -1), (after, +1)):
+        if user_id is not None and not is_read:
+            deltas[user_id] = deltas.get(user_id, 0) + sign
+    return deltas
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    before = (None, True) if created else getattr(instance, '_loaded_state', None)
+    after = (instance.user_id, instance.is_read)
+    if before is None:
+        # saved without being loaded (e.g. built with an existing pk): recount
+        recount_unread(instance.user_id)
+    elif before != after:
+        adjust_unread(_unread_deltas(before, after))
+    instance._loaded_state = after
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    state = getattr(instance, '_loaded_state', (instance.user_id, instance.is_read))
+    adjust_unread(_unread_deltas(state, (None, True)))
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def announcement_changed(sender, **kwargs):
+    # Announcement.save() is atomic, so this runs once the audience rows exist
+    transaction.on_commit(bump_announcements_version)
@@ -0,0 +1,194 @@
+"""Server-Sent Events feed of a user's notifications and announcements.
+
+Each connection keeps an ``EventStream`` and polls it every
+``SSE_POLL_SECONDS``:
+
+* notifications -- a per-user version in the cache (``unread_version``),
+  replaced by the counter hooks, tells the stream to load ``unread_summary``
+  (the counter row and the newest unread notifications, see
+  ``notifications.unread``), which is pushed when it differs from what was
+  last sent.
+* announcements -- a global version number in the cache, bumped by the
+  announcement signals, tells the stream to reload them.
+
+An idle poll is therefore two cache reads and no queries. Every
+``SSE_DB_CHECK_SECONDS`` the stream also checks the database directly: it
+recounts the unread counter when a write bypassed the counter hooks, and
+reloads notifications and announcements written by another process when the
+cache is not shared between processes (the default locmem backend).
+
+Streams end after ``SSE_MAX_SECONDS``; browsers reconnect on their own.
+Under ASGI the stream is an async generator and holds no thread while idle.
+Under WSGI it would occupy a worker thread for its lifetime, so the view only
+streams there when ``SSE_WSGI_STREAMING`` is on (e.g. for runserver) and
+otherwise answers 204, after which the dashboard polls.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Announcement, Notification
+from .unread import recount_unread, unread_summary, unread_version
+
+ANNOUNCEMENTS_VERSION_KEY = 'notifications:announcements:version'
+ANNOUNCEMENT_COUNT = 10
+DATE_FORMAT = '%B %d, %Y at %I:%M %p'
+RETRY_MS = 3000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def bump_announcements_version():
+    cache.add(ANNOUNCEMENTS_VERSION_KEY, 0, None)
+    try:
+        cache.incr(ANNOUNCEMENTS_VERSION_KEY)
+    except ValueError:
+        cache.set(ANNOUNCEMENTS_VERSION_KEY, 1, None)
+
+
+def notifications_payload(user, summary=None):
+    """The ``get_notifications_ajax`` response body for ``user``."""
+    summary = summary or unread_summary(user)
+    notifications = [{
+        'id': notification.id,
+        'title': notification.title or 'Notification',
+        'message': notification.message or '',
+        'created_at': notification.created_at.strftime(DATE_FORMAT),
+        'is_read': notification.is_read,
+    } for notification in summary['latest']]
+    return {
+        'success': True,
+        'notifications': notifications,
+        'count': len(notifications),
+        'unread_count': summary['count'],
+    }
+
+
+def announcements_payload(user, role=None):
+    """The ``get_announcements_ajax`` response body for ``user``."""
+    announcements = [{
+        'id': announcement.id,
+        'title': announcement.title,
+        'content': announcement.content,
+        'created_at': announcement.created_at.strftime(DATE_FORMAT),
+    } for announcement in Announcement.objects.visible_to(role or user.role)[:ANNOUNCEMENT_COUNT]]
+    return {
+        'success': True,
+        'announcements': announcements,
+        'count': len(announcements),
+        'unread_count': Announcement.objects.unread_by(user).count(),
+    }
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _notifications_marker(summary):
+    return summary['count'], [notification.id for notification in summary['latest']]
+
+
+class EventStream:
+    """Change detection for one connection; ``poll()`` returns the SSE
+    messages to send (possibly none)."""
+
+    def __init__(self, user):
+        self.user = user
+        self.sent_notifications = None
+        self.unread_version = None
+        self.announcements_version = None
+        self.sent_announcements = None
+        self.last_db_check = None
+
+    def _check_database(self):
+        """Refresh the counter and cached state when the database disagrees with them."""
+        row = Notification.objects.filter(user=self.user, is_read=False).aggregate(n=Count('id'), last=Max('id'))
+        count, ids = self.sent_notifications
+        if (row['n'], row['last']) != (count, max(ids, default=None)):
+            recount_unread(self.user.pk)
+        latest = list(Announcement.objects.visible_to(self.user.role).values_list('id', flat=True)[:ANNOUNCEMENT_COUNT])
+        if latest != self.sent_announcements:
+            self.announcements_version = None
+
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        messages = []
+        check_database = self.last_db_check is None or now - self.last_db_check >= _setting('SSE_DB_CHECK_SECONDS', 30)
+        if check_database:
+            if self.sent_notifications is not None:
+                self._check_database()
+            self.last_db_check = now
+
+        # read before the summary, so a change made while it loads is seen next time
+        version = unread_version(self.user.pk)
+        if check_database or version != self.unread_version:
+            self.unread_version = version
+            summary = unread_summary(self.user)
+            marker = _notifications_marker(summary)
+            if marker != self.sent_notifications:
+                self.sent_notifications = marker
+                messages.append(sse('notifications', notifications_payload(self.user, summary)))
+
+        version = cache.get(ANNOUNCEMENTS_VERSION_KEY, 0)
+        if version != self.announcements_version:
+            self.announcements_version = version
+            payload = announcements_payload(self.user)
+            self.sent_announcements = [announcement['id'] for announcement in payload['announcements']]
+            messages.append(sse('announcements', payload))
+        return messages
+
+
+def _schedule():
+    return (
+        _setting('SSE_POLL_SECONDS', 2),
+        _setting('SSE_HEARTBEAT_SECONDS', 15),
+        _setting('SSE_MAX_SECONDS', 300),
+    )
+
+
+def event_stream(user):
+    """Blocking generator for WSGI servers."""
+    poll_seconds, heartbeat_seconds, max_seconds = _schedule()
+    stream = EventStream(user)
+    started = last_sent = time.monotonic()
+    yield f'retry: {RETRY_MS}\n\n'
+    while True:
+        now = time.monotonic()
+        messages = stream.poll(now)
+        if messages:
+            yield ''.join(messages)
+            last_sent = now
+        elif now - last_sent >= heartbeat_seconds:
+            yield ': ping\n\n'
+            last_sent = now
+        if now - started >= max_seconds:
+            return
+        time.sleep(poll_seconds)
+
+
+async def aevent_stream(user):
+    """Async generator for ASGI servers; polls run in a worker thread."""
+    poll_seconds, heartbeat_seconds, max_seconds = _schedule()
+    stream = EventStream(user)
+    poll = sync_to_async(stream.poll)
+    started = last_sent = time.monotonic()
+    yield f'retry: {RETRY_MS}\n\n'
+    while True:
+        now = time.monotonic()
+        messages = await poll(now)
+        if messages:
+            yield ''.join(messages)
+            last_sent = now
+        elif now - last_sent >= heartbeat_seconds:
+            yield ': ping\n\n'
+            last_sent = now
+        if now - started >= max_seconds:
+            return
+        await asyncio.sleep(poll_seconds)
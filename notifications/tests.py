@@ -0,0 +1,220 @@
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.db import models
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users.models import User
+from notifications.models import (
+    Announcement, AnnouncementAudience, AnnouncementReceipt, EmailOutbox, Notification, UnreadCounter, parse_target_roles,
+)
+from notifications.outbox import _claim, queue_email, queue_emails, send_pending
+from notifications.stream import EventStream
+from notifications.unread import unread_summary
+
+
+class AnnouncementAudienceTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='ann_admin', password='pass', role='admin')
+        self.student = User.objects.create_user(username='ann_student', password='pass', role='student')
+        self.parent = User.objects.create_user(username='ann_parent', password='pass', role='parent')
+
+    def _announce(self, target_roles, **extra):
+        return Announcement.objects.create(title='Notice', content='Body', created_by=self.admin, target_roles=target_roles, **extra)
+
+    def test_parse_legacy_formats(self):
+        self.assertEqual(parse_target_roles(['student', 'parent']), ['student', 'parent'])
+        self.assertEqual(parse_target_roles('["student"]'), ['student'])
+        self.assertEqual(parse_target_roles('student, parent'), ['student', 'parent'])
+        self.assertEqual(parse_target_roles(None), [])
+
+    def test_posting_writes_audience_rows_not_per_user_rows(self):
+        everyone = self._announce([])
+        students = self._announce(['student'])
+        self.assertEqual(list(everyone.audience.values_list('role', flat=True)), ['all'])
+        self.assertEqual(AnnouncementAudience.objects.count(), 2)
+
+        students.target_roles = ['parent']
+        students.save()
+        self.assertEqual(list(students.audience.values_list('role', flat=True)), ['parent'])
+
+    def test_unread_counts_follow_receipts(self):
+        everyone = self._announce([])
+        self._announce(['student'])
+        self._announce(['student'], is_active=False)
+        self.assertEqual(Announcement.objects.unread_by(self.student).count(), 2)
+        self.assertEqual(Announcement.objects.unread_by(self.parent).count(), 1)
+
+        AnnouncementReceipt.mark_read(self.parent, [everyone])
+        AnnouncementReceipt.mark_read(self.parent, [everyone])
+        self.assertEqual(Announcement.objects.unread_by(self.parent).count(), 0)
+        self.assertEqual(Announcement.objects.unread_by(self.student).count(), 2)
+
+        self.client.force_login(self.student)
+        self.assertContains(self.client.get(reverse('student_dashboard')), 'id="announcementsBadge">2</span>')
+
+    def test_visible_to_filters_before_slicing(self):
+        for idx in range(6):
+            self._announce(['parent'])
+        legacy = self._announce('["student"]')
+        self._announce('student, teacher')
+        self.assertEqual(legacy.target_roles, ['student'])
+        self.assertEqual(legacy.audience.get().role, 'student')
+
+        recent = list(Announcement.objects.visible_to('student')[:5])
+        self.assertEqual(len(recent), 2)
+        self.assertEqual(Announcement.objects.visible_to('parent').count(), 6)
+        self.assertEqual(parse_target_roles(['all', 'student']), [])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+class EmailOutboxTests(TestCase):
+    def test_queued_mail_is_sent_by_the_worker(self):
+        queue_email('Hello', 'Body', ['a@example.com'], html_body='<p>Body</p>')
+        queued = queue_emails({'subject': 'Bulk', 'body': 'x', 'to': [address]} for address in ['b@example.com', ''])
+        self.assertEqual(queued, 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_pending(), (2, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 2)
+        self.assertEqual(send_pending(), (0, 0))
+
+    def test_failures_back_off_then_give_up(self):
+        message = queue_email('Hello', 'Body', ['a@example.com'])
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('smtp down')):
+            self.assertEqual(send_pending(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ('pending', 1))
+            self.assertIn('smtp down', message.last_error)
+            # not due yet
+            self.assertEqual(send_pending(), (0, 0))
+
+            EmailOutbox.objects.update(next_attempt_at=message.created_at)
+            send_pending()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 2))
+
+    def test_messages_left_sending_by_a_dead_worker_are_sent_again(self):
+        message = queue_email('Hello', 'Body', ['a@example.com'])
+        # claimed, then the worker died
+        self.assertEqual([m.pk for m in _claim(10)], [message.pk])
+        self.assertEqual(send_pending(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=message.created_at)
+        self.assertEqual(send_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_two_workers_reading_the_same_messages_send_each_once(self):
+        queue_emails({'subject': 'Hi', 'body': 'Body', 'to': [f'{n}@example.com']} for n in range(2))
+        ids = list(EmailOutbox.objects.values_list('id', flat=True))
+        # both workers read the due ids before either one claimed them
+        with mock.patch('notifications.outbox._due_ids', return_value=ids):
+            self.assertEqual([m.pk for m in _claim(10)], ids)
+            self.assertEqual(send_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='unread_student', password='pass', role='student')
+        self.other = User.objects.create_user(username='unread_other', password='pass', role='student')
+
+    def _count(self, user):
+        return UnreadCounter.objects.get(user=user).unread
+
+    def test_counter_follows_saves_deletes_and_bulk_writes(self):
+        first = Notification.objects.create(user=self.user, title='One', message='m')
+        Notification.objects.bulk_create([
+            Notification(user=self.user, title='Two', message='m'),
+            Notification(user=self.other, title='Three', message='m'),
+            Notification(user=self.other, title='Read', message='m', is_read=True),
+        ])
+        self.assertEqual((self._count(self.user), self._count(self.other)), (2, 1))
+
+        first.is_read = True
+        first.save()
+        self.assertEqual(self._count(self.user), 1)
+        Notification.objects.get(title='Two').delete()
+        self.assertEqual(self._count(self.user), 0)
+
+        Notification.objects.filter(user=self.other).update(is_read=False)
+        self.assertEqual(self._count(self.other), 2)
+        Notification.objects.filter(user=self.other).mark_read()
+        self.assertEqual(self._count(self.other), 0)
+
+    def test_summary_reads_the_counter_and_latest_notifications(self):
+        Notification.objects.create(user=self.user, title='One', message='m')
+        with self.assertNumQueries(2):
+            summary = unread_summary(self.user)
+        self.assertEqual(summary['count'], 1)
+        self.assertEqual([n.title for n in summary['latest']], ['One'])
+
+        Notification.objects.create(user=self.user, title='Two', message='m')
+        summary = unread_summary(self.user)
+        self.assertEqual((summary['count'], [n.title for n in summary['latest']]), (2, ['Two', 'One']))
+
+    def test_polling_endpoint_reads_the_counter(self):
+        Notification.objects.create(user=self.user, title='One', message='m')
+        self.client.force_login(self.user)
+        # session and user lookups, then the counter row and the latest notifications
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('get_notifications_ajax'))
+        data = response.json()
+        self.assertEqual((data['unread_count'], data['notifications'][0]['title']), (1, 'One'))
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='stream_student', password='pass', role='student')
+        self.admin = User.objects.create_user(username='stream_admin', password='pass', role='admin')
+
+    def test_idle_polls_send_nothing_and_changes_are_pushed(self):
+        stream = EventStream(self.user)
+        first = stream.poll(now=0)
+        self.assertEqual([m.split('\n')[0] for m in first], ['event: notifications', 'event: announcements'])
+        with self.assertNumQueries(0):
+            self.assertEqual(stream.poll(now=1), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, title='Grade posted', message='m')
+        messages = stream.poll(now=2)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('Grade posted', messages[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Sports day', content='c', created_by=self.admin, target_roles=['student'])
+        messages = stream.poll(now=3)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('Sports day', messages[0])
+
+    def test_database_check_repairs_a_counter_the_hooks_missed(self):
+        Notification.objects.create(user=self.user, title='One', message='m')
+        stream = EventStream(self.user)
+        stream.poll(now=0)
+        # a write that bypasses the counter hooks (and so the version)
+        models.QuerySet(Notification).filter(user=self.user).update(is_read=True)
+        self.assertEqual(stream.poll(now=1), [])
+        messages = stream.poll(now=60)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('"unread_count": 0', messages[0])
+
+    def test_wsgi_requests_get_no_content(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notification_stream'))
+        self.assertEqual(response.status_code, 204)
+        self.assertNotContains(self.client.get(reverse('student_dashboard')), 'setInterval')
+
+    @override_settings(SSE_MAX_SECONDS=0, SSE_WSGI_STREAMING=True)
+    def test_stream_view(self):
+        self.assertEqual(self.client.get(reverse('notification_stream')).status_code, 204)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notification_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: notifications', body)
@@ -0,0 +1,84 @@
+"""Per-user unread notification count and latest unread notifications.
+
+``UnreadCounter`` holds the count; signals (single saves/deletes) and the
+``NotificationQuerySet`` bulk hooks adjust it. ``unread_summary`` reads the
+counter row and the newest unread notifications straight from the database --
+two indexed queries instead of a count over the whole table -- so every web
+worker and queue process sees the same numbers without a shared cache.
+
+The hooks also replace a per-user version in the cache once their transaction
+commits. Notification streams poll ``unread_version`` and only read the
+summary when it moved; with a per-process cache a stream still finds writes
+from other processes at its periodic database check.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Notification, UnreadCounter
+
+LATEST_COUNT = 10
+UNREAD_VERSION_KEY = 'notifications:unread:{}:version'
+
+
+def unread_version(user_id):
+    """Token that changes whenever ``user_id``'s counter is written (None before the first write)."""
+    return cache.get(UNREAD_VERSION_KEY.format(user_id))
+
+
+def _touch(user_ids):
+    if not user_ids:
+        return
+    keys = {UNREAD_VERSION_KEY.format(user_id): uuid.uuid4().hex for user_id in user_ids}
+    transaction.on_commit(lambda: cache.set_many(keys, None))
+
+
+def recount_unread(*user_ids):
+    """Recompute the counters of ``user_ids`` from the notifications; returns {user_id: count}."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values_list('user_id').annotate(n=Count('id')).order_by()
+    )
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=user_id, unread=count) for user_id, count in counts.items()],
+        update_conflicts=True, unique_fields=['user'], update_fields=['unread'],
+    )
+    _touch(user_ids)
+    return counts
+
+
+def adjust_unread(deltas):
+    """Apply {user_id: change} to the counters.
+
+    A user without a counter row is recounted instead -- but only when the
+    count grows, so deleting a user's notifications (e.g. while the user
+    itself is being deleted) never creates a row.
+    """
+    missing = []
+    updated = []
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        if UnreadCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta):
+            updated.append(user_id)
+        elif delta > 0:
+            missing.append(user_id)
+    _touch(updated)
+    recount_unread(*missing)
+
+
+def unread_summary(user):
+    """{'count': unread notifications, 'latest': up to LATEST_COUNT newest unread}."""
+    if not getattr(user, 'is_authenticated', False):
+        return {'count': 0, 'latest': []}
+    count = UnreadCounter.objects.filter(user_id=user.pk).values_list('unread', flat=True).first()
+    if count is None:
+        count = recount_unread(user.pk)[user.pk]
+    latest = list(Notification.objects.filter(user_id=user.pk, is_read=False).order_by('-created_at', '-id')[:LATEST_COUNT])
+    return {'count': count, 'latest': latest}
@@ -1,8 +1,10 @@
 # In your urls.py
 from django.urls import path
-from .views import student_announcements_api
+from .views import mark_announcement_read, notification_stream, student_announcements_api
 
 urlpatterns = [
     path('api/students/announcements/', student_announcements_api, name='student_announcements_api'),
     path('api/announcements/', student_announcements_api, name='student_announcements_api'),
+    path('api/announcements/<int:announcement_id>/read/', mark_announcement_read, name='mark_announcement_read'),
+    path('stream/', notification_stream, name='notification_stream'),
 ]
\ No newline at end of file
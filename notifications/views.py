@@ -1,49 +1,39 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from notifications.models import Announcement
+from notifications.models import Announcement, AnnouncementReceipt
 from django.utils import timezone
 from django.shortcuts import render
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .stream import aevent_stream, event_stream
+
+ANNOUNCEMENTS_PER_PAGE = 20
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def student_announcements_api(request):
     """API endpoint for student announcements - returns real data from database"""
     try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter announcements relevant to the user's role
-        relevant_announcements = []
-        user_role = request.user.role
-        
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets this user's role or is for everyone
-            if not target_roles or len(target_roles) == 0 or user_role in target_roles:
-                relevant_announcements.append({
-                    "id": announcement.id,
-                    "title": announcement.title,
-                    "content": announcement.content,
-                    "created_at": announcement.created_at.isoformat(),
-                    "is_important": False  # You can add a priority field to Announcement model if needed
-                })
+        page = Paginator(Announcement.objects.visible_to(request.user.role), ANNOUNCEMENTS_PER_PAGE).get_page(request.GET.get('page'))
+        relevant_announcements = [{
+            "id": announcement.id,
+            "title": announcement.title,
+            "content": announcement.content,
+            "created_at": announcement.created_at.isoformat(),
+            "is_important": False  # You can add a priority field to Announcement model if needed
+        } for announcement in page]
         
         return Response({
             "announcements": relevant_announcements,
-            "count": len(relevant_announcements),
+            "count": page.paginator.count,
+            "page": page.number,
+            "num_pages": page.paginator.num_pages,
+            "unread_count": Announcement.objects.unread_by(request.user).count(),
             "last_updated": timezone.now().isoformat()
         })
     except Exception as e:
@@ -55,42 +45,46 @@ def student_announcements_api(request):
             "error": str(e)
         }, status=500)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_announcement_read(request, announcement_id):
+    """Record a read receipt for one announcement and return the new unread count"""
+    if Announcement.objects.filter(pk=announcement_id).targeting(request.user.role).exists():
+        AnnouncementReceipt.mark_read(request.user, [announcement_id])
+    return Response({
+        "unread_count": Announcement.objects.unread_by(request.user).count(),
+    })
+
 @login_required
 def student_announcements(request):
     """Render the student announcements page"""
-    from notifications.models import Announcement
-    
-    try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter announcements relevant to the user's role
-        relevant_announcements = []
-        user_role = request.user.role
-        
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets this user's role or is for everyone
-            if not target_roles or len(target_roles) == 0 or user_role in target_roles:
-                relevant_announcements.append(announcement)
-                
-    except Exception as e:
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        print(f"Error filtering announcements: {e}")
+    relevant_announcements = Paginator(
+        Announcement.objects.visible_to(request.user.role), ANNOUNCEMENTS_PER_PAGE,
+    ).get_page(request.GET.get('page'))
     
+    # Opening the page reads everything on it
+    AnnouncementReceipt.mark_read(request.user, relevant_announcements)
     context = {
         'page_title': 'School Announcements',
         'announcements': relevant_announcements,
     }
     return render(request, 'students/announcements.html', context)
+
+
+def notification_stream(request):
+    """Server-Sent Events feed of the dashboard's notifications and
+    announcements (see ``notifications.stream``).
+
+    Under WSGI a stream would hold a worker thread for minutes, so it is only
+    served there with ``SSE_WSGI_STREAMING``; otherwise the 204 stops the
+    dashboard's EventSource and its refresh buttons remain.
+    """
+    is_asgi = isinstance(request, ASGIRequest)
+    if not request.user.is_authenticated or not (is_asgi or getattr(settings, 'SSE_WSGI_STREAMING', False)):
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    stream = aevent_stream(request.user) if is_asgi else event_stream(request.user)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
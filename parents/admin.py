@@ -1,7 +1,7 @@
 from django.contrib import admin, messages
 from .models import ChildLinkRequest
 from users.models import StudentParent, User
-from students.models import Student
+from students.lookup import resolve_student
 from django.utils.html import format_html
 from django.urls import reverse
 from django.core.mail import send_mail
@@ -21,11 +21,7 @@ class ChildLinkRequestAdmin(admin.ModelAdmin):
         if not identifier:
             return '-'
 
-        student = Student.objects.filter(student_id__iexact=identifier).first()
-        if not student:
-            student = Student.objects.filter(user__email__iexact=identifier).first()
-        if not student:
-            student = Student.objects.filter(user__username__iexact=identifier).first()
+        student = getattr(resolve_student(identifier), 'student_profile', None)
 
         if student:
             url = reverse('admin:students_student_change', args=[student.id])
@@ -41,11 +37,7 @@ class ChildLinkRequestAdmin(admin.ModelAdmin):
             student = None
             identifier = req_obj.child_identifier.strip()
             try:
-                student = Student.objects.filter(student_id__iexact=identifier).first()
-                if not student:
-                    student = Student.objects.filter(user__email__iexact=identifier).first()
-                if not student:
-                    student = Student.objects.filter(user__username__iexact=identifier).first()
+                student = getattr(resolve_student(identifier), 'student_profile', None)
             except Exception:
                 student = None
 
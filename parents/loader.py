@@ -0,0 +1,119 @@
+"""Batched data loading for the parent portal.
+
+``ParentPortalLoader`` loads what the portal pages show about a parent's
+children one kind at a time for all children together -- the links with their
+student profiles, the enrollments with subjects and instructors (a
+``Prefetch``), the grades, the payment status counts (one conditional
+aggregate), the fee balances and the class standings -- so a page costs the same handful of
+queries however many children are linked. Each part is loaded on first use.
+"""
+from collections import defaultdict
+from functools import cached_property
+
+from django.db.models import Count, Prefetch, Q
+from django.db.utils import OperationalError
+
+from payments.models import Payment, StudentBalance
+from ranks.models import ClassStanding, Grade
+from subjects.models import Enrollment
+from users.models import StudentParent
+
+RECENT_GRADES = 5
+
+
+class ParentPortalLoader:
+    def __init__(self, parent):
+        self.parent = parent
+
+    @cached_property
+    def links(self):
+        """The parent's StudentParent links; each student carries its
+        enrollments (newest first) as ``portal_enrollments``."""
+        enrollments = Enrollment.objects.select_related('subject__instructor__user').order_by(
+            '-academic_year', '-semester', '-enrolled_date',
+        )
+        return list(
+            StudentParent.objects.filter(parent=self.parent)
+            .select_related('student', 'student__studentprofile')
+            .prefetch_related(Prefetch('student__subject_enrollments', queryset=enrollments, to_attr='portal_enrollments'))
+            .order_by('id')
+        )
+
+    @cached_property
+    def children(self):
+        """{student_id: student} as loaded with the links."""
+        return {link.student_id: link.student for link in self.links}
+
+    @cached_property
+    def child_ids(self):
+        return list(self.children)
+
+    @cached_property
+    def grades(self):
+        """{student_id: [Grade, ...]} newest first, with subjects loaded."""
+        grades = defaultdict(list)
+        if not self.child_ids:
+            return grades
+        try:
+            for grade in (
+                Grade.objects.filter(student_id__in=self.child_ids)
+                .select_related('subject').order_by('student_id', '-graded_at', '-id')
+            ):
+                grades[grade.student_id].append(grade)
+        except OperationalError:
+            pass
+        return grades
+
+    def recent_grades(self, child):
+        return self.grades[child.id][:RECENT_GRADES]
+
+    @cached_property
+    def payment_counts(self):
+        """{student_id: {'total', 'pending', 'completed'}} from one query."""
+        rows = (
+            Payment.objects.filter(student_id__in=self.child_ids)
+            .values('student_id')
+            .annotate(
+                total=Count('id'),
+                pending=Count('id', filter=Q(status='pending')),
+                completed=Count('id', filter=Q(status='completed')),
+            )
+            .order_by()
+        )
+        counts = defaultdict(lambda: {'total': 0, 'pending': 0, 'completed': 0})
+        for row in rows:
+            counts[row.pop('student_id')] = row
+        return counts
+
+    @cached_property
+    def balances(self):
+        """{student_id: StudentBalance}; children with nothing posted get an empty one."""
+        found = {balance.student_id: balance for balance in StudentBalance.objects.filter(student_id__in=self.child_ids)}
+        return {student_id: found.get(student_id) or StudentBalance(student_id=student_id) for student_id in self.child_ids}
+
+    @cached_property
+    def standings(self):
+        """{student_id: latest ClassStanding} (see ``ranks.standings.current_standing``)."""
+        latest = {}
+        for standing in ClassStanding.objects.filter(student_id__in=self.child_ids).order_by('-academic_year', '-semester'):
+            latest.setdefault(standing.student_id, standing)
+        return latest
+
+    def enrollments(self, child, status=None):
+        """The child's enrollments (optionally only those with ``status``), newest first."""
+        loaded = self.children[child.id].portal_enrollments
+        return [e for e in loaded if status is None or e.status == status]
+
+    def instructors(self, child):
+        """Teacher users of the child's approved enrollments, without repeats."""
+        teachers = {}
+        for enrollment in self.enrollments(child, 'approved'):
+            instructor = enrollment.subject.instructor
+            user = getattr(instructor, 'user', None) if instructor is not None else None
+            if user is not None:
+                teachers.setdefault(user.id, user)
+        return list(teachers.values())
+
+    def scores(self, child):
+        """{subject_id: score} as ``compute_numeric_scores`` expects it."""
+        return {grade.subject_id: grade.score for grade in self.grades[child.id]}
@@ -5,6 +5,7 @@ from students.models import Student
 from parents.models import ChildLinkRequest
 from django.core import mail
 from django.test import override_settings
+from notifications.outbox import send_pending
 
 
 class ChildLinkRequestTests(TestCase):
@@ -83,6 +84,10 @@ class ChildLinkRequestTests(TestCase):
         # should redirect
         self.assertEqual(resp.status_code, 302)
 
+        # The view only queues the mail; deliver it like the outbox worker would
+        self.assertEqual(len(mail.outbox), 0)
+        send_pending()
+
         # One email to parent (auto-approve) and one to staff admins (fallback)
         # Order may vary; check recipients
         recipients = []
@@ -101,3 +106,139 @@ class ChildLinkRequestTests(TestCase):
         # after redirect, an email should be in outbox
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('This is a test.', mail.outbox[0].body)
+
+
+class ParentPortalLoaderTests(TestCase):
+    def setUp(self):
+        from payments.models import FeeStructure
+        from subjects.models import Subject, Teacher
+
+        self.parent = User.objects.create_user(username='portal_parent', password='pass', role='parent')
+        teacher_user = User.objects.create_user(username='portal_teacher', password='pass', role='teacher', first_name='Tea')
+        teacher = Teacher.objects.create(user=teacher_user, teacher_id='T-PORTAL', department='Maths')
+        self.subject = Subject.objects.create(name='Maths', code='MTH3', grade_level=3, instructor=teacher)
+        self.fee = FeeStructure.objects.create(name='Tuition', amount='100.00', description='t', created_by=self.parent)
+        self.client.force_login(self.parent)
+
+    def _add_child(self, idx):
+        from payments.models import Payment
+        from ranks.models import Grade
+        from subjects.models import Enrollment
+        from users.models import StudentProfile
+
+        child = User.objects.create_user(username=f'portal_child{idx}', password='pass', role='student')
+        StudentProfile.objects.create(user=child, student_id=f'P{idx:04d}', grade_level=3)
+        StudentParent.objects.create(parent=self.parent, student=child)
+        Enrollment.objects.create(student=child, subject=self.subject, academic_year='2024-2025', semester='first', status='approved')
+        Grade.objects.create(student=child, subject=self.subject, score=70 + idx)
+        Payment.objects.create(student=child, fee_structure=self.fee, amount_paid='100.00', payment_method='card',
+                               transaction_id=f'portal-{idx}', status='pending')
+        Payment.objects.create(student=child, fee_structure=self.fee, amount_paid='100.00', payment_method='card',
+                               transaction_id=f'portal-{idx}-done', status='completed')
+        return child
+
+    def _queries(self, url_name):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_loader_batches_every_child(self):
+        from parents.loader import ParentPortalLoader
+
+        children = [self._add_child(idx) for idx in range(3)]
+        portal = ParentPortalLoader(self.parent)
+        with self.assertNumQueries(5):
+            self.assertEqual([link.student for link in portal.links], children)
+            self.assertEqual([g.score for g in portal.recent_grades(children[2])], [72])
+            self.assertEqual(portal.payment_counts[children[0].id], {'total': 2, 'pending': 1, 'completed': 1})
+            self.assertEqual([u.username for u in portal.instructors(children[1])], ['portal_teacher'])
+            self.assertEqual(portal.standings[children[2].id].rank, 1)
+
+    def test_enrollments_come_newest_term_first(self):
+        from parents.loader import ParentPortalLoader
+        from subjects.models import Enrollment
+
+        child = self._add_child(0)
+        # enrolled later, but for an older term
+        Enrollment.objects.create(student=child, subject=self.subject, academic_year='2023-2024', semester='second', status='approved')
+        Enrollment.objects.create(student=child, subject=self.subject, academic_year='2024-2025', semester='second', status='approved')
+        terms = [(e.academic_year, e.semester) for e in ParentPortalLoader(self.parent).enrollments(child)]
+        self.assertEqual(terms, [('2024-2025', 'second'), ('2024-2025', 'first'), ('2023-2024', 'second')])
+
+    def test_portal_pages_cost_the_same_for_more_children(self):
+        pages = ['parent_dashboard', 'parent_fees_summary', 'parent_progress_overview', 'parent_contact_teachers_overview']
+        self._add_child(0)
+        single = {page: self._queries(page)[0] for page in pages}
+        for idx in range(1, 4):
+            self._add_child(idx)
+        for page in pages:
+            self.assertEqual(self._queries(page)[0], single[page], page)
+
+
+class StudentIdentityLookupTests(TestCase):
+    def setUp(self):
+        from users.models import StudentProfile
+        self.record_user = User.objects.create_user(username='Kid.One', password='pass', role='student', email='Kid.One@Example.com')
+        self.record = Student.objects.create(user=self.record_user, student_id='STU2001')
+        self.account_user = User.objects.create_user(username='kidtwo', password='pass', role='student', email='kidtwo@example.com')
+        self.profile = StudentProfile.objects.create(user=self.account_user, student_id='SP-77', grade_level=3)
+
+    def test_identifiers_resolve_case_insensitively_in_one_query(self):
+        from students.lookup import resolve_students
+        identifiers = ['stu2001', ' KID.ONE@example.COM ', 'kid.one', 'sp-77', 'KIDTWO', 'missing']
+        with self.assertNumQueries(1):
+            found = resolve_students(identifiers)
+            self.assertEqual(found[' KID.ONE@example.COM '].student_profile, self.record)
+            self.assertEqual(found['sp-77'].studentprofile, self.profile)
+        self.assertEqual({k: u.id for k, u in found.items()}, {
+            'stu2001': self.record_user.id,
+            ' KID.ONE@example.COM ': self.record_user.id,
+            'kid.one': self.record_user.id,
+            'sp-77': self.account_user.id,
+            'KIDTWO': self.account_user.id,
+        })
+
+    def test_student_record_wins_over_another_account(self):
+        from students.lookup import resolve_student
+        # another student's username equals this record's student ID
+        User.objects.create_user(username='stu2001', password='pass', role='student')
+        self.assertEqual(resolve_student('STU2001'), self.record_user)
+
+    def test_keys_follow_changes_and_deletes(self):
+        from students.lookup import resolve_student
+        self.account_user.email = 'new@example.com'
+        self.account_user.save()
+        self.assertIsNone(resolve_student('kidtwo@example.com'))
+        self.assertEqual(resolve_student('NEW@example.com'), self.account_user)
+
+        self.profile.delete()
+        self.assertIsNone(resolve_student('SP-77'))
+        self.record_user.delete()
+        self.assertIsNone(resolve_student('STU2001'))
+
+    def test_kinds_keep_student_ids_apart_from_usernames(self):
+        from students.lookup import resolve_student, resolve_students
+        # a Student record whose username is another student's profile ID
+        impostor = User.objects.create_user(username='sp-77', password='pass', role='student')
+        Student.objects.create(user=impostor, student_id='STU2002')
+        self.assertEqual(resolve_student('SP-77'), impostor)
+        self.assertEqual(resolve_students(['SP-77'], kinds=['student_id']), {'SP-77': self.account_user})
+        self.assertIsNone(resolve_student('kidtwo', kinds=['student_id']))
+
+    def test_students_only_skips_other_roles(self):
+        from students.lookup import resolve_student
+        teacher = User.objects.create_user(username='teach', password='pass', role='teacher')
+        Student.objects.create(user=teacher, student_id='ODD1')
+        self.assertEqual(resolve_student('odd1'), teacher)
+        self.assertIsNone(resolve_student('odd1', students_only=True))
+
+    def test_link_request_form_matches_profile_students(self):
+        from parents.views import ChildLinkRequestForm
+        form = ChildLinkRequestForm({'child_identifier': 'sp-77', 'relationship': 'Father', 'message': ''})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form._matched_student_user, self.account_user)
+        self.assertEqual(form._matched_student.student_id, 'SP-77')
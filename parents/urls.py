@@ -12,6 +12,7 @@ urlpatterns = [
     path('child/<int:student_id>/ranks/', views.child_ranks, name='child_ranks'),
     path('child/<int:student_id>/attendance/', views.child_attendance, name='child_attendance'),
     path('child/<int:student_id>/schedule/', views.child_schedule, name='child_schedule'),
+    path('child/<int:student_id>/schedule/export/<str:fmt>/', views.child_schedule_export, name='child_schedule_export'),
     path('child/<int:student_id>/fees/', views.child_fees, name='child_fees'),
     path('child/<int:student_id>/teachers/', views.contact_teachers, name='contact_teachers'),
     path('child/<int:student_id>/meeting/<int:teacher_id>/', views.request_meeting, name='request_meeting'),
@@ -1,20 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import F, Q
+from django.core.paginator import Paginator
 from django import forms
 from django.core.mail import send_mail
 from django.conf import settings
-from students.models import Student
+from students.lookup import resolve_student
 from users.decorators import parent_required
 from users.models import User, StudentParent
-from subjects.models import Subject, Enrollment
+from subjects.models import AttendanceLog, Subject, Enrollment
+from subjects.attendance import TermAttendance
+from subjects.timetable import export_response, student_timetable
 from ranks.models import Grade
 from django.db.utils import OperationalError
-from payments.models import Payment
-from notifications.models import Announcement
+from payments.models import Invoice, LedgerEntry, Payment
+from payments.ledger import balance_for
+from notifications.models import Announcement, AnnouncementReceipt
+from notifications.views import ANNOUNCEMENTS_PER_PAGE
+from notifications.outbox import queue_email
 from django.utils import timezone
+from .loader import ParentPortalLoader
 from .models import ChildLinkRequest
 
+STATEMENT_ENTRIES = 20
+
 
 # Simple form class for requesting a child link
 class ChildLinkRequestForm(forms.ModelForm):
@@ -32,55 +41,32 @@ class ChildLinkRequestForm(forms.ModelForm):
             raise forms.ValidationError('Please provide a student identifier (ID, email or username).')
 
         student = None
-        student_user = None
-
-        # Try to match using Student model first
-        student = Student.objects.filter(student_id__iexact=identifier).first()
-        if not student:
-            student = Student.objects.filter(user__email__iexact=identifier).first()
-        if not student:
-            student = Student.objects.filter(user__username__iexact=identifier).first()
-        
-        # If not found in Student model, try User with studentprofile
-        if not student:
-            from users.models import User, StudentProfile
-            # Try by studentprofile.student_id
-            try:
-                student_profile = StudentProfile.objects.filter(student_id__iexact=identifier).first()
-                if student_profile:
-                    student_user = student_profile.user
-            except:
-                pass
-            
-            # Try by email
-            if not student_user:
-                student_user = User.objects.filter(role='student', email__iexact=identifier).first()
-            
-            # Try by username
-            if not student_user:
-                student_user = User.objects.filter(role='student', username__iexact=identifier).first()
-            
-            # If identifier looks like an email and we didn't find an exact match, try fuzzy search
-            if not student_user and '@' in identifier:
-                normalized = identifier.strip().lower()
-                candidates = User.objects.filter(role='student', email__icontains=normalized)
-                count = candidates.count()
-                if count == 1:
-                    student_user = candidates.first()
-                elif count > 1:
-                    examples = []
-                    for c in candidates[:5]:
-                        name = c.get_full_name() or c.username
-                        try:
-                            sid = c.studentprofile.student_id if hasattr(c, 'studentprofile') else 'N/A'
-                        except:
-                            sid = 'N/A'
-                        examples.append(f"{name} ({sid})")
-                    more = '...' if count > 5 else ''
-                    raise forms.ValidationError(
-                        'Multiple students match that email. Please enter the student ID to be specific. ' \
-                        f'Possible matches: {", ".join(examples)}{more}'
-                    )
+        # One indexed lookup over both student models (ID, email or username)
+        student_user = resolve_student(identifier)
+        if student_user is not None:
+            student = getattr(student_user, 'student_profile', None)
+
+        # If identifier looks like an email and we didn't find an exact match, try fuzzy search
+        if not student_user and '@' in identifier:
+            normalized = identifier.strip().lower()
+            candidates = User.objects.filter(role='student', email__icontains=normalized)
+            count = candidates.count()
+            if count == 1:
+                student_user = candidates.first()
+            elif count > 1:
+                examples = []
+                for c in candidates[:5]:
+                    name = c.get_full_name() or c.username
+                    try:
+                        sid = c.studentprofile.student_id if hasattr(c, 'studentprofile') else 'N/A'
+                    except:
+                        sid = 'N/A'
+                    examples.append(f"{name} ({sid})")
+                more = '...' if count > 5 else ''
+                raise forms.ValidationError(
+                    'Multiple students match that email. Please enter the student ID to be specific. ' \
+                    f'Possible matches: {", ".join(examples)}{more}'
+                )
         
         # If we found a student_user but not a Student model, create a wrapper
         if student_user and not student:
@@ -143,43 +129,23 @@ def message_teacher(request, teacher_id):
 @parent_required
 def parent_dashboard(request):
     """Parent dashboard showing their children's overview"""
-    # Get all children linked to this parent
-    children = StudentParent.objects.filter(parent=request.user).select_related('student')
-    
+    # Every child's grades, courses and fees are loaded together
+    portal = ParentPortalLoader(request.user)
     children_data = []
-    for child_link in children:
+    for child_link in portal.links:
         child = child_link.student
-        # Get child's recent grades
-        try:
-            recent_grades = Grade.objects.filter(student=child).select_related('subject')[:5]
-        except OperationalError:
-            recent_grades = []
-        # Get child's current courses
-        current_courses = Enrollment.objects.filter(
-            student=child, 
-            status='approved'
-        ).select_related('subject')
-        # Get pending fees
-        pending_fees = Payment.objects.filter(student=child, status='pending')
-        
         children_data.append({
             'student': child,
             'relationship': child_link.relationship,
-            'recent_grades': recent_grades,
-            'current_courses': current_courses.count(),
-            'pending_fees': pending_fees.count(),
+            'recent_grades': portal.recent_grades(child),
+            'current_courses': len(portal.enrollments(child, 'approved')),
+            'pending_fees': portal.payment_counts[child.id]['pending'],
         })
     
-    # Get unread notifications for the parent
-    from notifications.models import Notification
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    
+    # unread_notifications / unread_count come from the notifications context processor
     context = {
         'children_data': children_data,
-        'total_children': children.count(),
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
+        'total_children': len(portal.links),
     }
     return render(request, 'parents/parent_dashboard.html', context)
 
@@ -246,29 +212,21 @@ def child_ranks(request, student_id):
     for g in grades_qs:
         subject_results.append({'subject': g.subject, 'score': g.score})
 
-    # Compute weighted average (numeric) using ranks.calculate_student_average
-    from ranks.models import calculate_student_average, rank_students_for_subject
-    avg = calculate_student_average(child)
-
-    # Compute class rank among students in same grade (if available)
+    # Average and class rank come from the materialized standing for the
+    # child's latest term, kept current by ranks.signals.
+    from ranks.standings import current_standing
+    avg = None
     class_rank = None
     try:
-        if hasattr(child, 'studentprofile') and child.studentprofile.grade_level:
-            grade_level = child.studentprofile.grade_level
-            peers = User.objects.filter(role='student', studentprofile__grade_level=grade_level)
-            peer_averages = []
-            for peer in peers:
-                peer_avg = calculate_student_average(peer)
-                if peer_avg is not None:
-                    peer_averages.append((peer.id, peer_avg))
-            # sort descending
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            for idx, (peer_id, pa) in enumerate(peer_averages, start=1):
-                if peer_id == child.id:
-                    class_rank = idx
-                    break
-    except Exception:
-        class_rank = None
+        standing = current_standing(child)
+    except OperationalError:
+        standing = None
+    if standing is not None:
+        avg = standing.average
+        class_rank = standing.rank
+    else:
+        from ranks.models import calculate_student_average
+        avg = calculate_student_average(child)
 
     context = {
         'child': child,
@@ -282,31 +240,28 @@ def child_ranks(request, student_id):
 @parent_required
 def child_schedule(request, student_id):
     """View specific child's schedule"""
-    child_link = get_object_or_404(StudentParent, parent=request.user, student_id=student_id)
+    child_link = get_object_or_404(StudentParent.objects.select_related('student'), parent=request.user, student_id=student_id)
     child = child_link.student
 
-    # Get enrolled courses
-    enrollments = Enrollment.objects.filter(
-        student=child,
-        status='approved'
-    ).select_related('subject__instructor__user')
-
-    # Placeholder schedule - integrate with your scheduling system
-    schedule_data = [
-        {'day': 'Monday', 'time': '09:00-10:30', 'course': 'Mathematics', 'room': 'Room 101'},
-        {'day': 'Monday', 'time': '11:00-12:30', 'course': 'Science', 'room': 'Lab A'},
-        {'day': 'Tuesday', 'time': '09:00-10:30', 'course': 'English', 'room': 'Room 102'},
-        {'day': 'Wednesday', 'time': '14:00-15:30', 'course': 'History', 'room': 'Room 103'},
-    ]
+    timetable = student_timetable(child, request.GET.get('academic_year'), request.GET.get('semester'))
 
     context = {
         'child': child,
         'relationship': child_link.relationship,
-        'enrollments': enrollments,
-        'schedule_data': schedule_data,
+        'timetable': timetable,
     }
     return render(request, 'parents/child_schedule.html', context)
 
+
+@parent_required
+def child_schedule_export(request, student_id, fmt):
+    """The child's timetable as JSON or an iCalendar file."""
+    child_link = get_object_or_404(StudentParent.objects.select_related('student'), parent=request.user, student_id=student_id)
+    child = child_link.student
+    timetable = student_timetable(child, request.GET.get('academic_year'), request.GET.get('semester'))
+    return export_response(timetable, fmt, child.get_full_name() or child.username)
+
+
 @parent_required
 def child_fees(request, student_id):
     """View and pay child's fees"""
@@ -327,44 +282,21 @@ def child_fees(request, student_id):
         'payments': payments,
         'pending_payments': payments.filter(status='pending'),
         'completed_payments': payments.filter(status='completed'),
+        'balance': balance_for(child),
+        'open_invoices': Invoice.objects.filter(student=child, settled__lt=F('amount')),
+        'statement': LedgerEntry.objects.filter(student=child).order_by('-posted_at', '-id')[:STATEMENT_ENTRIES],
     }
     return render(request, 'parents/child_fees.html', context)
 
 @parent_required
 def school_announcements(request):
     """View school announcements relevant to parents"""
-    # FIXED: Replace contains lookup with database-agnostic approach
-    try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter in Python instead of using contains lookup
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                # If it's stored as a string, try to parse it
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    # If parsing fails, treat as comma-separated
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets parents or is for everyone
-            # Empty list or no target_roles means show to all
-            if not target_roles or len(target_roles) == 0 or 'parent' in target_roles:
-                relevant_announcements.append(announcement)
-                
-    except Exception as e:
-        # Fallback: get all active announcements if there's an error
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        print(f"Error filtering announcements: {e}")
+    relevant_announcements = Paginator(
+        Announcement.objects.visible_to('parent'), ANNOUNCEMENTS_PER_PAGE,
+    ).get_page(request.GET.get('page'))
     
+    # Opening the page reads everything on it
+    AnnouncementReceipt.mark_read(request.user, relevant_announcements)
     context = {
         'announcements': relevant_announcements,
     }
@@ -426,18 +358,19 @@ def child_attendance(request, student_id):
     child_link = get_object_or_404(StudentParent, parent=request.user, student_id=student_id)
     child = child_link.student
 
-    # Placeholder attendance data - integrate with attendance app later
-    attendance_data = [
-        {'date': '2025-11-01', 'status': 'Present'},
-        {'date': '2025-11-02', 'status': 'Absent'},
-        {'date': '2025-11-03', 'status': 'Present'},
-        {'date': '2025-11-04', 'status': 'Late'},
-    ]
+    # one TermAttendance per enrollment, newest term first; counts come from the bitsets
+    logs = AttendanceLog.objects.filter(enrollment__student=child).select_related('enrollment__subject').order_by(
+        '-enrollment__academic_year', '-enrollment__semester', 'enrollment__subject__name',
+    )
+    attendance = []
+    for log in logs:
+        term = TermAttendance(log)
+        attendance.append({'enrollment': log.enrollment, 'recent': term.recent(), **term.summary()})
 
     context = {
         'child': child,
         'relationship': child_link.relationship,
-        'attendance_data': attendance_data,
+        'attendance': attendance,
     }
     return render(request, 'parents/child_attendance.html', context)
 
@@ -445,20 +378,19 @@ def child_attendance(request, student_id):
 @parent_required
 def parent_fees_summary(request):
     """Aggregate fee statements for all children of the parent"""
-    children_links = StudentParent.objects.filter(parent=request.user).select_related('student')
+    portal = ParentPortalLoader(request.user)
     summary = []
-    for link in children_links:
-        child = link.student
-        payments = Payment.objects.filter(student=child)
-        pending = payments.filter(status='pending').count()
-        completed = payments.filter(status='completed').count()
-        total = payments.count()
+    for link in portal.links:
+        counts = portal.payment_counts[link.student_id]
+        balance = portal.balances[link.student_id]
         summary.append({
-            'student': child,
+            'student': link.student,
             'relationship': link.relationship,
-            'pending': pending,
-            'completed': completed,
-            'total': total,
+            'balance': balance.balance,
+            'days_overdue': balance.days_overdue(),
+            'pending': counts['pending'],
+            'completed': counts['completed'],
+            'total': counts['total'],
         })
 
     context = {
@@ -470,18 +402,20 @@ def parent_fees_summary(request):
 @parent_required
 def parent_progress_overview(request):
     """Show progress overview (GPA/ranks) for all children"""
-    children_links = StudentParent.objects.filter(parent=request.user).select_related('student', 'student__studentprofile')
+    from users.views import compute_numeric_scores
+
+    portal = ParentPortalLoader(request.user)
     children_progress = []
     
-    for link in children_links:
+    for link in portal.links:
         child = link.student
         try:
-            # Get enrollments with results
-            enrollments = Enrollment.objects.filter(student=child).select_related('subject')
-            
-            # Calculate scores using the same method as students
-            from users.views import compute_numeric_scores
-            score_map, total_result, graded_count, average_result = compute_numeric_scores(child, enrollments)
+            # Calculate scores using the same method as students, from the
+            # grades the loader fetched for every child at once
+            enrollments = portal.enrollments(child)
+            score_map, total_result, graded_count, average_result = compute_numeric_scores(
+                child, enrollments, rank_scores=portal.scores(child),
+            )
             
             # Get subject results
             subject_results = []
@@ -495,31 +429,9 @@ def parent_progress_overview(request):
                         'semester': getattr(enrollment, 'get_semester_display', lambda: 'N/A')(),
                     })
             
-            # Calculate class rank
-            class_rank = None
-            try:
-                if hasattr(child, 'studentprofile') and child.studentprofile.grade_level:
-                    grade_level = child.studentprofile.grade_level
-                    peers = User.objects.filter(
-                        role='student',
-                        studentprofile__grade_level=grade_level
-                    )
-                    peer_data = []
-                    for peer in peers:
-                        peer_enrollments = Enrollment.objects.filter(student=peer)
-                        _, _, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                        if peer_avg is not None:
-                            peer_data.append({
-                                'student_id': peer.id,
-                                'average': peer_avg
-                            })
-                    peer_data.sort(key=lambda x: x['average'], reverse=True)
-                    for idx, peer in enumerate(peer_data, start=1):
-                        if peer['student_id'] == child.id:
-                            class_rank = idx
-                            break
-            except Exception:
-                pass
+            # Class rank is read from the materialized standings
+            standing = portal.standings.get(child.id)
+            class_rank = standing.rank if standing is not None else None
             
             children_progress.append({
                 'student': child,
@@ -553,18 +465,13 @@ def parent_progress_overview(request):
 @parent_required
 def parent_contact_teachers_overview(request):
     """List teachers across all children and provide contact links"""
-    children_links = StudentParent.objects.filter(parent=request.user).select_related('student')
+    portal = ParentPortalLoader(request.user)
     teacher_map = {}
-    for link in children_links:
+    for link in portal.links:
         child = link.student
-        enrollments = Enrollment.objects.filter(student=child, status='approved').select_related('subject__instructor__user')
-        for enrollment in enrollments:
-            instructor = getattr(enrollment.subject, 'instructor', None)
-            if instructor:
-                user = getattr(instructor, 'user', None)
-                if user:
-                    teacher_map.setdefault(user.id, {'user': user, 'children': set()})
-                    teacher_map[user.id]['children'].add(child)
+        for user in portal.instructors(child):
+            teacher_map.setdefault(user.id, {'user': user, 'children': set()})
+            teacher_map[user.id]['children'].add(child)
 
     # Convert sets to lists for template
     teachers = []
@@ -608,16 +515,11 @@ def request_child_link(request):
                     # notify the parent that the request was approved automatically
                     parent_email = req.parent.email
                     if parent_email:
-                        try:
-                            send_mail(
-                                'Your child link request was approved',
-                                f"Your request to link '{req.child_identifier}' to your account was automatically approved.",
-                                settings.DEFAULT_FROM_EMAIL,
-                                [parent_email],
-                                fail_silently=True,
-                            )
-                        except Exception:
-                            pass
+                        queue_email(
+                            'Your child link request was approved',
+                            f"Your request to link '{req.child_identifier}' to your account was automatically approved.",
+                            [parent_email],
+                        )
                 except Exception:
                     # If any error occurs, continue and still notify admins below
                     pass
@@ -641,10 +543,7 @@ def request_child_link(request):
                     f"Message: {req.message or '<none>'}\n"
                     f"Submitted at: {req.created_at if getattr(req, 'created_at', None) else 'just now'}\n"
                 )
-                try:
-                    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, admin_emails, fail_silently=True)
-                except Exception:
-                    pass
+                queue_email(subject, body, admin_emails)
 
             messages.success(request, 'Your request has been submitted. The administration will review it.')
             return redirect('parent_dashboard')
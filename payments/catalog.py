@@ -0,0 +1,10 @@
+"""Cached list of the active fee structures (see ``sims.catalog``)."""
+from sims.catalog import cached
+
+from .models import FeeStructure
+
+CATALOG = 'fees'
+
+
+def active_fee_structures():
+    return cached(CATALOG, 'active', lambda: list(FeeStructure.objects.filter(is_active=True).order_by('id')))
@@ -0,0 +1,200 @@
+"""Student fee ledger: invoices, postings and materialized balances.
+
+Every change to what a student owes is a ``LedgerEntry`` -- a charge from a
+``FeeStructure``, a completed ``Payment`` or an adjustment -- and is posted
+together with the student's ``StudentBalance`` row in one transaction, with
+the balance rows locked (``select_for_update``) so concurrent postings never
+lose an update. Reading a balance or how overdue a student is is then a
+single-row read instead of a sum over the history.
+
+Debits create an ``Invoice``. Credits settle open invoices, those of the paid
+fee structure first and then the oldest due, and ``StudentBalance.oldest_due``
+follows the oldest invoice still open. ``post`` takes any number of postings
+and costs the same handful of queries however many students they touch.
+
+Completed payments are posted, and reversed when they stop being completed or
+are deleted, by ``payments.signals``.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Invoice, LedgerEntry, StudentBalance
+
+ZERO = Decimal('0.00')
+
+Posting = namedtuple('Posting', 'student_id kind amount description fee_structure due_date payment')
+Posting.__new__.__defaults__ = (None, None, None)
+
+
+def _locked_balances(student_ids):
+    StudentBalance.objects.bulk_create(
+        [StudentBalance(student_id=student_id) for student_id in student_ids], ignore_conflicts=True,
+    )
+    return {
+        balance.student_id: balance
+        for balance in StudentBalance.objects.select_for_update().filter(student_id__in=student_ids)
+    }
+
+
+def _settle(invoices, amount, fee_structure_id=None):
+    """Apply a credit of ``amount`` to ``invoices``; returns the part left over."""
+    invoices.sort(key=lambda invoice: (invoice.fee_structure_id != fee_structure_id, invoice.due_date, invoice.id or 0))
+    for invoice in invoices:
+        if not amount:
+            break
+        applied = min(invoice.outstanding, amount)
+        if applied > 0:
+            invoice.settled += applied
+            invoice._changed = True
+            amount -= applied
+    return amount
+
+
+def post(postings):
+    """Post ``postings`` (a list of ``Posting``) in one transaction; returns the entries."""
+    postings = [posting._replace(amount=Decimal(posting.amount)) for posting in postings]
+    if not postings:
+        return []
+    now = timezone.now()
+    today = timezone.localdate(now)
+    with transaction.atomic():
+        balances = _locked_balances({posting.student_id for posting in postings})
+        crediting = {posting.student_id for posting in postings if posting.amount < 0}
+        open_invoices = defaultdict(list)
+        for invoice in Invoice.objects.select_for_update().filter(
+            student_id__in=crediting, settled__lt=F('amount'),
+        ):
+            open_invoices[invoice.student_id].append(invoice)
+
+        new_invoices = []
+        entries = []
+        for posting in postings:
+            balance = balances[posting.student_id]
+            amount = posting.amount
+            invoice = None
+            if amount > 0:
+                fee = posting.fee_structure
+                invoice = Invoice(
+                    student_id=posting.student_id, fee_structure=fee, description=posting.description,
+                    amount=amount, due_date=posting.due_date or today,
+                    # a credit balance (overpayment) pays for new charges straight away
+                    settled=min(max(-balance.balance, ZERO), amount),
+                )
+                new_invoices.append(invoice)
+                open_invoices[posting.student_id].append(invoice)
+                balance.total_charged += amount
+            else:
+                fee_id = posting.payment.fee_structure_id if posting.payment is not None else None
+                _settle(open_invoices[posting.student_id], -amount, fee_id)
+                if posting.kind == 'payment':
+                    balance.total_paid -= amount
+            balance.balance += amount
+            entries.append(LedgerEntry(
+                student_id=posting.student_id, kind=posting.kind, amount=amount, balance_after=balance.balance,
+                description=posting.description, invoice=invoice, payment=posting.payment,
+            ))
+
+        for student_id, balance in balances.items():
+            balance.updated_at = now
+            due = [invoice.due_date for invoice in open_invoices[student_id] if invoice.outstanding > 0]
+            if student_id in crediting:
+                # every open invoice of the student was loaded
+                balance.oldest_due = min(due, default=None)
+            elif due:
+                balance.oldest_due = min(due + ([balance.oldest_due] if balance.oldest_due else []))
+
+        settled = [
+            invoice for invoices in open_invoices.values() for invoice in invoices
+            if invoice.pk is not None and getattr(invoice, '_changed', False)
+        ]
+        Invoice.objects.bulk_create(new_invoices)
+        Invoice.objects.bulk_update(settled, ['settled'])
+        LedgerEntry.objects.bulk_create(entries)
+        StudentBalance.objects.bulk_update(
+            list(balances.values()), ['balance', 'total_charged', 'total_paid', 'oldest_due', 'updated_at'],
+        )
+    return entries
+
+
+def bill_fee(fee_structure, students, due_date=None):
+    """Charge ``fee_structure`` to each of ``students`` (users or ids) not yet
+    invoiced for it; returns the number of students charged."""
+    student_ids = {getattr(student, 'pk', student) for student in students}
+    billed = set(
+        Invoice.objects.filter(fee_structure=fee_structure, student_id__in=student_ids).values_list('student_id', flat=True)
+    )
+    postings = [
+        Posting(student_id, 'charge', fee_structure.amount, fee_structure.name, fee_structure, due_date)
+        for student_id in sorted(student_ids - billed)
+    ]
+    post(postings)
+    return len(postings)
+
+
+def record_payment(payment):
+    """Post a completed ``payment`` unless it already is on the ledger."""
+    if LedgerEntry.objects.filter(payment=payment).exists():
+        return None
+    return post([Posting(
+        payment.student_id, 'payment', -Decimal(payment.amount_paid), f'Payment {payment.transaction_id}', payment=payment,
+    )])[0]
+
+
+def reverse_payment(payment, deleted=False):
+    """Owe a payment again after it stopped being completed, or after a
+    completed payment was ``deleted`` (its ledger entry let go of it already)."""
+    with transaction.atomic():
+        if not deleted and not LedgerEntry.objects.filter(payment=payment).update(payment=None):
+            return None
+        fee_structure = payment.fee_structure if payment.fee_structure_id is not None else None
+        return post([Posting(
+            payment.student_id, 'adjustment', Decimal(payment.amount_paid), f'Reversal of payment {payment.transaction_id}',
+            fee_structure,
+        )])[0]
+
+
+def adjust(student, amount, description, due_date=None):
+    """Post an adjustment: positive amounts are owed, negative ones are credits (e.g. waivers)."""
+    return post([Posting(getattr(student, 'pk', student), 'adjustment', Decimal(amount), description, due_date=due_date)])[0]
+
+
+def balance_for(student):
+    """The student's StudentBalance (unsaved and empty if nothing was posted)."""
+    student_id = getattr(student, 'pk', student)
+    return StudentBalance.objects.filter(student_id=student_id).first() or StudentBalance(student_id=student_id)
+
+
+def outstanding_by_grade(today=None):
+    """Students owing money grouped by grade level, from one grouped query.
+
+    Rows: {'grade_level', 'students', 'outstanding', 'current', 'days_1_30',
+    'days_31_60', 'days_61_90', 'days_over_90'}; the aging columns split the
+    outstanding amount by how overdue each student's oldest open invoice is.
+    Students without a grade come last with ``grade_level`` None.
+    """
+    today = today or timezone.localdate()
+
+    def ago(days):
+        return today - timedelta(days=days)
+
+    return list(
+        StudentBalance.objects.filter(balance__gt=0)
+        .annotate(grade_level=Coalesce('student__studentprofile__grade_level', 'student__student_profile__grade_level'))
+        .values('grade_level')
+        .annotate(
+            students=Count('student'),
+            outstanding=Sum('balance'),
+            current=Sum('balance', filter=Q(oldest_due__isnull=True) | Q(oldest_due__gte=today), default=ZERO),
+            days_1_30=Sum('balance', filter=Q(oldest_due__lt=today, oldest_due__gte=ago(30)), default=ZERO),
+            days_31_60=Sum('balance', filter=Q(oldest_due__lt=ago(30), oldest_due__gte=ago(60)), default=ZERO),
+            days_61_90=Sum('balance', filter=Q(oldest_due__lt=ago(60), oldest_due__gte=ago(90)), default=ZERO),
+            days_over_90=Sum('balance', filter=Q(oldest_due__lt=ago(90)), default=ZERO),
+        )
+        .order_by(F('grade_level').asc(nulls_last=True))
+    )
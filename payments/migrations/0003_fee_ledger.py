@@ -0,0 +1,127 @@
+# Generated by Django 4.2 on 2026-10-18 05:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from decimal import Decimal
+
+
+def backfill_ledger(apps, schema_editor):
+    """Charge each fee a completed payment was made for, then post the payment
+    (same rules as payments.ledger.post: credits settle that fee's invoice
+    first, then the oldest ones)."""
+    Payment = apps.get_model('payments', 'Payment')
+    Invoice = apps.get_model('payments', 'Invoice')
+    LedgerEntry = apps.get_model('payments', 'LedgerEntry')
+    StudentBalance = apps.get_model('payments', 'StudentBalance')
+
+    accounts = {}
+    for payment in Payment.objects.filter(status='completed').select_related('fee_structure').order_by('payment_date', 'id'):
+        account = accounts.setdefault(payment.student_id, {
+            'balance': Decimal('0'), 'charged': Decimal('0'), 'paid': Decimal('0'), 'invoices': {}, 'entries': [],
+        })
+        fee = payment.fee_structure
+        invoice = account['invoices'].get(fee.id)
+        if invoice is None:
+            invoice = account['invoices'][fee.id] = Invoice(
+                student_id=payment.student_id, fee_structure=fee, description=fee.name,
+                amount=fee.amount, settled=min(max(-account['balance'], Decimal('0')), fee.amount),
+                due_date=payment.payment_date.date(),
+            )
+            account['balance'] += fee.amount
+            account['charged'] += fee.amount
+            account['entries'].append(LedgerEntry(
+                student_id=payment.student_id, kind='charge', amount=fee.amount,
+                balance_after=account['balance'], description=fee.name, invoice=invoice,
+            ))
+        credit = payment.amount_paid
+        ordered = sorted(account['invoices'].values(), key=lambda i: (i.fee_structure_id != fee.id, i.due_date))
+        for open_invoice in ordered:
+            applied = min(open_invoice.amount - open_invoice.settled, credit)
+            if applied > 0:
+                open_invoice.settled += applied
+                credit -= applied
+        account['balance'] -= payment.amount_paid
+        account['paid'] += payment.amount_paid
+        account['entries'].append(LedgerEntry(
+            student_id=payment.student_id, kind='payment', amount=-payment.amount_paid,
+            balance_after=account['balance'], description=f'Payment {payment.transaction_id}', payment=payment,
+        ))
+
+    invoices = [invoice for account in accounts.values() for invoice in account['invoices'].values()]
+    Invoice.objects.bulk_create(invoices, batch_size=500)
+    for entry in (entry for account in accounts.values() for entry in account['entries']):
+        entry.invoice_id = entry.invoice.pk if entry.invoice is not None else None
+    LedgerEntry.objects.bulk_create([entry for account in accounts.values() for entry in account['entries']], batch_size=500)
+    StudentBalance.objects.bulk_create([
+        StudentBalance(
+            student_id=student_id, balance=account['balance'], total_charged=account['charged'], total_paid=account['paid'],
+            oldest_due=min((i.due_date for i in account['invoices'].values() if i.settled < i.amount), default=None),
+        )
+        for student_id, account in accounts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0001_initial'),
+        ('payments', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=200)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('settled', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('due_date', models.DateField()),
+                ('issued_at', models.DateTimeField(auto_now_add=True)),
+                ('fee_structure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='payments.feestructure')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['due_date', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_charged', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('oldest_due', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('charge', 'Charge'), ('payment', 'Payment'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(max_length=200)),
+                ('posted_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='payments.invoice')),
+                ('payment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entry', to='payments.payment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['posted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['student', 'posted_at'], name='ledger_student_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['student', 'due_date'], name='invoice_student_due_idx'),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 
 class FeeStructure(models.Model):
@@ -27,4 +28,97 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     def __str__(self):
-        return f"{self.student.username} - ${self.amount_paid}"
\ No newline at end of file
+        return f"{self.student.username} - ${self.amount_paid}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded status so the ledger signal can tell when a
+        payment becomes (or stops being) completed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
+
+class Invoice(models.Model):
+    """An amount a student owes: a fee structure charge or a debit adjustment.
+
+    ``settled`` is how much of it credits (payments, waivers) have covered so
+    far; ``payments.ledger`` applies credits to the oldest due invoices first.
+    """
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invoices')
+    fee_structure = models.ForeignKey(FeeStructure, null=True, blank=True, on_delete=models.SET_NULL, related_name='invoices')
+    description = models.CharField(max_length=200)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    settled = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    due_date = models.DateField()
+    issued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['due_date', 'id']
+        indexes = [models.Index(fields=['student', 'due_date'], name='invoice_student_due_idx')]
+
+    def __str__(self):
+        return f"{self.student.username} - {self.description} ${self.amount}"
+
+    @property
+    def outstanding(self):
+        return self.amount - self.settled
+
+
+class LedgerEntry(models.Model):
+    """One posting on a student's fee account. Charges are positive, payments
+    negative and adjustments either; ``balance_after`` is the running balance."""
+    KIND_CHOICES = [
+        ('charge', 'Charge'),
+        ('payment', 'Payment'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=200)
+    invoice = models.ForeignKey(Invoice, null=True, blank=True, on_delete=models.SET_NULL, related_name='entries')
+    payment = models.OneToOneField(Payment, null=True, blank=True, on_delete=models.SET_NULL, related_name='ledger_entry')
+    posted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['posted_at', 'id']
+        indexes = [models.Index(fields=['student', 'posted_at'], name='ledger_student_posted_idx')]
+
+    def __str__(self):
+        return f"{self.student.username} {self.kind} {self.amount}"
+
+
+class StudentBalance(models.Model):
+    """A student's fee account totals, updated with every ledger posting.
+
+    ``oldest_due`` is the due date of the oldest invoice not fully settled, so
+    how overdue a student is needs no look at the invoices.
+    """
+    AGING_BUCKETS = [(0, 'current'), (30, '1-30'), (60, '31-60'), (90, '61-90')]
+
+    student = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='fee_balance')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_charged = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    oldest_due = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.student.username}: {self.balance}"
+
+    def days_overdue(self, today=None):
+        if self.oldest_due is None or self.balance <= 0:
+            return 0
+        today = today or timezone.localdate()
+        return max((today - self.oldest_due).days, 0)
+
+    def aging_bucket(self, today=None):
+        """'current', '1-30', '31-60', '61-90' or '90+' days overdue."""
+        days = self.days_overdue(today)
+        for limit, label in self.AGING_BUCKETS:
+            if days <= limit:
+                return label
+        return '90+'
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""Invalidate the cached fee catalog when fee structures change, and post
+payments to the fee ledger when they complete."""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import User
+from sims.catalog import bump
+from .catalog import CATALOG
+from .ledger import record_payment, reverse_payment
+from .models import FeeStructure, Payment
+
+
+@receiver(post_save, sender=FeeStructure)
+@receiver(post_delete, sender=FeeStructure)
+def fee_structure_changed(sender, **kwargs):
+    bump(CATALOG)
+
+
+@receiver(post_save, sender=Payment)
+def payment_posted(sender, instance, created, **kwargs):
+    before = None if created else getattr(instance, '_loaded_status', None)
+    if instance.status == 'completed' and before != 'completed':
+        record_payment(instance)
+    elif before == 'completed' and instance.status != 'completed':
+        reverse_payment(instance)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, origin=None, **kwargs):
+    origin_model = getattr(origin, 'model', type(origin))
+    # when the student is being deleted their ledger goes with them
+    if origin_model is User or getattr(instance, '_loaded_status', instance.status) != 'completed':
+        return
+    if origin_model is FeeStructure:
+        # the fee structure is going too; its invoices keep no link to it
+        instance.fee_structure = None
+    reverse_payment(instance, deleted=True)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ranks.standings import rebuild_standings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized class standings (averages and ranks) from grades and enrollments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grade-level', type=int, help='Only rebuild standings for this grade level')
+
+    def handle(self, *args, **options):
+        written = rebuild_standings(grade_level=options.get('grade_level'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} class standing(s)'))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 04:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ranks', '0003_grade_assignment_score_grade_final_exam_score_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade_level', models.IntegerField()),
+                ('academic_year', models.CharField(max_length=9)),
+                ('semester', models.CharField(max_length=10)),
+                ('average', models.FloatField(blank=True, help_text='Average numeric result (0-100) for the term', null=True)),
+                ('total', models.FloatField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('rank', models.PositiveIntegerField(blank=True, help_text='Competition rank within grade level and term', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(limit_choices_to={'role': 'student'}, on_delete=django.db.models.deletion.CASCADE, related_name='class_standings', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='classstanding',
+            index=models.Index(fields=['grade_level', 'academic_year', 'semester', 'rank'], name='ranks_stand_cohort_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='classstanding',
+            unique_together={('student', 'grade_level', 'academic_year', 'semester')},
+        ),
+    ]
@@ -129,22 +129,32 @@ def calculate_student_average(student, academic_year=None, semester=None):
 
 def rank_students_for_subject(subject, academic_year=None, semester=None):
     """Return list of (student, score, rank) ordered by score desc for a given subject."""
-    qs = Grade.objects.filter(subject=subject).select_related('student')
-    # optionally filter by academic_year/semester
-    scored = [g for g in qs if g.score is not None]
-    scored.sort(key=lambda x: x.score, reverse=True)
-    results = []
-    last_score = None
-    last_rank = 0
-    idx = 0
-    for g in scored:
-        idx += 1
-        if g.score == last_score:
-            rank = last_rank
-        else:
-            rank = idx
-            last_rank = rank
-            last_score = g.score
-        results.append((g.student, g.score, rank))
-    return results
+    from .ranking import subject_ranking
+    return subject_ranking(subject)
+
+
+class ClassStanding(models.Model):
+    """Materialized standing of a student within their grade level for one term.
+
+    Rows are kept up to date by ``ranks.standings`` whenever a Grade or an
+    Enrollment result changes, so pages can read a student's average and class
+    rank with a single indexed lookup instead of re-ranking the whole grade.
+    """
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='class_standings', limit_choices_to={'role': 'student'})
+    grade_level = models.IntegerField()
+    academic_year = models.CharField(max_length=9)
+    semester = models.CharField(max_length=10)
+    average = models.FloatField(null=True, blank=True, help_text='Average numeric result (0-100) for the term')
+    total = models.FloatField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    rank = models.PositiveIntegerField(null=True, blank=True, help_text='Competition rank within grade level and term')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['student', 'grade_level', 'academic_year', 'semester']
+        indexes = [
+            models.Index(fields=['grade_level', 'academic_year', 'semester', 'rank'], name='ranks_stand_cohort_rank_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.student.username} - Grade {self.grade_level} {self.academic_year} {self.semester}: #{self.rank}"
@@ -0,0 +1,152 @@
+"""Competition ranking ("1, 2, 2, 4") pushed into the database.
+
+Ranks are computed with ``RANK() OVER (PARTITION BY ... ORDER BY value DESC)``
+when the backend supports window functions (SQLite >= 3.25, PostgreSQL,
+MySQL 8). Older engines fall back to ranking the (key, value) pairs in
+Python, which gives identical results.
+
+Rows whose value is NULL never receive a rank.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import Rank
+
+RANK_ALIAS = 'competition_rank'
+
+
+def window_ranking_supported(using=DEFAULT_DB_ALIAS):
+    return connections[using].features.supports_over_clause
+
+
+def competition_ranks(pairs):
+    """Return {key: rank} for (key, value) pairs ranked by value descending.
+
+    Ties share a rank and the next rank skips ahead (1, 2, 2, 4). Pairs whose
+    value is None are not ranked.
+    """
+    scored = sorted((p for p in pairs if p[1] is not None), key=lambda p: p[1], reverse=True)
+    ranks = {}
+    rank = 0
+    previous = None
+    for idx, (key, value) in enumerate(scored, start=1):
+        if value != previous:
+            rank = idx
+            previous = value
+        ranks[key] = rank
+    return ranks
+
+
+def rank_window(order_field, partition_by=()):
+    return Window(
+        expression=Rank(),
+        partition_by=[F(field) for field in partition_by] or None,
+        order_by=F(order_field).desc(nulls_last=True),
+    )
+
+
+def _ranked_queryset(queryset, order_field, partition_by):
+    return queryset.filter(**{f'{order_field}__isnull': False}).annotate(
+        **{RANK_ALIAS: rank_window(order_field, partition_by)}
+    )
+
+
+def rank_map(queryset, key_field, order_field='score', partition_by=(), keys=None):
+    """Rank the rows of ``queryset`` and return {key: rank}.
+
+    With ``partition_by`` the dict is keyed by (partition values..., key).
+    ``keys`` limits which rows are returned without shrinking the population
+    being ranked, so a single student's (or a page of students') rank can be
+    read without loading the whole class.
+    """
+    partition_by = tuple(partition_by)
+    fields = partition_by + (key_field,)
+
+    if window_ranking_supported(queryset.db):
+        ranked = _ranked_queryset(queryset, order_field, partition_by)
+        if keys is not None:
+            # A plain filter on key_field would land in the WHERE clause and
+            # be applied before ranking. OR-ing it with a condition on the
+            # window makes Django evaluate it after ranking (QUALIFY-style).
+            ranked = ranked.filter(Q(**{f'{key_field}__in': list(keys)}) | Q(**{f'{RANK_ALIAS}__isnull': True}))
+        rows = ranked.order_by().values_list(*fields, RANK_ALIAS)
+        if partition_by:
+            return {tuple(row[:-1]): row[-1] for row in rows}
+        return {row[0]: row[1] for row in rows}
+
+    # Python fallback: load only the keys and values and rank each partition
+    partitions = {}
+    for row in queryset.order_by().values_list(*fields, order_field):
+        partitions.setdefault(row[:len(partition_by)], []).append((row[-2], row[-1]))
+    wanted = set(keys) if keys is not None else None
+    result = {}
+    for partition, pairs in partitions.items():
+        for key, rank in competition_ranks(pairs).items():
+            if wanted is not None and key not in wanted:
+                continue
+            result[partition + (key,) if partition_by else key] = rank
+    return result
+
+
+def with_ranks(queryset, order_field='score', partition_by=(), attr='rank'):
+    """Evaluate ``queryset`` ordered by value descending, setting ``attr`` on
+    every instance to its competition rank (None when the value is NULL)."""
+    partition_by = tuple(partition_by)
+    ordering = [*partition_by, F(order_field).desc(nulls_last=True)]
+
+    if window_ranking_supported(queryset.db):
+        annotated = queryset.annotate(**{RANK_ALIAS: rank_window(order_field, partition_by)}).order_by(*ordering)
+        items = list(annotated)
+        for item in items:
+            setattr(item, attr, getattr(item, RANK_ALIAS) if getattr(item, order_field) is not None else None)
+        return items
+
+    items = list(queryset.order_by(*ordering))
+    partitions = {}
+    for idx, item in enumerate(items):
+        key = tuple(getattr(item, field) for field in partition_by)
+        partitions.setdefault(key, []).append((idx, getattr(item, order_field)))
+    for pairs in partitions.values():
+        ranks = competition_ranks(pairs)
+        for idx, _ in pairs:
+            setattr(items[idx], attr, ranks.get(idx))
+    return items
+
+
+def subject_ranking(subject, start=None, stop=None):
+    """Return [(student, score, rank), ...] for a subject, best score first.
+
+    ``start``/``stop`` slice the ranking in the database so a page of the
+    leaderboard can be shown without fetching the rest of the class.
+    """
+    from .models import Grade
+
+    qs = Grade.objects.filter(subject=subject, score__isnull=False).select_related('student')
+    if window_ranking_supported(qs.db):
+        ranked = _ranked_queryset(qs, 'score', ()).order_by(F('score').desc(), 'student_id')[start:stop]
+        return [(g.student, g.score, getattr(g, RANK_ALIAS)) for g in ranked]
+    grades = with_ranks(qs.order_by(), 'score')[start:stop]
+    return [(g.student, g.score, g.rank) for g in grades]
+
+
+def subject_ranks_for_students(subject, student_ids):
+    """Return {student_id: rank} within ``subject`` for the given students."""
+    from .models import Grade
+
+    return rank_map(Grade.objects.filter(subject=subject), 'student_id', keys=student_ids)
+
+
+def student_subject_ranks(student):
+    """Return {subject_id: rank} for every subject the student has a score in.
+
+    This is a single query regardless of how many subjects the student takes.
+    """
+    from .models import Grade
+
+    subjects_taken = Grade.objects.filter(student=student).values('subject_id')
+    ranks = rank_map(
+        Grade.objects.filter(subject_id__in=subjects_taken),
+        'student_id',
+        partition_by=('subject_id',),
+        keys=[getattr(student, 'id', student)],
+    )
+    return {subject_id: rank for (subject_id, _), rank in ranks.items()}
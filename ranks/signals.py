@@ -0,0 +1,44 @@
+"""Keep ``ClassStanding`` rows and cached subject statistics in sync with
+grade and enrollment changes."""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from subjects.models import Enrollment
+from .models import Grade
+from .standings import refresh_for_subject, refresh_standing
+from .stats import invalidate_subject_stats
+
+# Enrollment fields that feed compute_numeric_scores
+SCORED_ENROLLMENT_FIELDS = ('result', 'final_grade')
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def grade_changed(sender, instance, **kwargs):
+    refresh_for_subject(instance.student_id, instance.subject_id)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created:
+        if update_fields is not None and not set(update_fields) & set(SCORED_ENROLLMENT_FIELDS):
+            return
+        loaded = getattr(instance, '_loaded_values', None)
+        if loaded is not None and all(
+            loaded.get(field) == getattr(instance, field) for field in SCORED_ENROLLMENT_FIELDS
+        ):
+            return
+    refresh_standing(instance.student_id, instance.academic_year, instance.semester)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    refresh_standing(instance.student_id, instance.academic_year, instance.semester)
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def subject_scores_changed(sender, instance, **kwargs):
+    invalidate_subject_stats(instance.subject_id)
@@ -0,0 +1,207 @@
+"""Maintenance and lookup helpers for the materialized ``ClassStanding`` table.
+
+Pages used to rebuild a whole grade level's ranking on every request by
+scoring each peer in Python. Instead, a student's standing is recomputed only
+when one of their grades or enrollment results changes, and the cohort
+(grade level + term) is re-ranked from the stored averages.
+"""
+from django.db import transaction
+
+from subjects.models import Enrollment
+from .models import ClassStanding
+from .ranking import rank_map
+
+
+def _grade_level_for(student_id):
+    from users.models import StudentProfile
+    return StudentProfile.objects.filter(user_id=student_id).values_list('grade_level', flat=True).first()
+
+
+def rerank_cohort(grade_level, academic_year, semester):
+    """Recompute ranks for one grade level and term from the stored averages.
+
+    Only rows whose rank actually changed are written back.
+    """
+    cohort = ClassStanding.objects.filter(
+        grade_level=grade_level,
+        academic_year=academic_year,
+        semester=semester,
+    )
+    ranks = rank_map(cohort, 'id', order_field='average')
+    changed = []
+    for row in cohort.only('id', 'rank'):
+        new_rank = ranks.get(row.id)
+        if row.rank != new_rank:
+            row.rank = new_rank
+            changed.append(row)
+    if changed:
+        ClassStanding.objects.bulk_update(changed, ['rank'])
+    return len(changed)
+
+
+def refresh_standing(student, academic_year, semester, grade_level=None, rerank=True):
+    """Recompute one student's term aggregates and (optionally) re-rank the cohort."""
+    from users.views import compute_numeric_scores
+
+    student_id = getattr(student, 'id', student)
+    if grade_level is None:
+        grade_level = _grade_level_for(student_id)
+    if grade_level is None:
+        return None
+
+    enrollments = list(Enrollment.objects.filter(
+        student_id=student_id,
+        academic_year=academic_year,
+        semester=semester,
+    ))
+    with transaction.atomic():
+        if not enrollments:
+            ClassStanding.objects.filter(
+                student_id=student_id,
+                grade_level=grade_level,
+                academic_year=academic_year,
+                semester=semester,
+            ).delete()
+            standing = None
+        else:
+            _, total, count, average = compute_numeric_scores(student_id, enrollments)
+            standing, _ = ClassStanding.objects.update_or_create(
+                student_id=student_id,
+                grade_level=grade_level,
+                academic_year=academic_year,
+                semester=semester,
+                defaults={'average': average, 'total': total, 'graded_count': count},
+            )
+        if rerank:
+            rerank_cohort(grade_level, academic_year, semester)
+    if standing is not None:
+        standing.refresh_from_db(fields=['rank'])
+    return standing
+
+
+def refresh_for_subject(student_id, subject_id):
+    """Refresh every term in which the student takes the given subject."""
+    terms = (
+        Enrollment.objects.filter(student_id=student_id, subject_id=subject_id)
+        .values_list('academic_year', 'semester')
+        .distinct()
+    )
+    grade_level = None
+    for academic_year, semester in terms:
+        if grade_level is None:
+            grade_level = _grade_level_for(student_id)
+            if grade_level is None:
+                return
+        refresh_standing(student_id, academic_year, semester, grade_level=grade_level)
+
+
+def refresh_for_subject_bulk(student_ids, subject_id):
+    """Batch form of ``refresh_for_subject`` for a whole class.
+
+    Scores, enrollments and existing standings are loaded once for all the
+    students, changed rows are written with bulk operations, and each affected
+    cohort is re-ranked once. Returns the number of standings written.
+    """
+    from users.models import StudentProfile
+    from users.views import compute_numeric_scores
+    from .models import Grade
+
+    terms = set(
+        Enrollment.objects.filter(student_id__in=student_ids, subject_id=subject_id)
+        .values_list('student_id', 'academic_year', 'semester')
+    )
+    if not terms:
+        return 0
+    ids = {student_id for student_id, _, _ in terms}
+    levels = dict(StudentProfile.objects.filter(user_id__in=ids).values_list('user_id', 'grade_level'))
+
+    by_term = {}
+    for enrollment in Enrollment.objects.filter(
+        student_id__in=ids,
+        academic_year__in={year for _, year, _ in terms},
+        semester__in={semester for _, _, semester in terms},
+    ):
+        key = (enrollment.student_id, enrollment.academic_year, enrollment.semester)
+        if key in terms:
+            by_term.setdefault(key, []).append(enrollment)
+    scores = {}
+    for student_id, graded_subject_id, score in Grade.objects.filter(student_id__in=ids).values_list(
+        'student_id', 'subject_id', 'score'
+    ):
+        scores.setdefault(student_id, {})[graded_subject_id] = score
+    existing = {
+        (row.student_id, row.grade_level, row.academic_year, row.semester): row
+        for row in ClassStanding.objects.filter(student_id__in=ids)
+    }
+
+    created, changed, cohorts = [], [], set()
+    for (student_id, academic_year, semester), enrollments in by_term.items():
+        grade_level = levels.get(student_id)
+        if grade_level is None:
+            continue
+        _, total, count, average = compute_numeric_scores(student_id, enrollments, rank_scores=scores.get(student_id, {}))
+        row = existing.get((student_id, grade_level, academic_year, semester))
+        if row is None:
+            created.append(ClassStanding(
+                student_id=student_id, grade_level=grade_level, academic_year=academic_year, semester=semester,
+                average=average, total=total, graded_count=count,
+            ))
+        elif (row.average, row.total, row.graded_count) != (average, total, count):
+            row.average, row.total, row.graded_count = average, total, count
+            changed.append(row)
+        else:
+            continue
+        cohorts.add((grade_level, academic_year, semester))
+
+    with transaction.atomic():
+        ClassStanding.objects.bulk_create(created)
+        ClassStanding.objects.bulk_update(changed, ['average', 'total', 'graded_count'])
+        for cohort in cohorts:
+            rerank_cohort(*cohort)
+    return len(created) + len(changed)
+
+
+def rebuild_standings(grade_level=None):
+    """Recompute every standing from scratch (used by the backfill command)."""
+    from users.models import User
+    from users.views import compute_numeric_scores
+
+    students = User.objects.filter(role='student', studentprofile__isnull=False).select_related('studentprofile')
+    if grade_level is not None:
+        students = students.filter(studentprofile__grade_level=grade_level)
+
+    cohorts = set()
+    written = 0
+    for student in students.prefetch_related('subject_enrollments'):
+        level = student.studentprofile.grade_level
+        by_term = {}
+        for enrollment in student.subject_enrollments.all():
+            by_term.setdefault((enrollment.academic_year, enrollment.semester), []).append(enrollment)
+        for (academic_year, semester), enrollments in by_term.items():
+            _, total, count, average = compute_numeric_scores(student, enrollments)
+            ClassStanding.objects.update_or_create(
+                student=student,
+                grade_level=level,
+                academic_year=academic_year,
+                semester=semester,
+                defaults={'average': average, 'total': total, 'graded_count': count},
+            )
+            cohorts.add((level, academic_year, semester))
+            written += 1
+
+    for cohort in cohorts:
+        rerank_cohort(*cohort)
+    return written
+
+
+def current_standing(student):
+    """Return the student's most recent ClassStanding row, or None.
+
+    Semesters sort 'first' < 'second', so ordering by academic_year then
+    semester descending yields the latest term.
+    """
+    return (
+        ClassStanding.objects.filter(student=student)
+        .order_by('-academic_year', '-semester')
+        .first()
+    )
@@ -0,0 +1,163 @@
+"""Score statistics for a subject, computed in the database and cached.
+
+``SubjectStats`` gathers count, mean, min, max, standard deviation and the
+score-band histogram with a single ``aggregate()`` (each band is a conditional
+``Count(Case(...))``). Percentiles come from a second, grouped query over the
+distinct scores -- at most 101 rows, since scores are whole numbers 0-100.
+
+``SubjectStats.for_subject`` caches the result per (subject, term). Every key
+carries a per-subject version number that grade and enrollment changes bump,
+so a save invalidates all cached terms of that subject at once.
+"""
+import math
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Case, Count, Exists, F, FloatField, IntegerField, Max, Min, OuterRef, Q, Value, When
+
+from subjects.models import Enrollment
+from .models import Grade
+
+# (label, lower bound inclusive, upper bound exclusive)
+SCORE_BANDS = (
+    ('90-100', 90, None),
+    ('80-89', 80, 90),
+    ('70-79', 70, 80),
+    ('60-69', 60, 70),
+    ('0-59', None, 60),
+)
+PERCENTILES = (25, 50, 75, 90)
+ENROLLED_STATUSES = ('approved', 'active')
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_KEY = 'ranks:subject-stats:{subject_id}:version'
+
+
+def _band_filter(low, high):
+    condition = Q(score__isnull=False)
+    if low is not None:
+        condition &= Q(score__gte=low)
+    if high is not None:
+        condition &= Q(score__lt=high)
+    return condition
+
+
+def _percentiles(frequencies, scored):
+    """Nearest-rank percentiles from sorted (score, count) pairs."""
+    result = {}
+    cumulative = 0
+    pending = list(PERCENTILES)
+    for score, count in frequencies:
+        cumulative += count
+        while pending and cumulative >= math.ceil(pending[0] / 100 * scored):
+            result[pending.pop(0)] = score
+    for percentile in pending:
+        result[percentile] = None
+    return result
+
+
+class SubjectStats:
+    """Summary of the scores in a ``Grade`` queryset."""
+
+    def __init__(self, count=0, scored=0, mean=None, minimum=None, maximum=None, stddev=None,
+                 percentiles=None, distribution=None):
+        self.count = count
+        self.scored = scored
+        self.mean = mean
+        self.min = minimum
+        self.max = maximum
+        self.stddev = stddev
+        self.percentiles = percentiles or {percentile: None for percentile in PERCENTILES}
+        self.distribution = distribution or {label: 0 for label, _, _ in SCORE_BANDS}
+
+    @property
+    def median(self):
+        return self.percentiles.get(50)
+
+    @classmethod
+    def from_queryset(cls, grades):
+        """Compute the statistics of ``grades`` without caching."""
+        grades = grades.order_by()
+        bands = {
+            f'band_{idx}': Count(Case(When(_band_filter(low, high), then=Value(1)), output_field=IntegerField()))
+            for idx, (_, low, high) in enumerate(SCORE_BANDS)
+        }
+        row = grades.aggregate(
+            count=Count('id'), scored=Count('score'), mean=Avg('score'),
+            minimum=Min('score'), maximum=Max('score'),
+            mean_square=Avg(F('score') * F('score'), output_field=FloatField()),
+            **bands,
+        )
+        stddev = percentiles = None
+        if row['scored']:
+            # population standard deviation from E[x^2] - E[x]^2; SQLite's
+            # STDDEV_POP fallback cannot skip NULL scores
+            stddev = math.sqrt(max(0.0, row['mean_square'] - row['mean'] ** 2))
+            frequencies = grades.filter(score__isnull=False).values_list('score').annotate(n=Count('id')).order_by('score')
+            percentiles = _percentiles(frequencies, row['scored'])
+        return cls(
+            count=row['count'],
+            scored=row['scored'],
+            mean=round(row['mean'], 2) if row['mean'] is not None else None,
+            minimum=row['minimum'],
+            maximum=row['maximum'],
+            stddev=round(stddev, 2) if stddev is not None else None,
+            percentiles=percentiles,
+            distribution={label: row[f'band_{idx}'] for idx, (label, _, _) in enumerate(SCORE_BANDS)},
+        )
+
+    @classmethod
+    def term_grades(cls, subject, academic_year=None, semester=None):
+        """The subject's grades limited to students enrolled for the term.
+
+        Without a term every grade of the subject is used; a term nobody is
+        enrolled in has no grades.
+        """
+        subject_id = getattr(subject, 'id', subject)
+        grades = Grade.objects.filter(subject_id=subject_id)
+        if not (academic_year and semester):
+            return grades
+        enrolled = Enrollment.objects.filter(
+            subject_id=subject_id, academic_year=academic_year, semester=semester, status__in=ENROLLED_STATUSES,
+        )
+        return grades.filter(Exists(enrolled.filter(student=OuterRef('student'))))
+
+    @classmethod
+    def for_subject(cls, subject, academic_year=None, semester=None):
+        """Cached statistics for one subject and term (or all terms)."""
+        subject_id = getattr(subject, 'id', subject)
+        version = cache.get(VERSION_KEY.format(subject_id=subject_id), 0)
+        key = f'ranks:subject-stats:{subject_id}:{academic_year or "*"}:{semester or "*"}:{version}'
+        stats = cache.get(key)
+        if stats is None:
+            stats = cls.from_queryset(cls.term_grades(subject_id, academic_year, semester))
+            cache.set(key, stats, CACHE_TIMEOUT)
+        return stats
+
+    def as_dict(self):
+        return {
+            'total_students': self.count,
+            'scored_students': self.scored,
+            'average_score': self.mean if self.mean is not None else 0,
+            'min_score': self.min,
+            'max_score': self.max,
+            'stddev': self.stddev,
+            'percentiles': {str(percentile): value for percentile, value in self.percentiles.items()},
+            'score_distribution': self.distribution,
+        }
+
+
+def invalidate_subject_stats(*subject_ids):
+    """Drop the cached statistics of ``subject_ids`` once the current
+    transaction commits (right away outside one)."""
+    subject_ids = set(subject_ids)
+    transaction.on_commit(lambda: _invalidate(subject_ids))
+
+
+def _invalidate(subject_ids):
+    for subject_id in subject_ids:
+        key = VERSION_KEY.format(subject_id=subject_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
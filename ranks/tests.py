@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from users.models import User, StudentProfile
+from subjects.models import Subject, Enrollment
+from ranks.models import Grade, ClassStanding
+from ranks.ranking import rank_map, student_subject_ranks, subject_ranking, subject_ranks_for_students
+from ranks.standings import current_standing, rebuild_standings
+from ranks.stats import SubjectStats
+
+
+class ClassStandingTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Mathematics', code='MATH5', grade_level=5)
+        self.students = []
+        for idx in range(3):
+            user = User.objects.create_user(username=f'student{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'STU{idx:04d}', grade_level=5)
+            Enrollment.objects.create(student=user, subject=self.subject, academic_year='2024-2025', semester='first')
+            self.students.append(user)
+
+    def test_grade_save_updates_average_and_ranks(self):
+        Grade.objects.create(student=self.students[0], subject=self.subject, score=70)
+        Grade.objects.create(student=self.students[1], subject=self.subject, score=90)
+        Grade.objects.create(student=self.students[2], subject=self.subject, score=90)
+
+        self.assertEqual(current_standing(self.students[1]).rank, 1)
+        self.assertEqual(current_standing(self.students[2]).rank, 1)
+        standing = current_standing(self.students[0])
+        self.assertEqual(standing.rank, 3)
+        self.assertEqual(standing.average, 70.0)
+
+        grade = Grade.objects.get(student=self.students[0])
+        grade.score = 95
+        grade.save()
+        self.assertEqual(current_standing(self.students[0]).rank, 1)
+        self.assertEqual(current_standing(self.students[1]).rank, 2)
+
+    def test_enrollment_result_change_updates_standing(self):
+        enrollment = Enrollment.objects.get(student=self.students[0])
+        enrollment.result = '88'
+        enrollment.save()
+        standing = current_standing(self.students[0])
+        self.assertEqual(standing.average, 88.0)
+        self.assertEqual(standing.rank, 1)
+        self.assertIsNone(current_standing(self.students[1]).rank)
+
+    def test_rebuild_matches_incremental(self):
+        Grade.objects.create(student=self.students[0], subject=self.subject, score=60)
+        Grade.objects.create(student=self.students[1], subject=self.subject, score=80)
+        before = dict(ClassStanding.objects.values_list('student_id', 'rank'))
+        ClassStanding.objects.all().delete()
+        rebuild_standings()
+        self.assertEqual(dict(ClassStanding.objects.values_list('student_id', 'rank')), before)
+
+
+class RankingQueryTests(TestCase):
+    def setUp(self):
+        self.math = Subject.objects.create(name='Mathematics', code='MATH6', grade_level=6)
+        self.science = Subject.objects.create(name='Science', code='SCI6', grade_level=6)
+        self.students = [
+            User.objects.create_user(username=f'pupil{idx}', password='pass', role='student')
+            for idx in range(4)
+        ]
+        for student, math, science in zip(self.students, [80, 95, 80, None], [60, 70, 90, 50]):
+            Grade.objects.create(student=student, subject=self.math, score=math)
+            Grade.objects.create(student=student, subject=self.science, score=science)
+
+    def _check_ranks(self):
+        ranking = subject_ranking(self.math)
+        self.assertEqual([(s.username, r) for s, _, r in ranking], [('pupil1', 1), ('pupil0', 2), ('pupil2', 2)])
+        self.assertEqual([r for _, _, r in subject_ranking(self.math, start=1, stop=3)], [2, 2])
+        self.assertEqual(
+            subject_ranks_for_students(self.math, [self.students[2].id, self.students[3].id]),
+            {self.students[2].id: 2},
+        )
+        self.assertEqual(student_subject_ranks(self.students[2]), {self.math.id: 2, self.science.id: 1})
+        everything = rank_map(Grade.objects.all(), 'student_id', partition_by=('subject_id',))
+        self.assertEqual(everything[(self.science.id, self.students[3].id)], 4)
+
+    def test_window_function_ranks(self):
+        self._check_ranks()
+
+    def test_python_fallback_matches(self):
+        with mock.patch('ranks.ranking.window_ranking_supported', return_value=False):
+            self._check_ranks()
+
+
+class SubjectStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(name='History', code='HIS5', grade_level=5)
+        self.students = []
+        for idx, score in enumerate([95, 85, 85, 72, 40, None]):
+            user = User.objects.create_user(username=f'stats{idx}', password='pass', role='student')
+            Grade.objects.create(student=user, subject=self.subject, score=score)
+            self.students.append(user)
+
+    def test_statistics_come_from_one_aggregate(self):
+        with self.assertNumQueries(2):
+            stats = SubjectStats.from_queryset(Grade.objects.filter(subject=self.subject))
+        self.assertEqual((stats.count, stats.scored, stats.min, stats.max), (6, 5, 40, 95))
+        self.assertEqual(stats.mean, 75.4)
+        self.assertEqual(stats.stddev, 19.15)
+        self.assertEqual(stats.percentiles, {25: 72, 50: 85, 75: 85, 90: 95})
+        self.assertEqual(stats.distribution, {'90-100': 1, '80-89': 2, '70-79': 1, '60-69': 0, '0-59': 1})
+
+        empty = SubjectStats.from_queryset(Grade.objects.none())
+        self.assertEqual((empty.scored, empty.mean, empty.median), (0, None, None))
+
+    def test_cached_per_subject_until_a_grade_changes(self):
+        self.assertEqual(SubjectStats.for_subject(self.subject).max, 95)
+        with self.assertNumQueries(0):
+            SubjectStats.for_subject(self.subject)
+        grade = Grade.objects.get(student=self.students[4])
+        grade.score = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            grade.save()
+        self.assertEqual(SubjectStats.for_subject(self.subject).max, 100)
+
+    def test_term_uses_enrolled_students_only(self):
+        for student in self.students[:2]:
+            Enrollment.objects.create(student=student, subject=self.subject, academic_year='2024-2025', semester='first', status='active')
+        stats = SubjectStats.for_subject(self.subject, '2024-2025', 'first')
+        self.assertEqual((stats.count, stats.mean), (2, 90.0))
+        # nobody enrolled for that term: no grades
+        self.assertEqual(SubjectStats.for_subject(self.subject, '2023-2024', 'first').count, 0)
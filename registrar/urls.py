@@ -11,4 +11,5 @@ urlpatterns = [
     path('waitlist/<int:subject_id>/', views.handle_waitlist, name='handle_waitlist'),
     path('waitlists/', views.handle_waitlists, name='handle_waitlists'),
     path('generate-transcripts/', views.generate_transcripts, name='generate_transcripts'),
+    path('generate-transcripts/bulk/', views.bulk_transcripts, name='bulk_transcripts'),
 ]
\ No newline at end of file
@@ -1,31 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from users.decorators import registrar_required
 from users.models import User, StudentProfile
 from subjects.models import Subject, Enrollment
-from ranks.models import Grade, calculate_student_average
+from subjects.seats import save_holding_seat, seat_map
+from subjects.schedule import invalidate_schedule_index
+from ranks.models import Grade
+from ranks.standings import current_standing
+from reports.exports import iter_values, stream_csv
 from teachers.views import enroll_students_for_subject
 from django.db.utils import OperationalError
 from django.db.models import Count, Q
 from notifications.models import Notification
-from django.core.mail import send_mail
-from django.conf import settings
-import csv
-import io
-# ReportLab is an optional dependency used to generate PDF transcripts.
-# Import it lazily; if it's missing, set a flag so the rest of the app
-# (and migrations) can continue to run without ReportLab installed.
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False
+from notifications.outbox import queue_email
+from reports.transcripts import (
+    REPORTLAB_AVAILABLE, cohort_transcripts, render_transcript_pdf, transcript_data, transcript_zip,
+)
 
 @registrar_required
 def registrar_dashboard(request):
@@ -33,17 +24,11 @@ def registrar_dashboard(request):
     total_students = User.objects.filter(role='student', is_approved=True).count()
     total_subjects = Subject.objects.filter(is_active=True).count()
     
-    # Get unread notifications for the registrar
-    from notifications.models import Notification
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    
+    # unread_notifications / unread_count come from the notifications context processor
     context = {
         'pending_enrollments': pending_enrollments,
         'total_students': total_students,
         'total_subjects': total_subjects,
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
     }
     return render(request, 'registrar/registrar_dashboard.html', context)
 
@@ -53,11 +38,13 @@ def approve_registrations(request):
     waitlisted_enrollments = list(Enrollment.objects.filter(status='waitlisted').select_related('student', 'subject'))
 
     # Precompute current enrollment counts for template use (templates can't call methods with args)
-    for enrollment in pending_enrollments + waitlisted_enrollments:
-        try:
-            enrollment.current_count = enrollment.subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-        except Exception:
-            enrollment.current_count = 0
+    listed = pending_enrollments + waitlisted_enrollments
+    try:
+        taken = seat_map({e.subject_id for e in listed})
+    except Exception:
+        taken = {}
+    for enrollment in listed:
+        enrollment.current_count = taken.get((enrollment.subject_id, enrollment.academic_year, enrollment.semester), 0)
     
     if request.method == 'POST':
         enrollment_id = request.POST.get('enrollment_id')
@@ -65,15 +52,13 @@ def approve_registrations(request):
         enrollment = get_object_or_404(Enrollment, id=enrollment_id)
         
         if action == 'approve':
-            # Check if subject has capacity
-            subject = enrollment.subject
-            current_count = subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-            if current_count < subject.max_capacity:
-                enrollment.status = 'approved'
+            # Approve only if a seat can be reserved; otherwise waitlist
+            enrollment.status = 'approved'
+            if save_holding_seat(enrollment):
                 messages.success(request, f'Enrollment approved for {enrollment.student.username}.')
-            else:
-                enrollment.status = 'waitlisted'
-                messages.warning(request, 'Subject is full. Student added to waitlist.')
+                return redirect('approve_registrations')
+            enrollment.status = 'waitlisted'
+            messages.warning(request, 'Subject is full. Student added to waitlist.')
         elif action == 'reject':
             enrollment.status = 'rejected'
             messages.success(request, f'Enrollment rejected for {enrollment.student.username}.')
@@ -96,7 +81,18 @@ def approve_registrations(request):
 def manage_academic_records(request):
     students = User.objects.filter(role='student', is_approved=True).select_related('studentprofile')
     selected_student_id = request.GET.get('student_id')
+    lookup = request.GET.get('lookup', '').strip()
     
+    if lookup and not selected_student_id:
+        # Student ID, email or username typed by the registrar
+        from students.lookup import resolve_student
+        found = resolve_student(lookup, students_only=True)
+        if found is None:
+            from django.contrib import messages
+            messages.error(request, f'No student found matching "{lookup}".')
+        else:
+            selected_student_id = found.id
+
     if selected_student_id:
         student = get_object_or_404(User, id=selected_student_id, role='student')
         enrollments = Enrollment.objects.filter(student=student).select_related('subject')
@@ -116,6 +112,7 @@ def manage_academic_records(request):
         'selected_student': student,
         'enrollments': enrollments,
         'grades': grades,
+        'lookup': lookup,
     }
     return render(request, 'registrar/academic_records.html', context)
 
@@ -147,10 +144,8 @@ def handle_waitlist(request, subject_id):
         
         if action == 'approve':
             enrollment = get_object_or_404(Enrollment, id=enrollment_id)
-            current_count = subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-            if current_count < subject.max_capacity:
-                enrollment.status = 'approved'
-                enrollment.save()
+            enrollment.status = 'approved'
+            if save_holding_seat(enrollment):
                 messages.success(request, 'Student approved from waitlist.')
             else:
                 messages.error(request, 'Subject is at full capacity.')
@@ -213,38 +208,9 @@ def generate_transcripts(request):
             else:
                 numeric_average = None
             
-            # Calculate student rank among peers in same grade level
-            try:
-                if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-                    peers = User.objects.filter(
-                        role='student', 
-                        is_approved=True,
-                        studentprofile__grade_level=student.studentprofile.grade_level
-                    )
-                    peer_averages = []
-                    for peer in peers:
-                        try:
-                            avg = calculate_student_average(peer) or 0
-                            peer_averages.append((peer.id, avg))
-                        except Exception:
-                            pass
-                    
-                    peer_averages.sort(key=lambda x: x[1], reverse=True)
-                    rank = 0
-                    last_score = None
-                    idx = 0
-                    for pid, avg in peer_averages:
-                        idx += 1
-                        if avg == last_score:
-                            pass  # same rank
-                        else:
-                            rank = idx
-                            last_score = avg
-                        if pid == student.id:
-                            student_rank = rank
-                            break
-            except Exception:
-                student_rank = None
+            # Student rank is read from the materialized class standing
+            standing = current_standing(student)
+            student_rank = standing.rank if standing is not None else None
                 
         except OperationalError:
             from django.contrib import messages
@@ -274,6 +240,29 @@ def generate_transcripts(request):
     return render(request, 'registrar/generate_transcripts.html', context)
 
 
+@registrar_required
+def bulk_transcripts(request):
+    """Every transcript of one grade level and term, streamed as a ZIP archive."""
+    grade_level = request.GET.get('grade_level', '')
+    academic_year = request.GET.get('academic_year', '')
+    semester = request.GET.get('semester', '')
+    if not (grade_level.isdigit() and academic_year and semester):
+        messages.error(request, 'Choose a grade level, academic year and semester to download all transcripts.')
+        return redirect('generate_transcripts')
+    if not REPORTLAB_AVAILABLE:
+        return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
+
+    transcripts = cohort_transcripts(int(grade_level), academic_year, semester)
+    if not transcripts:
+        messages.info(request, 'No students are enrolled for that grade level and term.')
+        return redirect('generate_transcripts')
+
+    response = StreamingHttpResponse(transcript_zip(transcripts), content_type='application/zip')
+    filename = f"grade{grade_level}_{academic_year}_{semester}_transcripts.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @registrar_required
 def assign_subjects_to_teacher(request):
     """Registrar view: assign subjects to a teacher.
@@ -353,7 +342,9 @@ def assign_subjects_to_teacher(request):
             subj.save()
             try:
                 # auto-enroll students for provided academic_year/semester
-                enroll_students_for_subject(subj, academic_year=post_academic_year, semester=post_semester, status='approved')
+                result = enroll_students_for_subject(subj, academic_year=post_academic_year, semester=post_semester, status='approved')
+                if result.enrolled or result.failures:
+                    messages.info(request, f'{subj.code}: {result.created} enrolled, {result.promoted} promoted, {result.skipped} skipped.')
             except Exception:
                 pass
 
@@ -368,18 +359,13 @@ def assign_subjects_to_teacher(request):
             except Exception:
                 pass
 
-            # send an email to the teacher (best-effort)
-            try:
-                if teacher_user.email:
-                    send_mail(
-                        subject=f'Subject assigned: {subj.code}',
-                        message=f'Hello {teacher_user.get_full_name() or teacher_user.username},\n\nYou have been assigned to teach {subj.name} ({subj.code}) for {post_academic_year} - {post_semester}.\n\nPlease login to the system to view your classes and enter results.\n',
-                        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
-                        recipient_list=[teacher_user.email],
-                        fail_silently=True,
-                    )
-            except Exception:
-                pass
+            # queue an email to the teacher; the outbox worker delivers it
+            if teacher_user.email:
+                queue_email(
+                    f'Subject assigned: {subj.code}',
+                    f'Hello {teacher_user.get_full_name() or teacher_user.username},\n\nYou have been assigned to teach {subj.name} ({subj.code}) for {post_academic_year} - {post_semester}.\n\nPlease login to the system to view your classes and enter results.\n',
+                    [teacher_user.email],
+                )
 
             assigned += 1
 
@@ -461,6 +447,8 @@ def unassign_subject_from_teacher(request, subject_id=None):
 
         subjects_qs = Subject.objects.filter(instructor=teacher_obj)
         count = subjects_qs.update(instructor=None, assigned_by_registrar=False)
+        # QuerySet.update skips the post_save handler that refreshes the schedule index
+        invalidate_schedule_index()
         messages.success(request, f'Unassigned {count} subject(s) from {teacher_user.get_full_name()}.')
         return redirect('assign_subjects_to_teacher')
 
@@ -468,196 +456,51 @@ def unassign_subject_from_teacher(request, subject_id=None):
     return redirect('assign_subjects_to_teacher')
 
 def generate_csv_transcript(student, grades):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{student.username}_transcript.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Student ID', 'Name', 'Course', 'Result (out of 100)'])
-    
-    total_result = 0.0
-    graded_count = 0
+    student_number = student.studentprofile.student_id
+    name = student.get_full_name()
     
-    for grade in grades:
-        score = grade.score if grade.score is not None else None
-        if score is not None:
-            total_result += score
-            graded_count += 1
+    def rows():
+        yield ['Student ID', 'Name', 'Course', 'Result (out of 100)']
         
-        writer.writerow([
-            student.studentprofile.student_id,
-            student.get_full_name(),
-            grade.subject.name,
-            int(score) if score is not None else 'N/A'
-        ])
-    
-    # Add summary rows
-    writer.writerow([])  # Empty row
-    writer.writerow(['Total Result', int(total_result) if total_result > 0 else 'N/A'])
-    numeric_average = total_result / graded_count if graded_count > 0 else None
-    writer.writerow(['Average Result', f"{numeric_average:.1f} / 100" if numeric_average else 'N/A'])
-    
-    # Calculate student rank
-    student_rank = None
-    try:
-        if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-            peers = User.objects.filter(
-                role='student', 
-                is_approved=True,
-                studentprofile__grade_level=student.studentprofile.grade_level
-            )
-            peer_averages = []
-            for peer in peers:
-                try:
-                    avg = calculate_student_average(peer) or 0
-                    peer_averages.append((peer.id, avg))
-                except Exception:
-                    pass
-            
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            rank = 0
-            last_score = None
-            idx = 0
-            for pid, avg in peer_averages:
-                idx += 1
-                if avg == last_score:
-                    pass
-                else:
-                    rank = idx
-                    last_score = avg
-                if pid == student.id:
-                    student_rank = rank
-                    break
-    except Exception:
-        pass
-    
-    writer.writerow(['Class Rank', f"#{student_rank}" if student_rank else 'N/A'])
-    
-    return response
-
-def generate_pdf_transcript(student, grades):
-    """Generate PDF transcript using ReportLab"""
-    if not REPORTLAB_AVAILABLE:
-        return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        alignment=1,  # Center alignment
-        spaceAfter=30
-    )
-    story.append(Paragraph("ACADEMIC TRANSCRIPT", title_style))
-    
-    # Student Information
-    student_info = f"""
-    <b>Student Name:</b> {student.get_full_name() or student.username}<br/>
-    <b>Student ID:</b> {getattr(student.studentprofile, 'student_id', 'N/A')}<br/>
-    <b>Grade Level:</b> Grade {getattr(student.studentprofile, 'grade_level', 'N/A')}<br/>
-    <b>Generated Date:</b> {timezone.now().strftime('%Y-%m-%d')}
-    """
-    story.append(Paragraph(student_info, styles["Normal"]))
-    story.append(Spacer(1, 20))
-    
-    # Grades Table
-    if grades:
-        data = [['Course', 'Result (out of 100)']]
         total_result = 0.0
         graded_count = 0
         
-        for grade in grades:
-            score = grade.score if grade.score is not None else None
+        subject_scores = iter_values(grades, 'subject__name', 'score') if hasattr(grades, 'values_list') else []
+        for subject_name, score in subject_scores:
             if score is not None:
                 total_result += score
                 graded_count += 1
             
-            data.append([
-                grade.subject.name,
-                str(int(score)) if score is not None else 'N/A'
-            ])
+            yield [student_number, name, subject_name, int(score) if score is not None else 'N/A']
         
-        # Create table
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(table)
-        story.append(Spacer(1, 20))
-        
-        # Calculate average
+        # Add summary rows
+        yield []  # Empty row
+        yield ['Total Result', int(total_result) if total_result > 0 else 'N/A']
         numeric_average = total_result / graded_count if graded_count > 0 else None
+        yield ['Average Result', f"{numeric_average:.1f} / 100" if numeric_average else 'N/A']
         
-        # Calculate student rank
-        student_rank = None
-        try:
-            if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-                peers = User.objects.filter(
-                    role='student', 
-                    is_approved=True,
-                    studentprofile__grade_level=student.studentprofile.grade_level
-                )
-                peer_averages = []
-                for peer in peers:
-                    try:
-                        avg = calculate_student_average(peer) or 0
-                        peer_averages.append((peer.id, avg))
-                    except Exception:
-                        pass
-                
-                peer_averages.sort(key=lambda x: x[1], reverse=True)
-                rank = 0
-                last_score = None
-                idx = 0
-                for pid, avg in peer_averages:
-                    idx += 1
-                    if avg == last_score:
-                        pass
-                    else:
-                        rank = idx
-                        last_score = avg
-                    if pid == student.id:
-                        student_rank = rank
-                        break
-        except Exception:
-            pass
-        
-        # Summary Section
-        summary_data = [
-            ['Total Result', str(int(total_result)) if total_result > 0 else 'N/A'],
-            ['Average Result', f"{numeric_average:.1f} / 100" if numeric_average else 'N/A'],
-            ['Class Rank', f"#{student_rank}" if student_rank else 'N/A']
-        ]
+        # Student rank from the materialized class standing
+        standing = current_standing(student)
+        student_rank = standing.rank if standing is not None else None
         
-        summary_table = Table(summary_data)
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey, colors.white])
-        ]))
-        story.append(summary_table)
-    else:
-        story.append(Paragraph("No grades available.", styles["Normal"]))
+        yield ['Class Rank', f"#{student_rank}" if student_rank else 'N/A']
     
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    response = HttpResponse(buffer, content_type='application/pdf')
+    return stream_csv(f"{student.username}_transcript.csv", rows())
+
+def generate_pdf_transcript(student, grades):
+    """Generate PDF transcript using ReportLab"""
+    if not REPORTLAB_AVAILABLE:
+        return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
+
+    # Student rank from the materialized class standing
+    standing = current_standing(student)
+    data = transcript_data(
+        student,
+        getattr(student, 'studentprofile', None),
+        [(grade.subject.name, grade.score) for grade in grades],
+        standing.rank if standing is not None else None,
+    )
+    response = HttpResponse(render_transcript_pdf(data), content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="{student.username}_transcript.pdf"'
     return response
 
@@ -0,0 +1,98 @@
+"""Datasets behind the admin reports.
+
+``report_sections`` returns ``(filename_base, title, sections)`` where each
+section is ``{'title', 'headers', 'rows'}`` -- the context the
+``admin/report_pdf.html`` template renders. Rows are generators over
+``values_list`` projections, so the same builders feed the streaming CSV
+download and the background PDF jobs without loading model instances.
+"""
+import datetime
+
+from django.db.models import Count
+
+from ranks.models import Grade
+from users.models import User
+
+from .exports import blank, full_name, iter_values
+
+PERFORMANCE_HEADERS = ['Student', 'Subject', 'Quiz', 'Mid', 'Assignment', 'Final', 'Total', 'Remarks', 'Graded At']
+
+REPORT_TITLES = {
+    'user_breakdown': 'User Role Breakdown',
+    'student_performance': 'Student Performance',
+    'all_reports': 'All Reports',
+}
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def performance_rows(grades_qs, iso_dates=False):
+    """Yield student performance rows from a projection of ``grades_qs``
+    (no Grade/User/Subject instances are built)."""
+    fields = ('student__first_name', 'student__last_name', 'student__username', 'subject__code',
+              'quiz_score', 'mid_score', 'assignment_score', 'final_exam_score', 'score', 'remarks', 'graded_at')
+    for first, last, username, code, quiz, mid, assignment, final, score, remarks, graded_at in iter_values(grades_qs, *fields):
+        if graded_at:
+            graded_at = graded_at.isoformat() if iso_dates else graded_at.strftime('%Y-%m-%d %H:%M')
+        yield [
+            full_name(first, last, username), code,
+            blank(quiz), blank(mid), blank(assignment), blank(final), blank(score), remarks or '',
+            graded_at or '',
+        ]
+
+
+def user_breakdown_rows():
+    for role, count in User.objects.values('role').annotate(count=Count('id')).order_by('role').values_list('role', 'count'):
+        yield [role or 'Unknown', count]
+
+
+def fee_collection_rows():
+    try:
+        from payments.models import Payment
+        yield ['Total payments', Payment.objects.count()]
+    except Exception:
+        yield ['Note', 'Fee collection report not implemented']
+
+
+def performance_queryset(params):
+    grades_qs = Grade.objects.order_by('id')
+    date_from = parse_date(params.get('date_from'))
+    date_to = parse_date(params.get('date_to'))
+    if date_from:
+        grades_qs = grades_qs.filter(graded_at__gte=date_from)
+    if date_to:
+        grades_qs = grades_qs.filter(graded_at__lte=date_to)
+    return grades_qs
+
+
+def report_sections(report_type, params=None, iso_dates=False):
+    """Return (filename_base, title, sections) for ``report_type``."""
+    params = params or {}
+    if report_type == 'user_breakdown':
+        sections = [{'title': REPORT_TITLES[report_type], 'headers': ['Role', 'Count'], 'rows': user_breakdown_rows()}]
+    elif report_type == 'student_performance':
+        sections = [{
+            'title': REPORT_TITLES[report_type],
+            'headers': PERFORMANCE_HEADERS,
+            'rows': performance_rows(performance_queryset(params), iso_dates=iso_dates),
+        }]
+    elif report_type == 'all_reports':
+        sections = [
+            {'title': 'User Role Breakdown', 'headers': ['Role', 'Count'], 'rows': user_breakdown_rows()},
+            {'title': 'Student Performance', 'headers': PERFORMANCE_HEADERS,
+             'rows': performance_rows(Grade.objects.order_by('id'), iso_dates=iso_dates)},
+            {'title': 'Fee Collection Summary', 'headers': ['Metric', 'Value'], 'rows': fee_collection_rows()},
+        ]
+    else:
+        return f'report_{report_type or "unknown"}', 'Report Not Implemented', [{
+            'title': 'Notice', 'headers': ['Message'],
+            'rows': iter([[f'Report type "{report_type}" is not implemented yet.']]),
+        }]
+    return report_type, REPORT_TITLES[report_type], sections
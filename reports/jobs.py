@@ -0,0 +1,140 @@
+"""Background report jobs.
+
+``request_report`` records a ``ReportJob`` (or hands back a matching one that
+is queued, running or fresh) and returns immediately. ``run_pending`` -- the
+``run_report_jobs`` command -- gathers each job's data, renders the HTML, and
+converts it to PDF in a process pool so several reports render in parallel
+without blocking the database work. Finished files are stored under
+``MEDIA_ROOT/reports/`` by content hash, so identical output is kept once.
+
+A job left 'running' for longer than ``REPORT_JOB_TIMEOUT_SECONDS`` belongs to
+a worker that died; it is no longer handed out and the next ``run_pending``
+queues it again.
+"""
+import datetime
+import hashlib
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .builders import report_sections
+from .models import ReportJob
+from .rendering import html_to_pdf
+
+def params_hash(report_type, params):
+    payload = json.dumps({'type': report_type, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _stale_before():
+    return timezone.now() - datetime.timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT_SECONDS', 1800))
+
+
+def request_report(report_type, params, user=None):
+    """Return a job for these parameters, reusing one that is still pending or
+    finished within ``REPORT_FRESHNESS_SECONDS``."""
+    params = {key: value for key, value in (params or {}).items() if value not in (None, '')}
+    digest = params_hash(report_type, params)
+    fresh_since = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'REPORT_FRESHNESS_SECONDS', 600))
+    existing = ReportJob.objects.filter(params_hash=digest).filter(
+        Q(status='queued')
+        | Q(status='running', started_at__gte=_stale_before())
+        | Q(status='done', finished_at__gte=fresh_since)
+    ).order_by('-created_at', '-id').first()
+    if existing is not None:
+        return existing
+    return ReportJob.objects.create(report_type=report_type, params=params, params_hash=digest, requested_by=user)
+
+
+def render_html(job):
+    """Gather the job's data and render it; returns (filename_base, html)."""
+    filename_base, title, sections = report_sections(job.report_type, job.params)
+    for section in sections:
+        section['rows'] = list(section['rows'])
+    return filename_base, render_to_string('admin/report_pdf.html', {'title': title, 'sections': sections})
+
+
+def _store(job, filename_base, content, content_type, ext):
+    content_hash = hashlib.sha256(content).hexdigest()
+    path = f'reports/{content_hash}.{ext}'
+    if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(content))
+    job.file.name = path
+    job.content_hash = content_hash
+    job.content_type = content_type
+    job.filename = f'{filename_base}.{ext}'
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'content_hash', 'content_type', 'filename', 'status', 'finished_at'])
+
+
+def _fail(job, error):
+    job.status = 'failed'
+    job.error = str(error)[:2000]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def requeue_stale():
+    """Queue again the jobs whose worker stopped before finishing them; returns
+    how many were requeued."""
+    return ReportJob.objects.filter(status='running', started_at__lt=_stale_before()).update(
+        status='queued', started_at=None,
+    )
+
+
+def _queued_ids(limit):
+    return list(ReportJob.objects.filter(status='queued').order_by('created_at', 'id').values_list('id', flat=True)[:limit])
+
+
+def _claim(limit):
+    """Take up to ``limit`` queued jobs for this worker; of several workers
+    that read the same ids, only the one whose token landed on a job gets it."""
+    ids = _queued_ids(limit)
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    ReportJob.objects.filter(id__in=ids, status='queued').update(status='running', started_at=timezone.now(), claim_token=token)
+    return list(ReportJob.objects.filter(claim_token=token, status='running').order_by('created_at', 'id'))
+
+
+def run_pending(limit=10, workers=None):
+    """Render up to ``limit`` queued jobs. ``workers`` sets the process pool
+    size (``REPORT_WORKERS`` by default); 0 renders in this process.
+    Returns the number of jobs finished (done or failed)."""
+    requeue_stale()
+    jobs = _claim(limit)
+    if not jobs:
+        return 0
+    if workers is None:
+        workers = getattr(settings, 'REPORT_WORKERS', 2)
+
+    rendered = []
+    for job in jobs:
+        try:
+            rendered.append((job, *render_html(job)))
+        except Exception as e:
+            _fail(job, e)
+
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(job, name, pool.submit(html_to_pdf, html)) for job, name, html in rendered]
+            for job, name, future in futures:
+                try:
+                    _store(job, name, *future.result())
+                except Exception as e:
+                    _fail(job, e)
+    else:
+        for job, name, html in rendered:
+            try:
+                _store(job, name, *html_to_pdf(html))
+            except Exception as e:
+                _fail(job, e)
+    return len(jobs)
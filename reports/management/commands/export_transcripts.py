@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.transcripts import REPORTLAB_AVAILABLE, cohort_transcripts, transcript_zip
+
+
+class Command(BaseCommand):
+    help = 'Write every transcript of a grade level and term to a ZIP archive (PDFs render in a process pool).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('grade_level', type=int)
+        parser.add_argument('academic_year', help='e.g. 2024-2025')
+        parser.add_argument('semester', choices=['first', 'second'])
+        parser.add_argument('--output', help='Archive path (default: grade<N>_<year>_<semester>_transcripts.zip)')
+        parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: REPORT_WORKERS)')
+
+    def handle(self, *args, **options):
+        if not REPORTLAB_AVAILABLE:
+            raise CommandError('PDF generation requires ReportLab. Install with `pip install reportlab`.')
+        grade_level, academic_year, semester = options['grade_level'], options['academic_year'], options['semester']
+        transcripts = cohort_transcripts(grade_level, academic_year, semester)
+        if not transcripts:
+            raise CommandError(f'No students enrolled in Grade {grade_level} for {academic_year} {semester}.')
+
+        output = options['output'] or f'grade{grade_level}_{academic_year}_{semester}_transcripts.zip'
+        with open(output, 'wb') as archive:
+            for chunk in transcript_zip(transcripts, workers=options['workers']):
+                archive.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(transcripts)} transcript(s) to {output}'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reports.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Render queued report jobs (PDF conversion runs in a process pool) and store the files under MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: REPORT_WORKERS)')
+        parser.add_argument('--limit', type=int, default=10, help='Jobs to claim per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs instead of exiting when idle')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            finished = run_pending(limit=options['limit'], workers=options['workers'])
+            total += finished
+            if finished:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Finished {total} report job(s)'))
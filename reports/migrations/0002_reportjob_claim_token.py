@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='claim_token',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
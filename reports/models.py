@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import models
+
+
+class ReportJob(models.Model):
+    """A report rendered in the background by the ``run_report_jobs`` worker.
+
+    Jobs with the same ``params_hash`` share artifacts: a request for a report
+    that is already queued, running, or finished within the freshness window
+    gets the existing job back instead of a new one.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    report_type = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    params_hash = models.CharField(max_length=64)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    file = models.FileField(upload_to='reports/', blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    filename = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # set by the claiming worker; it renders only the jobs carrying its token
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['params_hash', 'status', 'finished_at'], name='reports_job_reuse_idx'),
+            models.Index(fields=['status', 'created_at'], name='reports_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.report_type} #{self.pk} ({self.status})"
@@ -0,0 +1,28 @@
+"""HTML to PDF conversion, run inside the report worker's process pool.
+
+WeasyPrint is preferred, then xhtml2pdf; without either the HTML itself is
+stored so the report can still be previewed.
+"""
+import io
+
+try:
+    from weasyprint import HTML
+except Exception:
+    HTML = None
+try:
+    from xhtml2pdf import pisa
+except Exception:
+    pisa = None
+
+
+def html_to_pdf(html):
+    """Return (content bytes, content type, file extension)."""
+    if HTML is not None:
+        return HTML(string=html).write_pdf(), 'application/pdf', 'pdf'
+    if pisa is not None:
+        out = io.BytesIO()
+        status = pisa.CreatePDF(io.StringIO(html), dest=out)
+        if status.err:
+            raise RuntimeError('Error generating PDF')
+        return out.getvalue(), 'application/pdf', 'pdf'
+    return html.encode('utf-8'), 'text/html', 'html'
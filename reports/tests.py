@@ -0,0 +1,144 @@
+import datetime
+import io
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ranks.models import Grade
+from subjects.models import Enrollment
+from subjects.models import Subject
+from users.models import StudentProfile, User
+from reports.exports import stream_csv
+from reports.jobs import _claim, _queued_ids, request_report, requeue_stale, run_pending
+from reports.models import ReportJob
+from reports.transcripts import REPORTLAB_AVAILABLE, cohort_transcripts, transcript_zip
+
+
+def _body(response):
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+class StreamingExportTests(TestCase):
+    def test_sections_are_written_row_by_row(self):
+        response = stream_csv('x.csv', [['a', 'b']], iter([[1, 'x,y']]), None, [['c']])
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="x.csv"')
+        self.assertEqual(_body(response), 'a,b\r\n1,"x,y"\r\n\r\nc\r\n')
+
+    def test_admin_performance_report_streams_csv(self):
+        admin = User.objects.create_user(username='rep_admin', password='pass', role='admin')
+        student = User.objects.create_user(username='rep_student', password='pass', role='student', first_name='Ada', last_name='L')
+        subject = Subject.objects.create(name='Maths', code='MTH3', grade_level=3)
+        Grade.objects.create(student=student, subject=subject, score=91, quiz_score=4)
+
+        self.client.force_login(admin)
+        response = self.client.get(reverse('generate_report_download'), {'type': 'student_performance', 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        lines = _body(response).splitlines()
+        self.assertEqual(lines[0], 'Student,Subject,Quiz,Mid,Assignment,Final,Total,Remarks,Graded At')
+        self.assertTrue(lines[1].startswith('Ada L,MTH3,4,,,,91,,'))
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.admin = User.objects.create_user(username='job_admin', password='pass', role='admin')
+
+    def test_matching_request_reuses_job(self):
+        first = request_report('user_breakdown', {'start': '', 'end': None}, self.admin)
+        second = request_report('user_breakdown', {}, self.admin)
+        self.assertEqual(first.pk, second.pk)
+        self.assertNotEqual(request_report('fee_collection', {}, self.admin).pk, first.pk)
+
+    def test_stale_running_job_is_not_reused_and_gets_requeued(self):
+        job = request_report('user_breakdown', {}, self.admin)
+        ReportJob.objects.filter(pk=job.pk).update(
+            status='running', started_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        with override_settings(REPORT_JOB_TIMEOUT_SECONDS=600):
+            self.assertNotEqual(request_report('user_breakdown', {}, self.admin).pk, job.pk)
+            self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertIsNone(job.started_at)
+
+    def test_two_workers_reading_the_same_jobs_claim_each_once(self):
+        request_report('user_breakdown', {}, self.admin)
+        request_report('fee_collection', {}, self.admin)
+        ids = _queued_ids(10)
+        # both workers read the queue before either one claimed it
+        with mock.patch('reports.jobs._queued_ids', return_value=ids):
+            self.assertEqual([job.pk for job in _claim(10)], ids)
+            self.assertEqual(_claim(10), [])
+
+    def test_pdf_request_queues_job_and_worker_renders_it(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('generate_report_download'), {'type': 'user_breakdown', 'format': 'pdf'},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(response.json()['status'], 'queued')
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(run_pending(workers=0), 1)
+            job = ReportJob.objects.get(pk=job_id)
+            self.assertEqual(job.status, 'done', job.error)
+            self.assertTrue(job.filename.startswith('user_breakdown'))
+
+            status = self.client.get(reverse('report_job_status', args=[job_id]), {'format': 'json'}).json()
+            self.assertEqual(status['download_url'], reverse('report_job_download', args=[job_id]))
+            download = self.client.get(status['download_url'])
+            self.assertEqual(download.status_code, 200)
+            self.assertTrue(b''.join(download.streaming_content))
+            download.close()
+
+        # a fresh finished job is handed back instead of rendering again
+        self.assertEqual(request_report('user_breakdown', {}, self.admin).pk, job_id)
+
+
+class BulkTranscriptTests(TestCase):
+    def setUp(self):
+        self.maths = Subject.objects.create(name='Maths', code='MTH6', grade_level=6)
+        self.art = Subject.objects.create(name='Art', code='ART6', grade_level=6)
+        self.students = []
+        for idx, score in enumerate([70, 90, 90]):
+            user = User.objects.create_user(username=f'cohort{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'C{idx:04d}', grade_level=6)
+            Enrollment.objects.create(student=user, subject=self.maths, academic_year='2024-2025', semester='first')
+            Grade.objects.create(student=user, subject=self.maths, score=score)
+            self.students.append(user)
+        # a grade from another term is left off the transcript
+        Enrollment.objects.create(student=self.students[0], subject=self.art, academic_year='2023-2024', semester='first')
+        Grade.objects.create(student=self.students[0], subject=self.art, score=99)
+
+    def test_cohort_is_loaded_and_ranked_in_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(4):
+            transcripts = cohort_transcripts(6, '2024-2025', 'first')
+        self.assertEqual([t['username'] for t in transcripts], ['cohort0', 'cohort1', 'cohort2'])
+        self.assertEqual(transcripts[0]['scores'], [('Maths', 70)])
+        self.assertEqual(transcripts[0]['average'], 70.0)
+        self.assertEqual([t['rank'] for t in transcripts], [3, 1, 1])
+        self.assertEqual(cohort_transcripts(6, '2024-2025', 'second'), [])
+
+    def test_bulk_endpoint_requires_a_complete_term(self):
+        registrar = User.objects.create_user(username='bulk_registrar', password='pass', role='registrar')
+        self.client.force_login(registrar)
+        response = self.client.get(reverse('bulk_transcripts'), {'grade_level': '6'})
+        self.assertRedirects(response, reverse('generate_transcripts'), fetch_redirect_response=False)
+
+    @unittest.skipUnless(REPORTLAB_AVAILABLE, 'ReportLab is not installed')
+    def test_zip_contains_one_pdf_per_student(self):
+        archive = b''.join(transcript_zip(cohort_transcripts(6, '2024-2025', 'first'), workers=0))
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            self.assertEqual(zf.namelist(), [f'cohort{idx}_transcript.pdf' for idx in range(3)])
+            self.assertTrue(zf.read('cohort0_transcript.pdf').startswith(b'%PDF'))
@@ -0,0 +1,203 @@
+"""Transcript PDFs, one student or a whole grade level at a time.
+
+``cohort_transcripts`` loads every grade of a grade level's term in one query
+and reads the class ranks from the materialized ``ClassStanding`` rows once,
+producing plain dicts. ``transcript_zip`` hands those dicts to a process pool
+(ReportLab rendering is CPU bound) and streams the PDFs out as a ZIP archive
+while the remaining ones are still being rendered.
+"""
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+# ReportLab is an optional dependency used to generate PDF transcripts.
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    REPORTLAB_AVAILABLE = True
+except Exception:
+    REPORTLAB_AVAILABLE = False
+
+
+def transcript_data(student, profile, scores, rank, generated=None):
+    """Everything a transcript shows, as plain (picklable) values.
+
+    ``scores`` is a list of (subject name, score or None).
+    """
+    graded = [score for _, score in scores if score is not None]
+    total = float(sum(graded))
+    return {
+        'username': student.username,
+        'name': student.get_full_name() or student.username,
+        'student_id': getattr(profile, 'student_id', None) or 'N/A',
+        'grade_level': getattr(profile, 'grade_level', None) or 'N/A',
+        'generated': (generated or timezone.now()).strftime('%Y-%m-%d'),
+        'scores': scores,
+        'total': total,
+        'average': total / len(graded) if graded else None,
+        'rank': rank,
+    }
+
+
+def render_transcript_pdf(data):
+    """Build the transcript PDF for ``transcript_data`` output; returns bytes.
+
+    Runs in the worker processes of ``transcript_zip``, so it must not touch
+    the database.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], alignment=1, spaceAfter=30)
+    story.append(Paragraph("ACADEMIC TRANSCRIPT", title_style))
+
+    student_info = f"""
+    <b>Student Name:</b> {data['name']}<br/>
+    <b>Student ID:</b> {data['student_id']}<br/>
+    <b>Grade Level:</b> Grade {data['grade_level']}<br/>
+    <b>Generated Date:</b> {data['generated']}
+    """
+    story.append(Paragraph(student_info, styles["Normal"]))
+    story.append(Spacer(1, 20))
+
+    if data['scores']:
+        table_data = [['Course', 'Result (out of 100)']]
+        for subject_name, score in data['scores']:
+            table_data.append([subject_name, str(int(score)) if score is not None else 'N/A'])
+        table = Table(table_data)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(table)
+        story.append(Spacer(1, 20))
+
+        summary_data = [
+            ['Total Result', str(int(data['total'])) if data['total'] > 0 else 'N/A'],
+            ['Average Result', f"{data['average']:.1f} / 100" if data['average'] else 'N/A'],
+            ['Class Rank', f"#{data['rank']}" if data['rank'] else 'N/A']
+        ]
+        summary_table = Table(summary_data)
+        summary_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey, colors.white])
+        ]))
+        story.append(summary_table)
+    else:
+        story.append(Paragraph("No grades available.", styles["Normal"]))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def cohort_transcripts(grade_level, academic_year, semester):
+    """Transcript data for every approved student of ``grade_level`` enrolled
+    in the term, ordered by username.
+
+    Grades are limited to the subjects each student takes that term; ranks come
+    from the cohort's ``ClassStanding`` rows.
+    """
+    from ranks.models import ClassStanding, Grade
+    from subjects.models import Enrollment
+    from users.models import User
+
+    students = list(
+        User.objects.filter(
+            role='student', is_approved=True, studentprofile__grade_level=grade_level,
+            subject_enrollments__academic_year=academic_year, subject_enrollments__semester=semester,
+        ).distinct().select_related('studentprofile').order_by('username')
+    )
+    if not students:
+        return []
+    student_ids = [student.id for student in students]
+
+    taken = set(
+        Enrollment.objects.filter(student_id__in=student_ids, academic_year=academic_year, semester=semester)
+        .values_list('student_id', 'subject_id')
+    )
+    scores = {}
+    for student_id, subject_id, subject_name, score in (
+        Grade.objects.filter(student_id__in=student_ids).order_by('student_id', 'subject__name')
+        .values_list('student_id', 'subject_id', 'subject__name', 'score')
+    ):
+        if (student_id, subject_id) in taken:
+            scores.setdefault(student_id, []).append((subject_name, score))
+    ranks = dict(
+        ClassStanding.objects.filter(grade_level=grade_level, academic_year=academic_year, semester=semester)
+        .values_list('student_id', 'rank')
+    )
+
+    generated = timezone.now()
+    return [
+        transcript_data(student, student.studentprofile, scores.get(student.id, []), ranks.get(student.id), generated)
+        for student in students
+    ]
+
+
+class _ZipBuffer(io.RawIOBase):
+    """Write-only sink that hands back whatever ``ZipFile`` wrote since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def transcript_zip(transcripts, workers=None):
+    """Yield a ZIP archive of ``{username}_transcript.pdf`` files, one member
+    at a time. ``workers`` sets the process pool size (``REPORT_WORKERS`` by
+    default); 0 renders in this process."""
+    if workers is None:
+        workers = getattr(settings, 'REPORT_WORKERS', 2)
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        if workers:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            pdfs = pool.map(render_transcript_pdf, transcripts, chunksize=8)
+        else:
+            pool = None
+            pdfs = map(render_transcript_pdf, transcripts)
+        try:
+            for data, pdf in zip(transcripts, pdfs):
+                archive.writestr(f"{data['username']}_transcript.pdf", pdf)
+                yield buffer.drain()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    yield buffer.drain()
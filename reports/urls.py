@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('jobs/<int:job_id>/', views.report_job_status, name='report_job_status'),
+    path('jobs/<int:job_id>/download/', views.report_job_download, name='report_job_download'),
+]
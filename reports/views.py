@@ -0,0 +1,34 @@
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+
+from users.decorators import admin_required
+from .models import ReportJob
+
+
+def job_payload(job):
+    return {
+        'job_id': job.id,
+        'report_type': job.report_type,
+        'status': job.status,
+        'error': job.error,
+        'status_url': reverse('report_job_status', args=[job.id]),
+        'download_url': reverse('report_job_download', args=[job.id]) if job.status == 'done' else None,
+    }
+
+
+@admin_required
+def report_job_status(request, job_id):
+    """Job status as JSON for polling, or a page that polls and starts the download."""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if request.GET.get('format') == 'json' or request.headers.get('Accept') == 'application/json':
+        return JsonResponse(job_payload(job))
+    return render(request, 'reports/job_status.html', {'job': job, 'payload': job_payload(job)})
+
+
+@admin_required
+def report_job_download(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, status='done')
+    if not job.file:
+        raise Http404('Report file is missing')
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename, content_type=job.content_type)
@@ -0,0 +1,59 @@
+"""Versioned cache for read-mostly catalog data.
+
+Subject lists, fee structures and study tips change a few times a term but
+are read on most pages. Each kind of data is a named catalog with a generation
+counter kept in the ``catalog`` cache; every cached entry's key includes the
+current generation, and the post_save/post_delete receivers of the owning app
+call ``bump()`` so the next read rebuilds the entry instead of serving a stale
+one. Old entries are never deleted, they simply stop being addressed and age
+out.
+
+The receivers live in ``subjects.signals``, ``payments.signals`` and
+``ai_advisor.signals``.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CATALOG_CACHE = 'catalog'
+GENERATION_KEY = 'catalog:{name}:generation'
+
+
+def catalog_cache():
+    """The ``catalog`` cache, or ``default`` when it is not configured."""
+    return caches[CATALOG_CACHE if CATALOG_CACHE in settings.CACHES else 'default']
+
+
+def generation(name):
+    return catalog_cache().get(GENERATION_KEY.format(name=name), 0)
+
+
+def bump(*names):
+    """Invalidate every cached entry of the named catalogs once the current
+    transaction commits (right away outside one), so a read racing the write
+    cannot cache the old rows under the new generation."""
+    transaction.on_commit(lambda: _bump(names))
+
+
+def _bump(names):
+    cache = catalog_cache()
+    for name in names:
+        key = GENERATION_KEY.format(name=name)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add() and incr()
+            cache.set(key, 1, None)
+
+
+def cached(name, key, build):
+    """``build()``'s result for ``key`` in catalog ``name``, built at most once
+    per generation. ``build`` must return a picklable value other than None."""
+    cache = catalog_cache()
+    full_key = f'catalog:{name}:{generation(name)}:{key}'
+    value = cache.get(full_key)
+    if value is None:
+        value = build()
+        cache.set(full_key, value)
+    return value
@@ -37,7 +37,8 @@ INSTALLED_APPS = [
     'ai_advisor',
     'teachers'
     ,
-    'finance'
+    'finance',
+    'reports',
 ]
 
 MIDDLEWARE = [
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.RoleProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.media',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'notifications.context_processors.unread_notifications',
             ],
         },
     },
@@ -232,4 +235,60 @@ SIMPLE_JWT = {
 # Which subject types should be auto-assigned to new students (e.g. 'core', 'elective')
 AUTO_ENROLL_SUBJECT_TYPES = ['core']
 # If True, the system will create Enrollment rows (status='pending') for auto-assigned subjects
-AUTO_CREATE_ENROLLMENTS = True
\ No newline at end of file
+AUTO_CREATE_ENROLLMENTS = True
+# Registration intake queue
+# If True, subject registration only queues the request; run
+# `python manage.py process_registration_queue --loop` to allocate seats
+REGISTRATION_INTAKE_MODE = False
+# a request still 'processing' after this is assumed lost and queued again
+REGISTRATION_CLAIM_TIMEOUT_SECONDS = 600
+
+# Email outbox
+# Views queue mail in notifications.EmailOutbox; run
+# `python manage.py send_queued_email --loop` to deliver it
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 60
+# a message still 'sending' after this is assumed lost and sent again
+EMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS = 600
+
+# Report jobs
+# PDF reports are rendered by `python manage.py run_report_jobs --loop`;
+# identical requests within the freshness window reuse the stored file
+REPORT_WORKERS = 2
+REPORT_FRESHNESS_SECONDS = 600
+# a job 'running' for longer than this is assumed lost and queued again
+REPORT_JOB_TIMEOUT_SECONDS = 1800
+
+# Caches
+# `catalog` holds read-mostly lists (subjects per grade, fee structures, study
+# tips); entries are invalidated by generation counters that model signals
+# bump. locmem is per process: when running several workers (or the queue
+# commands next to the web server), point `catalog` at a shared backend such as
+# django.core.cache.backends.filebased.FileBasedCache with
+# 'LOCATION': BASE_DIR / 'cache' / 'catalog', so a bump reaches every process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sims-default',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sims-catalog',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
+# Notification stream (Server-Sent Events)
+# Served best through ASGI: `uvicorn sims_project.asgi:application`. Streams
+# poll for changes every SSE_POLL_SECONDS, verify against the database every
+# SSE_DB_CHECK_SECONDS and close after SSE_MAX_SECONDS (browsers reconnect).
+SSE_POLL_SECONDS = 2
+SSE_HEARTBEAT_SECONDS = 15
+SSE_DB_CHECK_SECONDS = 30
+SSE_MAX_SECONDS = 300
+# Under WSGI each stream holds a worker thread, so the endpoint answers 204 and
+# dashboards keep their manual refresh; set True to stream anyway (e.g. with runserver)
+SSE_WSGI_STREAMING = False
+
+# Timetable iCalendar export: number of weekly repeats of each class
+TIMETABLE_ICAL_WEEKS = 20
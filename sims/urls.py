@@ -45,6 +45,8 @@ urlpatterns = [
     path("users/", include("users.urls")),
     # Finance app URLs (enable finance officer pages and named routes)
     path("finance/", include("finance.urls")),
+    # Background report jobs (status polling and downloads)
+    path("reports/", include("reports.urls")),
     
     # Admin and API routes
     path('', include('users.urls')),
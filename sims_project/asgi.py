@@ -1,6 +1,11 @@
-﻿import os
+"""ASGI entry point, e.g. ``uvicorn sims_project.asgi:application``.
+
+Serving through ASGI lets the notification stream (``notifications.stream``)
+hold its connections without tying up a worker thread each.
+"""
+import os
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sims_project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sims.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
@@ -0,0 +1,83 @@
+"""Resolve student identifiers (student ID, email or username) to users.
+
+Identifiers are matched case-insensitively against the indexed
+``StudentIdentity`` keys, so one identifier or a whole batch of them costs a
+single ``IN`` query whichever of the two student models holds the record.
+When several students match, the lowest ``rank`` wins: a ``Student`` record's
+ID, email, username, then a ``StudentProfile`` ID and a student account's
+email and username -- the order the parent link-request form always used.
+"""
+from django.db import transaction
+
+from users.models import User
+from .models import StudentIdentity
+
+STUDENT_RECORD_RANKS = {'student_id': 0, 'email': 1, 'username': 2}
+STUDENT_ACCOUNT_RANKS = {'student_id': 3, 'email': 4, 'username': 5}
+
+
+def normalize(identifier):
+    return (identifier or '').strip().casefold()
+
+
+def identity_rows(user, student=None, profile=None):
+    """The StudentIdentity rows ``user`` should have."""
+    sources = []
+    if student is not None:
+        sources.append((STUDENT_RECORD_RANKS, student.student_id))
+    if user.role == 'student':
+        sources.append((STUDENT_ACCOUNT_RANKS, getattr(profile, 'student_id', None)))
+    best = {}
+    for ranks, student_id in sources:
+        for kind, value in (('student_id', student_id), ('email', user.email), ('username', user.username)):
+            key = normalize(value)
+            if key and ((key, kind) not in best or ranks[kind] < best[(key, kind)]):
+                best[(key, kind)] = ranks[kind]
+    return [StudentIdentity(key=key, kind=kind, rank=rank, user=user) for (key, kind), rank in best.items()]
+
+
+def sync_student_identity(*user_ids):
+    """Rebuild the lookup rows of ``user_ids`` from their current records."""
+    users = User.objects.filter(id__in=user_ids).select_related('student_profile', 'studentprofile')
+    rows = []
+    for user in users:
+        rows.extend(identity_rows(
+            user,
+            getattr(user, 'student_profile', None),
+            getattr(user, 'studentprofile', None),
+        ))
+    with transaction.atomic():
+        StudentIdentity.objects.filter(user_id__in=user_ids).delete()
+        StudentIdentity.objects.bulk_create(rows)
+
+
+def resolve_students(identifiers, students_only=False, kinds=None):
+    """{identifier: User} for every identifier that matches, from one query.
+
+    The users come with ``student_profile`` (``students.Student``) and
+    ``studentprofile`` loaded. ``students_only`` ignores users whose role is
+    not 'student'; ``kinds`` limits the match to those key kinds (e.g.
+    ``['student_id']`` so a username can never stand in for a student ID).
+    """
+    keys = {identifier: normalize(identifier) for identifier in identifiers}
+    wanted = {key for key in keys.values() if key}
+    if not wanted:
+        return {}
+    rows = (
+        StudentIdentity.objects.filter(key__in=wanted)
+        .select_related('user', 'user__student_profile', 'user__studentprofile')
+        .order_by('key', 'rank', 'user_id')
+    )
+    if students_only:
+        rows = rows.filter(user__role='student')
+    if kinds:
+        rows = rows.filter(kind__in=kinds)
+    found = {}
+    for row in rows:
+        found.setdefault(row.key, row.user)
+    return {identifier: found[key] for identifier, key in keys.items() if key in found}
+
+
+def resolve_student(identifier, students_only=False, kinds=None):
+    """The user ``identifier`` names, or None."""
+    return resolve_students([identifier], students_only, kinds).get(identifier)
@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-18 05:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# same rules as students.lookup.identity_rows
+STUDENT_RECORD_RANKS = {'student_id': 0, 'email': 1, 'username': 2}
+STUDENT_ACCOUNT_RANKS = {'student_id': 3, 'email': 4, 'username': 5}
+
+
+def backfill_identities(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Student = apps.get_model('students', 'Student')
+    StudentProfile = apps.get_model('users', 'StudentProfile')
+    StudentIdentity = apps.get_model('students', 'StudentIdentity')
+
+    record_ids = dict(Student.objects.values_list('user_id', 'student_id'))
+    profile_ids = dict(StudentProfile.objects.values_list('user_id', 'student_id'))
+    rows = []
+    for user_id, role, email, username in User.objects.values_list('id', 'role', 'email', 'username').iterator():
+        sources = []
+        if user_id in record_ids:
+            sources.append((STUDENT_RECORD_RANKS, record_ids[user_id]))
+        if role == 'student':
+            sources.append((STUDENT_ACCOUNT_RANKS, profile_ids.get(user_id)))
+        best = {}
+        for ranks, student_id in sources:
+            for kind, value in (('student_id', student_id), ('email', email), ('username', username)):
+                key = (value or '').strip().casefold()
+                if key and ((key, kind) not in best or ranks[kind] < best[(key, kind)]):
+                    best[(key, kind)] = ranks[kind]
+        rows.extend(
+            StudentIdentity(key=key, kind=kind, rank=rank, user_id=user_id) for (key, kind), rank in best.items()
+        )
+    StudentIdentity.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('students', '0002_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=254)),
+                ('kind', models.CharField(choices=[('student_id', 'Student ID'), ('email', 'Email'), ('username', 'Username')], max_length=20)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identity_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='studentidentity',
+            index=models.Index(fields=['key', 'rank'], name='students_identity_key_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='studentidentity',
+            unique_together={('key', 'kind', 'user')},
+        ),
+        migrations.RunPython(backfill_identities, migrations.RunPython.noop),
+    ]
@@ -61,3 +61,33 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ("student", "date")
+
+
+class StudentIdentity(models.Model):
+    """Case-folded lookup key (student ID, email or username) for a student.
+
+    Rows are derived from ``Student``, ``users.StudentProfile`` and the
+    student's ``User`` by ``students.lookup.sync_student_identity`` and kept
+    current by signals; ``students.lookup`` resolves identifiers through them.
+    ``rank`` orders competing matches the way the link-request form always
+    has: ``Student`` records first, then profiles and student accounts.
+    """
+    KIND_CHOICES = [
+        ('student_id', 'Student ID'),
+        ('email', 'Email'),
+        ('username', 'Username'),
+    ]
+
+    key = models.CharField(max_length=254)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='identity_keys')
+
+    class Meta:
+        unique_together = ['key', 'kind', 'user']
+        indexes = [
+            models.Index(fields=['key', 'rank'], name='students_identity_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key} -> {self.user_id}"
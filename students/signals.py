@@ -0,0 +1,29 @@
+"""Keep the ``StudentIdentity`` lookup rows in step with the student records."""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import StudentProfile, User
+from .lookup import sync_student_identity
+from .models import Student
+
+
+@receiver(post_save, sender=User)
+def student_account_saved(sender, instance, update_fields=None, **kwargs):
+    # logins only touch last_login
+    if set(update_fields or ()) != {'last_login'}:
+        sync_student_identity(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=StudentProfile)
+def student_record_saved(sender, instance, **kwargs):
+    sync_student_identity(instance.user_id)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=StudentProfile)
+def student_record_deleted(sender, instance, origin=None, **kwargs):
+    # when the user itself is being deleted its rows go with it
+    if getattr(origin, 'model', type(origin)) is User:
+        return
+    sync_student_identity(instance.user_id)
@@ -14,4 +14,5 @@ urlpatterns = [
     # AJAX endpoints
     path('api/notifications/', views.get_notifications_ajax, name='get_notifications_ajax'),
     path('api/announcements/', views.get_announcements_ajax, name='get_announcements_ajax'),
+    path('api/registration-status/', views.registration_status, name='registration_status'),
 ]
\ No newline at end of file
@@ -1,18 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, Count, F
+from django.core.paginator import Paginator
 from django.utils import timezone
 from django.http import JsonResponse
 from users.decorators import student_required
-from users.models import User
-from subjects.models import Subject, Enrollment
+from subjects.models import Subject, Enrollment, RegistrationRequest
+from subjects.registration_queue import enqueue_registration, intake_mode_enabled, open_request_for, queue_position
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from ranks.models import Grade
-from payments.models import Payment, FeeStructure
-from notifications.models import Announcement
+from payments.models import Invoice, Payment, FeeStructure
+from payments.ledger import balance_for, bill_fee
+from payments.catalog import active_fee_structures
+from notifications.models import Announcement, AnnouncementReceipt
+from notifications.views import ANNOUNCEMENTS_PER_PAGE
 from ai_advisor.models import AIConversation, AIMessage
-import json
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -70,39 +73,16 @@ def student_dashboard(request):
     recent_grades = Grade.objects.filter(student=request.user).select_related('subject')[:5]
     pending_payments = Payment.objects.filter(student=request.user, status='pending')
     
-    # Get unread notifications for the student
-    from notifications.models import Notification
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    
-    # Get recent announcements for the student
-    try:
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:5]
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append(announcement)
-    except Exception as e:
-        relevant_announcements = []
-        print(f"Error loading announcements: {e}")
+    # Get recent announcements for the student (filtered before slicing)
+    relevant_announcements = Announcement.objects.visible_to('student')[:5]
     
     context = {
         'enrollments': student_enrollments,
         'recent_grades': recent_grades,
         'pending_payments': pending_payments,
         'total_subjects': student_enrollments.count(),
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
         'recent_announcements': relevant_announcements,
+        'unread_announcements': Announcement.objects.unread_by(request.user).count(),
     }
     # Build enrolled_courses list for dashboard template from enrollments
     enrolled_courses = []
@@ -246,6 +226,12 @@ def subject_registration(request):
     if request.method == 'POST':
         subject_ids = request.POST.getlist('subject_ids')
         
+        if subject_ids and intake_mode_enabled():
+            # Queue the selection; process_registration_queue allocates the seats
+            enqueue_registration(request.user, subject_ids, current_academic_year, current_semester, requested_status='pending')
+            messages.info(request, 'Your registration has been received and is being processed. You will be notified when it is complete.')
+            return redirect('subject_registration')
+
         if subject_ids:
             success_count = 0
             for subject_id in subject_ids:
@@ -309,21 +295,47 @@ def subject_registration(request):
         'current_semester': current_semester,
         'current_grade': current_grade,
         'grade_choices': list(range(1, 9)),
+        'pending_registration': open_request_for(request.user) if intake_mode_enabled() else None,
     }
     if assigned_only:
         context['assigned_only'] = True
     return render(request, 'students/subject_registration.html', context)
 
+@student_required
+def registration_status(request):
+    """AJAX: state of the student's queued registration requests (intake mode)."""
+    registrations = list(RegistrationRequest.objects.filter(student=request.user).order_by('-submitted_at', '-id')[:5])
+    subject_ids = {int(subject_id) for registration in registrations for subject_id in registration.subject_ids}
+    names = dict(Subject.objects.filter(id__in=subject_ids).values_list('id', 'name'))
+    data = []
+    for registration in registrations:
+        data.append({
+            'id': registration.id,
+            'status': registration.status,
+            'queue_position': queue_position(registration),
+            'submitted_at': registration.submitted_at.isoformat(),
+            'processed_at': registration.processed_at.isoformat() if registration.processed_at else None,
+            'subjects': [
+                {
+                    'id': int(subject_id),
+                    'name': names.get(int(subject_id), ''),
+                    'result': registration.outcome.get(str(subject_id)),
+                }
+                for subject_id in registration.subject_ids
+            ],
+        })
+    return JsonResponse({'success': True, 'registrations': data})
+
 @student_required
 def view_transcripts(request):
     """View student transcript with assigned subjects and teacher-filled results"""
     try:
         # Get student profile
-        if not hasattr(request.user, 'studentprofile'):
+        if request.identity.student_profile is None:
             messages.error(request, "Student profile not found. Please contact administration.")
             return redirect('student_dashboard')
         
-        student_profile = request.user.studentprofile
+        student_profile = request.identity.student_profile
         student = request.user
         
         # Get all enrollments (assigned subjects) with results filled by teachers
@@ -381,40 +393,10 @@ def view_transcripts(request):
         # Calculate average
         average_score = round(total_score / count, 2) if count > 0 else 0
         
-        # Get class rank if available
-        grade_level = getattr(student_profile, 'grade_level', None)
-        class_rank = None
-        if grade_level:
-            try:
-                # Get all students in same grade level
-                from users.views import compute_numeric_scores
-                peers = User.objects.filter(
-                    role='student',
-                    studentprofile__grade_level=grade_level
-                ).prefetch_related('subject_enrollments', 'subject_enrollments__subject', 'studentprofile')
-                
-                # Calculate ranks
-                peer_data = []
-                for peer in peers:
-                    peer_enrollments = Enrollment.objects.filter(student=peer)
-                    _, peer_total, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                    if peer_avg is not None:
-                        peer_data.append({
-                            'student_id': peer.id,
-                            'average': peer_avg
-                        })
-                
-                # Sort by average descending
-                peer_data.sort(key=lambda x: x['average'], reverse=True)
-                
-                # Find rank
-                for idx, peer in enumerate(peer_data, start=1):
-                    if peer['student_id'] == student.id:
-                        class_rank = idx
-                        break
-            except Exception as e:
-                print(f"Error calculating class rank: {e}")
-                class_rank = None
+        # Class rank comes from the materialized standing (ranks.standings)
+        from ranks.standings import current_standing
+        standing = current_standing(student)
+        class_rank = standing.rank if standing is not None else None
         
         context = {
             'student': student,
@@ -452,11 +434,11 @@ def download_transcript_pdf(request):
             return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
         
         # Get student profile
-        if not hasattr(request.user, 'studentprofile'):
+        if request.identity.student_profile is None:
             from django.http import HttpResponse
             return HttpResponse("Student profile not found.", status=404)
         
-        student_profile = request.user.studentprofile
+        student_profile = request.identity.student_profile
         student = request.user
         
         # Get all enrollments with results
@@ -543,31 +525,10 @@ def download_transcript_pdf(request):
             story.append(table)
             story.append(Spacer(1, 20))
             
-            # Calculate class rank
-            class_rank = None
-            grade_level = getattr(student_profile, 'grade_level', None)
-            if grade_level:
-                try:
-                    peers = User.objects.filter(
-                        role='student',
-                        studentprofile__grade_level=grade_level
-                    )
-                    peer_data = []
-                    for peer in peers:
-                        peer_enrollments = Enrollment.objects.filter(student=peer)
-                        _, _, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                        if peer_avg is not None:
-                            peer_data.append({
-                                'student_id': peer.id,
-                                'average': peer_avg
-                            })
-                    peer_data.sort(key=lambda x: x['average'], reverse=True)
-                    for idx, peer in enumerate(peer_data, start=1):
-                        if peer['student_id'] == student.id:
-                            class_rank = idx
-                            break
-                except Exception:
-                    pass
+            # Class rank from the materialized standing
+            from ranks.standings import current_standing
+            standing = current_standing(student)
+            class_rank = standing.rank if standing is not None else None
             
             # Summary Section
             summary_data = [
@@ -620,71 +581,53 @@ def get_performance_summary(gpa):
 
 @student_required
 def pay_fees(request):
-    fee_structures = FeeStructure.objects.filter(is_active=True)
+    fee_structures = active_fee_structures()
     student_payments = Payment.objects.filter(student=request.user).select_related('fee_structure')
     
     if request.method == 'POST':
         fee_structure_id = request.POST.get('fee_structure_id')
         fee_structure = get_object_or_404(FeeStructure, id=fee_structure_id)
         
-        # Check if payment already exists
-        if Payment.objects.filter(student=request.user, fee_structure=fee_structure, status='completed').exists():
+        # Invoice the fee if it was not billed yet, then pay what is still open on it
+        bill_fee(fee_structure, [request.user])
+        invoice = Invoice.objects.filter(
+            student=request.user, fee_structure=fee_structure, settled__lt=F('amount'),
+        ).order_by('due_date', 'id').first()
+        if invoice is None:
             messages.warning(request, 'You have already paid this fee.')
         else:
-            # Create payment (simplified - integrate with payment gateway in production)
-            payment = Payment.objects.create(
+            # Create payment (simplified - integrate with payment gateway in production);
+            # payments.signals posts it to the ledger
+            Payment.objects.create(
                 student=request.user,
                 fee_structure=fee_structure,
-                amount_paid=fee_structure.amount,
+                amount_paid=invoice.outstanding,
                 payment_method='Online',
                 transaction_id=f"TXN{request.user.id}{timezone.now().timestamp()}",
                 status='completed'
             )
             
-            messages.success(request, f'Payment of ${fee_structure.amount} completed successfully!')
+            messages.success(request, f'Payment of ${invoice.outstanding} completed successfully!')
         
         return redirect('pay_fees')
     
     context = {
         'fee_structures': fee_structures,
         'payments': student_payments,
+        'balance': balance_for(request.user),
+        'open_invoices': Invoice.objects.filter(student=request.user, settled__lt=F('amount')),
     }
     return render(request, 'students/pay_fees.html', context)
 
 @student_required
 def view_announcements(request):
     """View school announcements relevant to students"""
-    try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter in Python instead of using contains lookup (works better with JSONField)
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                # If it's stored as a string, try to parse it
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    # If parsing fails, treat as comma-separated
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets students or is for everyone
-            # Empty list or no target_roles means show to all
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append(announcement)
-                
-    except Exception as e:
-        # Fallback: get all active announcements if there's an error
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        print(f"Error filtering announcements: {e}")
+    relevant_announcements = Paginator(
+        Announcement.objects.visible_to('student'), ANNOUNCEMENTS_PER_PAGE,
+    ).get_page(request.GET.get('page'))
     
+    # Opening the page reads everything on it
+    AnnouncementReceipt.mark_read(request.user, relevant_announcements)
     context = {
         'announcements': relevant_announcements,
     }
@@ -896,25 +839,10 @@ class StudentViewSet(viewsets.ModelViewSet):
 
 @student_required
 def get_notifications_ajax(request):
-    """AJAX endpoint to fetch notifications for refresh"""
-    from notifications.models import Notification
+    """AJAX endpoint to fetch notifications for refresh (served from the unread counter)"""
+    from notifications.stream import notifications_payload
     try:
-        notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:10]
-        notifications_data = []
-        for notif in notifications:
-            notifications_data.append({
-                'id': notif.id,
-                'title': notif.title or 'Notification',
-                'message': notif.message or '',
-                'created_at': notif.created_at.strftime('%B %d, %Y at %I:%M %p'),
-                'is_read': notif.is_read,
-            })
-        return JsonResponse({
-            'success': True,
-            'notifications': notifications_data,
-            'count': len(notifications_data),
-            'unread_count': Notification.objects.filter(user=request.user, is_read=False).count()
-        })
+        return JsonResponse(notifications_payload(request.user))
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -924,30 +852,9 @@ def get_notifications_ajax(request):
 @student_required
 def get_announcements_ajax(request):
     """AJAX endpoint to fetch announcements for refresh"""
+    from notifications.stream import announcements_payload
     try:
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:10]
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            if isinstance(target_roles, str):
-                try:
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append({
-                    'id': announcement.id,
-                    'title': announcement.title,
-                    'content': announcement.content,
-                    'created_at': announcement.created_at.strftime('%B %d, %Y at %I:%M %p'),
-                })
-        return JsonResponse({
-            'success': True,
-            'announcements': relevant_announcements,
-            'count': len(relevant_announcements)
-        })
+        return JsonResponse(announcements_payload(request.user, role='student'))
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -0,0 +1,206 @@
+"""Bitset attendance: one ``AttendanceLog`` per enrollment and term.
+
+Each day of the term takes 2 bits in ``codes`` (present, absent, late,
+excused) plus 1 bit in ``marked`` saying a roll call was taken. Counting is
+done on whole terms at once: the ``marked`` bits are spread to the 2-bit
+layout with two ``bytes.translate`` tables, every day holding a given code is
+found with one XOR against that code repeated, and ``int.bit_count`` counts
+them -- no per-day loop. Rates, streaks and absence counts all come from those
+counts.
+
+``record_roll_call`` is the write side: a class's marks for one day are
+applied in memory and saved with a single upsert. It only accepts dates inside
+the enrollment's academic year (August 1 to July 31), and ``mark`` refuses to
+stretch a log beyond ``MAX_TERM_DAYS``, so a mistyped date cannot grow a log by
+years of empty bits.
+"""
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import AttendanceLog, Enrollment, validate_academic_year
+from .seats import SEAT_HOLDING_STATUSES
+
+STATUS_CODES = {'present': 0, 'absent': 1, 'late': 2, 'excused': 3}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+ATTENDED = ('present', 'late')
+RECENT_DAYS = 10
+MAX_TERM_DAYS = 366
+
+
+def _spread_table(shift):
+    # bit i of the nibble -> bit 2i of the byte
+    return bytes(sum(((byte >> (shift + i)) & 1) << (2 * i) for i in range(4)) for byte in range(256))
+
+
+_SPREAD_LOW = _spread_table(0)
+_SPREAD_HIGH = _spread_table(4)
+
+
+def _int(data):
+    return int.from_bytes(bytes(data or b''), 'little')
+
+
+def _bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+class TermAttendance:
+    """Decoded view of an ``AttendanceLog``; ``mark`` writes back to the log."""
+
+    def __init__(self, log):
+        self.log = log
+        self.codes = _int(log.codes)
+        self.marked = _int(log.marked)
+
+    def _day(self, date):
+        return (date - self.log.start_date).days
+
+    def mark(self, date, status):
+        day = self._day(date)
+        if max(day, self.marked.bit_length() - 1) - min(day, 0) >= MAX_TERM_DAYS:
+            raise ValueError(f'{date} is more than {MAX_TERM_DAYS} days away from the rest of the term')
+        if day < 0:
+            # earlier than anything recorded so far: move day 0 back
+            self.codes <<= -2 * day
+            self.marked <<= -day
+            self.log.start_date = date
+            day = 0
+        self.codes = (self.codes & ~(3 << 2 * day)) | (STATUS_CODES[status] << 2 * day)
+        self.marked |= 1 << day
+        self.log.codes = _bytes(self.codes)
+        self.log.marked = _bytes(self.marked)
+
+    def status_on(self, date):
+        day = self._day(date)
+        if day < 0 or not (self.marked >> day) & 1:
+            return None
+        return STATUS_NAMES[(self.codes >> 2 * day) & 3]
+
+    def _days_with(self, status):
+        """Marked days holding ``status``, as bits at 2 * day."""
+        marked = bytes(self.log.marked or b'')
+        spread = bytearray(2 * len(marked))
+        spread[0::2] = marked.translate(_SPREAD_LOW)
+        spread[1::2] = marked.translate(_SPREAD_HIGH)
+        marked = int.from_bytes(spread, 'little')
+        pattern = int.from_bytes(bytes([STATUS_CODES[status] * 0x55]) * len(spread), 'little')
+        diff = self.codes ^ pattern
+        return ~(diff | diff >> 1) & marked
+
+    def counts(self):
+        """{status: number of days}, plus 'recorded' (days with a roll call)."""
+        counts = {status: self._days_with(status).bit_count() for status in STATUS_CODES}
+        counts['recorded'] = self.marked.bit_count()
+        return counts
+
+    def rate(self, counts=None):
+        """Percentage of days attended (present or late); excused days are left out."""
+        counts = counts or self.counts()
+        expected = counts['recorded'] - counts['excused']
+        if not expected:
+            return None
+        return round(100 * (counts['present'] + counts['late']) / expected, 1)
+
+    def streak(self):
+        """Days attended in a row up to the latest roll call; excused days neither
+        count nor break the streak."""
+        attended = self._days_with('present') | self._days_with('late')
+        counted = attended | self._days_with('absent')
+        missed = counted & ~attended
+        return (counted >> missed.bit_length()).bit_count()
+
+    def recent(self, limit=RECENT_DAYS):
+        """[(date, status)] for the latest ``limit`` marked days, newest first."""
+        days = []
+        marked = self.marked
+        while marked and len(days) < limit:
+            day = marked.bit_length() - 1
+            marked &= ~(1 << day)
+            days.append((self.log.start_date + datetime.timedelta(days=day), STATUS_NAMES[(self.codes >> 2 * day) & 3]))
+        return days
+
+    def summary(self):
+        counts = self.counts()
+        return {
+            'counts': counts,
+            'rate': self.rate(counts),
+            'absences': counts['absent'],
+            'streak': self.streak(),
+        }
+
+
+def term_attendance(enrollment):
+    """TermAttendance for ``enrollment`` (empty if no roll call was taken yet)."""
+    try:
+        log = enrollment.attendance_log
+    except AttendanceLog.DoesNotExist:
+        log = AttendanceLog(enrollment=enrollment, start_date=datetime.date.today())
+    return TermAttendance(log)
+
+
+def academic_year_window(academic_year):
+    """(first day, last day) of a 'YYYY-YYYY' academic year: August 1 to July 31."""
+    validate_academic_year(academic_year)
+    start_year = int(academic_year[:4])
+    return datetime.date(start_year, 8, 1), datetime.date(start_year + 1, 7, 31)
+
+
+def record_roll_call(subject, date, marks, academic_year, semester):
+    """Save one day's roll call for ``subject``.
+
+    ``marks`` maps student (user) ids to a status in ``STATUS_CODES``. Returns
+    (saved, errors): the number of students marked and a list of
+    {'student_id', 'message'} for marks that were rejected; a date outside the
+    academic year rejects the whole roll call (``student_id`` None).
+    """
+    try:
+        first_day, last_day = academic_year_window(academic_year)
+    except ValidationError as ve:
+        return 0, [{'student_id': None, 'message': '; '.join(ve.messages)}]
+    if not first_day <= date <= last_day:
+        return 0, [{'student_id': None, 'message': f'{date} is outside the {academic_year} academic year'}]
+
+    errors = []
+    wanted = {}
+    for student_id, status in marks.items():
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            errors.append({'student_id': student_id, 'message': 'Invalid student id'})
+            continue
+        if status not in STATUS_CODES:
+            errors.append({'student_id': student_id, 'message': f'Unknown status {status!r}'})
+            continue
+        wanted[student_id] = status
+
+    with transaction.atomic():
+        enrollment_ids = dict(
+            Enrollment.objects.filter(
+                subject=subject, academic_year=academic_year, semester=semester,
+                status__in=SEAT_HOLDING_STATUSES, student_id__in=wanted,
+            ).values_list('student_id', 'id')
+        )
+        logs = {
+            log.enrollment_id: log
+            for log in AttendanceLog.objects.select_for_update().filter(enrollment_id__in=enrollment_ids.values())
+        }
+        changed = []
+        for student_id, status in wanted.items():
+            enrollment_id = enrollment_ids.get(student_id)
+            if enrollment_id is None:
+                errors.append({'student_id': student_id, 'message': 'Student is not enrolled in this subject'})
+                continue
+            log = logs.get(enrollment_id) or AttendanceLog(enrollment_id=enrollment_id, start_date=date)
+            try:
+                TermAttendance(log).mark(date, status)
+            except ValueError as e:
+                errors.append({'student_id': student_id, 'message': str(e)})
+                continue
+            changed.append(log)
+        AttendanceLog.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['enrollment'],
+            update_fields=['start_date', 'codes', 'marked', 'updated_at'],
+        )
+    return len(changed), errors
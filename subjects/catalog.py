@@ -0,0 +1,47 @@
+"""Cached per-grade subject catalog (see ``sims.catalog``).
+
+Subjects can exist twice under the same name (re-created with a new code, or
+imported twice), so every list here is deduplicated by name, keeping the
+subject with the lowest code. Instructors and their users are loaded with the
+subjects so templates can show them without further queries.
+"""
+from sims.catalog import cached
+
+from .models import Subject
+
+CATALOG = 'subjects'
+
+
+def _name_key(subject):
+    return (subject.name or '').strip().lower()
+
+
+def dedupe_by_name(subjects):
+    """Keep the first subject of each (case-insensitive) name; nameless ones are dropped."""
+    seen = set()
+    unique = []
+    for subject in subjects:
+        key = _name_key(subject)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(subject)
+    return unique
+
+
+def grade_catalog(grade_level, subject_types=None):
+    """Active subjects of ``grade_level``, one per name, ordered by name.
+
+    ``subject_types`` limits the list to those ``subject_type`` values. The
+    returned Subject instances are copies from the cache, so setting
+    attributes on them (as ``attach_seat_info`` does) is safe.
+    """
+    types = sorted(subject_types) if subject_types else []
+
+    def build():
+        subjects = Subject.objects.filter(grade_level=grade_level, is_active=True)
+        if types:
+            subjects = subjects.filter(subject_type__in=types)
+        subjects = subjects.select_related('instructor', 'instructor__user').order_by('code', 'id')
+        return sorted(dedupe_by_name(subjects), key=_name_key)
+
+    return cached(CATALOG, f'grade:{grade_level}:{",".join(types) or "*"}', build)
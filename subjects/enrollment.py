@@ -0,0 +1,118 @@
+"""Bulk enrollment engine.
+
+Enrolling a whole grade into a subject used to cost a lookup, a profile query
+(from ``Enrollment.clean``) and a write per student. Here the existing
+enrollments for the term are loaded in one query, the grade level check from
+``Enrollment.clean`` is done in memory, missing rows are inserted with a single
+``bulk_create`` and status promotions are applied with a single UPDATE.
+
+Bulk writes do not send ``post_save`` signals, so seat counters for the
+affected subjects are recounted afterwards.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Enrollment, validate_academic_year
+from .seats import recount_seats
+
+BATCH_SIZE = 500
+
+
+class BulkEnrollmentResult:
+    """Counts reported by :func:`bulk_enroll`."""
+
+    def __init__(self):
+        self.created = 0
+        self.promoted = 0
+        self.skipped = 0
+        # (student_id, subject, reason) for rows that could not be enrolled
+        self.failures = []
+
+    @property
+    def enrolled(self):
+        return self.created + self.promoted
+
+    def __repr__(self):
+        return f"<BulkEnrollmentResult created={self.created} promoted={self.promoted} skipped={self.skipped}>"
+
+
+def bulk_enroll(students, subjects, academic_year, semester, status='approved', promote=True, is_auto_assigned=True):
+    """Enroll ``students`` (a User queryset) into each of ``subjects`` for one term.
+
+    - Students are only enrolled in subjects for their own grade level.
+    - Existing enrollments are left alone, or moved to ``status`` when
+      ``promote`` is true and their status differs.
+    - Returns a :class:`BulkEnrollmentResult`.
+    """
+    result = BulkEnrollmentResult()
+    subjects = list(subjects)
+    if not subjects:
+        return result
+
+    rows = list(students.values_list('id', 'role', 'studentprofile__grade_level'))
+    try:
+        validate_academic_year(academic_year)
+    except ValidationError as ve:
+        result.skipped = len(rows) * len(subjects)
+        result.failures.append((None, None, '; '.join(ve.messages)))
+        return result
+
+    term_enrollments = Enrollment.objects.filter(
+        student__in=students.values('id'),
+        subject__in=subjects,
+        academic_year=academic_year,
+        semester=semester,
+    )
+    existing = {
+        (student_id, subject_id): (pk, current_status)
+        for pk, student_id, subject_id, current_status in term_enrollments.values_list('id', 'student_id', 'subject_id', 'status')
+    }
+
+    to_create = []
+    to_promote = []
+    for student_id, role, grade_level in rows:
+        for subject in subjects:
+            current = existing.get((student_id, subject.id))
+            if current is not None:
+                pk, current_status = current
+                if promote and current_status != status:
+                    to_promote.append(pk)
+                else:
+                    result.skipped += 1
+                continue
+            # Same rule as Enrollment.clean, without a profile query per row
+            if role == 'student' and grade_level is not None and grade_level != subject.grade_level:
+                result.skipped += 1
+                result.failures.append((
+                    student_id,
+                    subject,
+                    f"Student is in Grade {grade_level} but subject is for Grade {subject.grade_level}",
+                ))
+                continue
+            to_create.append(Enrollment(
+                student_id=student_id,
+                subject=subject,
+                academic_year=academic_year,
+                semester=semester,
+                status=status,
+                is_auto_assigned=is_auto_assigned,
+            ))
+
+    with transaction.atomic():
+        if to_create:
+            # ignore_conflicts makes concurrent runs for the same term harmless;
+            # the rows it drops were inserted by another run, so count what was added
+            before = term_enrollments.count()
+            Enrollment.objects.bulk_create(to_create, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            result.created = term_enrollments.count() - before
+            result.skipped += len(to_create) - result.created
+        # Every promoted row gets the same values, so a plain UPDATE per batch
+        # does the job of bulk_update without a CASE per row
+        for start in range(0, len(to_promote), BATCH_SIZE):
+            result.promoted += Enrollment.objects.filter(id__in=to_promote[start:start + BATCH_SIZE]).update(
+                status=status,
+                is_auto_assigned=is_auto_assigned,
+            )
+        if result.enrolled:
+            recount_seats(subjects, academic_year, semester)
+    return result
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from subjects.registration_queue import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Allocate seats for queued subject registration requests (REGISTRATION_INTAKE_MODE), oldest first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Requests to process per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_batch(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} registration request(s)'))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 04:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_seat_counters(apps, schema_editor):
+    Enrollment = apps.get_model('subjects', 'Enrollment')
+    SeatCounter = apps.get_model('subjects', 'SeatCounter')
+    rows = (
+        Enrollment.objects.filter(status__in=('active', 'approved'))
+        .values('subject_id', 'academic_year', 'semester')
+        .annotate(taken=models.Count('id'))
+        .order_by()
+    )
+    SeatCounter.objects.bulk_create([SeatCounter(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0004_add_assigned_by_registrar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=9)),
+                ('semester', models.CharField(max_length=10)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_counters', to='subjects.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'academic_year', 'semester')},
+            },
+        ),
+        migrations.RunPython(backfill_seat_counters, migrations.RunPython.noop),
+    ]
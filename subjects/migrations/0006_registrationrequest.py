@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 04:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('subjects', '0005_seatcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject_ids', models.JSONField(default=list)),
+                ('academic_year', models.CharField(max_length=9)),
+                ('semester', models.CharField(max_length=10)),
+                ('requested_status', models.CharField(default='active', max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('outcome', models.JSONField(blank=True, default=dict)),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='registration_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['submitted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='registrationrequest',
+            index=models.Index(fields=['status', 'submitted_at'], name='subjects_regq_status_idx'),
+        ),
+    ]
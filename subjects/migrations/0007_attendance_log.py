@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 05:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# same rules as subjects.attendance.TermAttendance
+STATUS_CODES = {'present': 0, 'absent': 1, 'late': 2, 'excused': 3}
+
+
+def _bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def backfill_logs(apps, schema_editor):
+    Attendance = apps.get_model('subjects', 'Attendance')
+    AttendanceLog = apps.get_model('subjects', 'AttendanceLog')
+
+    days = {}
+    for enrollment_id, date, status in Attendance.objects.values_list('enrollment_id', 'date', 'status').iterator():
+        days.setdefault(enrollment_id, []).append((date, STATUS_CODES.get(status, 0)))
+    logs = []
+    for enrollment_id, entries in days.items():
+        start = min(date for date, _ in entries)
+        codes = marked = 0
+        for date, code in entries:
+            day = (date - start).days
+            codes |= code << 2 * day
+            marked |= 1 << day
+        logs.append(AttendanceLog(enrollment_id=enrollment_id, start_date=start, codes=_bytes(codes), marked=_bytes(marked)))
+    AttendanceLog.objects.bulk_create(logs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0006_registrationrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('codes', models.BinaryField(default=bytes)),
+                ('marked', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('enrollment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_log', to='subjects.enrollment')),
+            ],
+        ),
+        migrations.RunPython(backfill_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0007_attendance_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registrationrequest',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -114,30 +114,32 @@ class Subject(models.Model):
             )
         
         # NEW: Validate time conflicts for teacher
-        if self.day_of_week and self.start_time and self.end_time and self.instructor:
-            conflicting_subjects = Subject.objects.filter(
-                instructor=self.instructor,
+        # (against the database, not the per-process schedule index, which
+        # does not see changes made by other processes or QuerySet.update())
+        if self.day_of_week and self.start_time and self.end_time and self.instructor_id:
+            subject = Subject.objects.filter(
+                instructor_id=self.instructor_id,
                 day_of_week=self.day_of_week,
-                is_active=True
-            ).exclude(pk=self.pk)
-            
-            for subject in conflicting_subjects:
-                if (self.start_time < subject.end_time and self.end_time > subject.start_time):
-                    raise ValidationError(
-                        f"Time conflict with {subject.code} - {subject.schedule_display}"
-                    )
+                is_active=True,
+                start_time__lt=self.end_time,
+                end_time__gt=self.start_time,
+            ).exclude(pk=self.pk).order_by('start_time').first()
+            if subject is not None:
+                raise ValidationError(
+                    f"Time conflict with {subject.code} - {subject.schedule_display}"
+                )
         
         # NEW: Validate end time is after start time
         if self.start_time and self.end_time and self.end_time <= self.start_time:
             raise ValidationError("End time must be after start time")
     
     def current_enrollment_count(self, academic_year, semester):
-        """Get current enrollment count for this subject"""
-        return self.enrollments.filter(
+        """Get current enrollment count for this subject (seats held by active/approved enrollments)"""
+        return SeatCounter.objects.filter(
+            subject=self,
             academic_year=academic_year,
             semester=semester,
-            status='active'
-        ).count()
+        ).values_list('taken', flat=True).first() or 0
 
     def is_available(self, academic_year, semester):
         """Check if subject has available slots"""
@@ -161,6 +163,19 @@ class ScheduleConflict(models.Model):
     
     def __str__(self):
         return f"Schedule conflict for {self.student.username}"
+def validate_academic_year(academic_year):
+    """Raise ValidationError unless academic_year looks like 'YYYY-YYYY' with consecutive years."""
+    if len(academic_year) != 9 or academic_year[4] != '-':
+        raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
+    try:
+        start_year = int(academic_year[:4])
+        end_year = int(academic_year[5:])
+        if end_year != start_year + 1:
+            raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
+    except ValueError:
+        raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
+
+
 class Enrollment(models.Model):
     SEMESTER_CHOICES = [
         ('first', 'First Semester'),
@@ -215,20 +230,20 @@ class Enrollment(models.Model):
     
     def __str__(self):
         return f"{self.student.username} - {self.subject.code} ({self.academic_year} - {self.get_semester_display()})"
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the values loaded from the database so signal handlers can
+        tell which fields actually changed on save."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self):
         """Validate academic year format and semester"""
         # Validate academic year format
         if self.academic_year:
-            if len(self.academic_year) != 9 or self.academic_year[4] != '-':
-                raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
-            try:
-                start_year = int(self.academic_year[:4])
-                end_year = int(self.academic_year[5:])
-                if end_year != start_year + 1:
-                    raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
-            except ValueError:
-                raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
+            validate_academic_year(self.academic_year)
         
         # Validate that student is enrolled in subjects matching their grade level
         if self.student.role == 'student' and hasattr(self.student, 'studentprofile'):
@@ -241,11 +256,69 @@ class Enrollment(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+        # post_save handlers have run; later saves compare against this state
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
     
     def get_semester_display(self):
         """Get human-readable semester name"""
         return dict(self.SEMESTER_CHOICES).get(self.semester, self.semester)
 
+class SeatCounter(models.Model):
+    """Seats taken in a subject for one term.
+
+    Maintained by ``subjects.signals`` whenever an Enrollment enters or leaves
+    a seat-holding status, so capacity checks read one row instead of counting
+    enrollments. See ``subjects.seats`` for reservation and recounting.
+    """
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='seat_counters')
+    academic_year = models.CharField(max_length=9)
+    semester = models.CharField(max_length=10)
+    taken = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['subject', 'academic_year', 'semester']
+
+    def __str__(self):
+        return f"{self.subject.code} {self.academic_year} {self.semester}: {self.taken}/{self.subject.max_capacity}"
+
+class RegistrationRequest(models.Model):
+    """A student's submitted subject selection waiting for seat allocation.
+
+    Used when ``REGISTRATION_INTAKE_MODE`` is on: registration views only
+    insert one of these, and the ``process_registration_queue`` command turns
+    them into enrollments first-come-first-served.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='registration_requests')
+    subject_ids = models.JSONField(default=list)
+    academic_year = models.CharField(max_length=9)
+    semester = models.CharField(max_length=10)
+    # Status a successful enrollment gets: 'active' (users registration page)
+    # or 'pending' (students registration page, needs registrar approval)
+    requested_status = models.CharField(max_length=20, default='active')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # subject_id (as str) -> outcome ('active', 'pending', 'waitlisted', 'already enrolled', or an error)
+    outcome = models.JSONField(default=dict, blank=True)
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    # when a worker took the request; 'processing' rows claimed too long ago are queued again
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # set by the claiming worker; it processes only the rows carrying its token
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['submitted_at', 'id']
+        indexes = [models.Index(fields=['status', 'submitted_at'], name='subjects_regq_status_idx')]
+
+    def __str__(self):
+        return f"Registration by {self.student.username} ({self.get_status_display()})"
+
 class Assignment(models.Model):
     subject = models.ForeignKey(
         Subject, 
@@ -306,6 +379,11 @@ class Grade(models.Model):
             return 'F'
 
 class Attendance(models.Model):
+    """Legacy one-row-per-day attendance.
+
+    Superseded by ``AttendanceLog``, which migration 0007 filled from these
+    rows; nothing reads or writes them any more.
+    """
     enrollment = models.ForeignKey(
         Enrollment, 
         on_delete=models.CASCADE, 
@@ -330,4 +408,22 @@ class Attendance(models.Model):
     
     def __str__(self):
         return f"{self.enrollment.student.username} - {self.date} - {self.status}"
-    
\ No newline at end of file
+    
+
+class AttendanceLog(models.Model):
+    """A whole term of attendance for one enrollment, packed into bitsets.
+
+    Day ``n`` is ``start_date + n days``. ``codes`` holds 2 bits per day (see
+    ``subjects.attendance.STATUS_CODES``) and ``marked`` 1 bit per day with a
+    roll call entry; both are little-endian bytes. A term is a few hundred
+    bytes instead of one ``Attendance`` row per day. Read and write it through
+    ``subjects.attendance``.
+    """
+    enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, related_name='attendance_log')
+    start_date = models.DateField()
+    codes = models.BinaryField(default=bytes)
+    marked = models.BinaryField(default=bytes)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Attendance log for enrollment {self.enrollment_id} from {self.start_date}"
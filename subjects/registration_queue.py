@@ -0,0 +1,210 @@
+"""Registration intake queue.
+
+With ``REGISTRATION_INTAKE_MODE = True`` the registration views do not enroll
+anyone themselves; they store the student's selection as a
+``RegistrationRequest`` and return immediately. The
+``process_registration_queue`` management command then allocates seats in
+submission order (first come, first served), waitlisting students once a
+subject is full, so request latency stays flat on registration day and only
+one process writes enrollments.
+
+A request still 'processing' ``REGISTRATION_CLAIM_TIMEOUT_SECONDS`` after it
+was claimed belongs to a worker that died and is queued again; allocation
+skips subjects the student already holds, so finishing it twice is harmless.
+"""
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Enrollment, RegistrationRequest, Subject
+from .seats import SEAT_HOLDING_STATUSES, save_holding_seat, seat_map
+
+OPEN_STATUSES = ('queued', 'processing')
+
+
+def intake_mode_enabled():
+    return getattr(settings, 'REGISTRATION_INTAKE_MODE', False)
+
+
+def enqueue_registration(student, subject_ids, academic_year, semester, requested_status='active'):
+    """Store a subject selection for the worker. This is the only write a
+    registration request makes in intake mode."""
+    cleaned = []
+    for subject_id in subject_ids:
+        try:
+            subject_id = int(subject_id)
+        except (TypeError, ValueError):
+            continue
+        if subject_id not in cleaned:
+            cleaned.append(subject_id)
+    return RegistrationRequest.objects.create(
+        student=student,
+        subject_ids=cleaned,
+        academic_year=academic_year,
+        semester=semester,
+        requested_status=requested_status,
+    )
+
+
+def open_request_for(student):
+    """Return the student's oldest request that has not been processed yet, or None."""
+    return RegistrationRequest.objects.filter(student=student, status__in=OPEN_STATUSES).order_by('submitted_at', 'id').first()
+
+
+def queue_position(registration):
+    """Number of queued requests that will be processed before this one."""
+    if registration.status != 'queued':
+        return 0
+    return RegistrationRequest.objects.filter(status='queued', submitted_at__lt=registration.submitted_at).count()
+
+
+def _queued_ids(batch_size):
+    return list(
+        RegistrationRequest.objects.filter(status='queued')
+        .order_by('submitted_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+
+
+def _claim_batch(batch_size):
+    """Take up to ``batch_size`` queued requests for this worker.
+
+    Another worker may have read the same ids; only the one whose update
+    stamped its token on a row gets that row back.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=getattr(settings, 'REGISTRATION_CLAIM_TIMEOUT_SECONDS', 600))
+    RegistrationRequest.objects.filter(status='processing', claimed_at__lt=stale).update(status='queued', claimed_at=None)
+    ids = _queued_ids(batch_size)
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    RegistrationRequest.objects.filter(id__in=ids, status='queued').update(
+        status='processing', claimed_at=now, claim_token=token,
+    )
+    return list(
+        RegistrationRequest.objects.filter(claim_token=token, status='processing')
+        .select_related('student', 'student__studentprofile')
+        .order_by('submitted_at', 'id')
+    )
+
+
+def _allocate(registration, subjects, existing, taken, pending):
+    """Enroll one request's subjects; returns the outcome dict."""
+    outcome = {}
+    profile = getattr(registration.student, 'studentprofile', None)
+    student_grade = getattr(profile, 'grade_level', None)
+    term = (registration.academic_year, registration.semester)
+
+    for subject_id in registration.subject_ids:
+        subject = subjects.get(subject_id)
+        if subject is None or not subject.is_active:
+            outcome[str(subject_id)] = 'unavailable'
+            continue
+        if student_grade is not None and subject.grade_level != student_grade:
+            outcome[str(subject_id)] = f"Subject is for Grade {subject.grade_level} but student is Grade {student_grade}"
+            continue
+        key = (registration.student_id, subject_id) + term
+        if key in existing:
+            current_status = existing[key]
+            if current_status in SEAT_HOLDING_STATUSES or current_status == registration.requested_status:
+                outcome[str(subject_id)] = 'already enrolled'
+                continue
+            # reactivate a dropped/withdrawn enrollment, as the synchronous view does
+            enrollment = Enrollment.objects.get(
+                student_id=registration.student_id, subject_id=subject_id,
+                academic_year=registration.academic_year, semester=registration.semester,
+            )
+            enrollment.status = registration.requested_status
+        else:
+            enrollment = Enrollment(
+                student=registration.student,
+                subject=subject,
+                academic_year=registration.academic_year,
+                semester=registration.semester,
+                status=registration.requested_status,
+            )
+        try:
+            if registration.requested_status in SEAT_HOLDING_STATUSES:
+                # seat-holding enrollments go through the conditional seat reservation
+                if not save_holding_seat(enrollment):
+                    enrollment.status = 'waitlisted'
+                    enrollment.save()
+            else:
+                # pending requests count against capacity like they always have
+                seats = (subject_id,) + term
+                if taken.get(seats, 0) + pending.get(seats, 0) >= subject.max_capacity:
+                    enrollment.status = 'waitlisted'
+                enrollment.save()
+                if enrollment.status == registration.requested_status:
+                    pending[seats] = pending.get(seats, 0) + 1
+        except ValidationError as ve:
+            outcome[str(subject_id)] = '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)
+            continue
+        except IntegrityError as ie:
+            outcome[str(subject_id)] = str(ie)
+            continue
+        existing[key] = enrollment.status
+        outcome[str(subject_id)] = enrollment.status
+    return outcome
+
+
+def process_batch(batch_size=100):
+    """Process up to ``batch_size`` queued requests in submission order.
+
+    Returns the number of requests processed.
+    """
+    from notifications.models import Notification
+
+    batch = _claim_batch(batch_size)
+    if not batch:
+        return 0
+
+    # Everything the allocation needs for the whole batch, loaded up front
+    subject_ids = {subject_id for registration in batch for subject_id in registration.subject_ids}
+    subjects = Subject.objects.in_bulk(subject_ids)
+    existing = {
+        (student_id, subject_id, year, sem): status
+        for student_id, subject_id, year, sem, status in Enrollment.objects.filter(
+            student_id__in={registration.student_id for registration in batch},
+            subject_id__in=subject_ids,
+        ).values_list('student_id', 'subject_id', 'academic_year', 'semester', 'status')
+    }
+    taken = seat_map(subject_ids)
+    pending = {
+        (row['subject_id'], row['academic_year'], row['semester']): row['n']
+        for row in Enrollment.objects.filter(subject_id__in=subject_ids, status='pending')
+        .values('subject_id', 'academic_year', 'semester').annotate(n=Count('id')).order_by()
+    }
+
+    notifications = []
+    for registration in batch:
+        try:
+            registration.outcome = _allocate(registration, subjects, existing, taken, pending)
+            registration.status = 'done'
+        except Exception as e:
+            registration.outcome = {'error': str(e)}
+            registration.status = 'failed'
+        registration.processed_at = timezone.now()
+
+        results = list(registration.outcome.values())
+        enrolled = sum(1 for result in results if result in ('active', 'approved', 'pending'))
+        waitlisted = results.count('waitlisted')
+        message = f'{enrolled} subject(s) registered'
+        if waitlisted:
+            message += f', {waitlisted} waitlisted'
+        notifications.append(Notification(
+            user=registration.student,
+            title='Subject registration processed',
+            message=message + '.',
+            link='/students/subject-registration/',
+        ))
+
+    RegistrationRequest.objects.bulk_update(batch, ['status', 'outcome', 'processed_at'])
+    Notification.objects.bulk_create(notifications)
+    return len(batch)
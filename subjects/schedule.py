@@ -0,0 +1,164 @@
+"""Weekly schedule index for conflict checks.
+
+Every scheduled subject is turned into a bitmap of 5-minute slots across the
+week (bit ``day * SLOTS_PER_DAY + slot``), so "do these subjects clash?" is a
+bitwise AND instead of a pairwise time comparison. Only when masks collide do
+we run a per-day sort-and-sweep to report the exact overlapping pairs (slot
+rounding can make two back-to-back classes share a slot, so the sweep compares
+the real times).
+
+The index is built from one query and kept in memory. Subject saves/deletes
+bump a version number in the Django cache; each process rebuilds its copy
+lazily when it sees a newer version, so a shared cache backend keeps all
+workers in step. It can still lag behind writes that skip the signals
+(``QuerySet.update()``), so it only serves read-side overlap reports; the
+instructor double-booking check in ``Subject.clean`` queries the database.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import Subject, Teacher
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DAY_INDEX = {code: idx for idx, (code, _) in enumerate(Teacher.DAYS_OF_WEEK)}
+DAY_NAMES = dict(Teacher.DAYS_OF_WEEK)
+
+VERSION_KEY = 'subjects:schedule-index:version'
+
+_index = None
+_index_version = None
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute + value.second / 60
+
+
+def time_mask(day_of_week, start_time, end_time):
+    """Bitmap of the 5-minute slots a class occupies; 0 if it is not scheduled."""
+    day = DAY_INDEX.get(day_of_week)
+    if day is None or not start_time or not end_time or end_time <= start_time:
+        return 0
+    first = int(_minutes(start_time) // SLOT_MINUTES)
+    last = -int(-_minutes(end_time) // SLOT_MINUTES)  # ceiling
+    offset = day * SLOTS_PER_DAY
+    return ((1 << (last - first)) - 1) << (offset + first)
+
+
+class ScheduleEntry(namedtuple('ScheduleEntry', [
+    'subject_id', 'code', 'name', 'day_of_week', 'start_time', 'end_time', 'instructor_id', 'is_active', 'mask',
+])):
+    __slots__ = ()
+
+    @classmethod
+    def from_subject(cls, subject):
+        return cls(
+            subject.pk, subject.code, subject.name, subject.day_of_week, subject.start_time, subject.end_time,
+            subject.instructor_id, subject.is_active,
+            time_mask(subject.day_of_week, subject.start_time, subject.end_time),
+        )
+
+    @property
+    def day_display(self):
+        return DAY_NAMES.get(self.day_of_week, self.day_of_week)
+
+    @property
+    def time_display(self):
+        return f"{self.start_time.strftime('%H:%M')} - {self.end_time.strftime('%H:%M')}"
+
+    @property
+    def schedule_display(self):
+        return f"{self.day_display} {self.time_display}"
+
+    def overlaps(self, other):
+        return bool(self.mask & other.mask) and self.day_of_week == other.day_of_week and (
+            self.start_time < other.end_time and self.end_time > other.start_time
+        )
+
+
+class ScheduleIndex:
+    """Scheduled subjects keyed by id."""
+
+    def __init__(self, entries):
+        self.entries = {entry.subject_id: entry for entry in entries}
+
+    def get(self, subject_id):
+        try:
+            return self.entries.get(int(subject_id))
+        except (TypeError, ValueError):
+            return None
+
+    def lookup(self, subject_ids):
+        """Entries for the given ids that have a schedule (unknown ids are ignored)."""
+        found = []
+        for subject_id in subject_ids:
+            entry = self.get(subject_id)
+            if entry is not None and entry not in found:
+                found.append(entry)
+        return found
+
+
+def _load():
+    fields = ('id', 'code', 'name', 'day_of_week', 'start_time', 'end_time', 'instructor_id', 'is_active')
+    entries = []
+    for row in Subject.objects.exclude(day_of_week='').filter(
+        start_time__isnull=False, end_time__isnull=False,
+    ).values_list(*fields):
+        mask = time_mask(row[3], row[4], row[5])
+        if mask:
+            entries.append(ScheduleEntry(*row, mask))
+    return ScheduleIndex(entries)
+
+
+def schedule_index():
+    """The current process's index, rebuilt if a subject changed since it was built."""
+    global _index, _index_version
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = 0
+        cache.add(VERSION_KEY, version, None)
+    if _index is None or version != _index_version:
+        _index = _load()
+        _index_version = version
+    return _index
+
+
+def invalidate_schedule_index():
+    global _index
+    _index = None
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def find_overlaps(entries):
+    """Return [(a, b), ...] for every pair of entries whose times overlap.
+
+    The combined bitmap answers the common "no conflicts" case without
+    comparing pairs; otherwise a sort-based sweep per day finds the pairs.
+    """
+    seen = 0
+    clash = False
+    for entry in entries:
+        if seen & entry.mask:
+            clash = True
+            break
+        seen |= entry.mask
+    if not clash:
+        return []
+
+    by_day = {}
+    for entry in entries:
+        by_day.setdefault(entry.day_of_week, []).append(entry)
+
+    pairs = []
+    for day in sorted(by_day, key=lambda code: DAY_INDEX.get(code, len(DAY_INDEX))):
+        open_entries = []
+        for entry in sorted(by_day[day], key=lambda e: (e.start_time, e.end_time)):
+            # drop classes that ended before this one starts
+            open_entries = [other for other in open_entries if other.end_time > entry.start_time]
+            pairs.extend((other, entry) for other in open_entries)
+            open_entries.append(entry)
+    return pairs
@@ -0,0 +1,141 @@
+"""Seat accounting for subjects, backed by the ``SeatCounter`` table.
+
+A seat is held by every enrollment whose status is in ``SEAT_HOLDING_STATUSES``.
+Counters are adjusted with ``F()`` expressions so concurrent writers never lose
+an update, and ``reserve_seat`` only increments while ``taken < capacity`` so
+two registrations racing for the last seat cannot both get it.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Enrollment, SeatCounter
+
+SEAT_HOLDING_STATUSES = ('active', 'approved')
+
+
+def holds_seat(status):
+    return status in SEAT_HOLDING_STATUSES
+
+
+def _counter(subject_id, academic_year, semester):
+    """Return (counter, created) for a term, creating the row from a live count if missing."""
+    counter = SeatCounter.objects.filter(
+        subject_id=subject_id, academic_year=academic_year, semester=semester,
+    ).first()
+    if counter is not None:
+        return counter, False
+    taken = Enrollment.objects.filter(
+        subject_id=subject_id,
+        academic_year=academic_year,
+        semester=semester,
+        status__in=SEAT_HOLDING_STATUSES,
+    ).count()
+    try:
+        with transaction.atomic():
+            return SeatCounter.objects.create(
+                subject_id=subject_id, academic_year=academic_year, semester=semester, taken=taken,
+            ), True
+    except IntegrityError:
+        # another request created it first
+        return SeatCounter.objects.get(subject_id=subject_id, academic_year=academic_year, semester=semester), False
+
+
+def adjust_seats(subject_id, academic_year, semester, delta):
+    """Add ``delta`` (+1/-1) to a term's counter after an enrollment change."""
+    counter, created = _counter(subject_id, academic_year, semester)
+    if created:
+        # the live count it was created from already includes this change
+        return
+    if delta < 0:
+        SeatCounter.objects.filter(pk=counter.pk, taken__gte=-delta).update(taken=F('taken') + delta)
+    else:
+        SeatCounter.objects.filter(pk=counter.pk).update(taken=F('taken') + delta)
+
+
+def reserve_seat(subject, academic_year, semester):
+    """Take one seat if the subject is below capacity. Returns True on success.
+
+    This is a single ``UPDATE ... WHERE taken < capacity``, so it is safe
+    against concurrent registrations without locking the enrollment table.
+    """
+    counter, _ = _counter(subject.id, academic_year, semester)
+    return SeatCounter.objects.filter(
+        pk=counter.pk, taken__lt=subject.max_capacity,
+    ).update(taken=F('taken') + 1) == 1
+
+
+def save_holding_seat(enrollment):
+    """Save ``enrollment`` (moving into a seat-holding status) only if a seat
+    can be reserved for it. Returns False, without saving, when the subject
+    is full."""
+    loaded = getattr(enrollment, '_loaded_values', None)
+    if loaded and holds_seat(loaded.get('status')) and (
+        loaded.get('subject_id'), loaded.get('academic_year'), loaded.get('semester')
+    ) == (enrollment.subject_id, enrollment.academic_year, enrollment.semester):
+        # already holding a seat in this subject and term
+        enrollment.save()
+        return True
+    with transaction.atomic():
+        if not reserve_seat(enrollment.subject, enrollment.academic_year, enrollment.semester):
+            return False
+        if loaded and holds_seat(loaded.get('status')):
+            # moving to another subject or term frees the seat it held
+            adjust_seats(loaded.get('subject_id'), loaded.get('academic_year'), loaded.get('semester'), -1)
+        # tell the post_save handler the seat is already counted
+        enrollment._seat_reserved = True
+        enrollment.save()
+    return True
+
+
+def recount_seats(subjects, academic_year, semester):
+    """Rebuild counters for ``subjects`` in a term from the enrollment table.
+
+    Needed after bulk writes (bulk_create / QuerySet.update), which bypass the
+    signal handlers that normally keep counters in sync.
+    """
+    subject_ids = [getattr(subject, 'id', subject) for subject in subjects]
+    counts = dict(
+        Enrollment.objects.filter(
+            subject_id__in=subject_ids,
+            academic_year=academic_year,
+            semester=semester,
+            status__in=SEAT_HOLDING_STATUSES,
+        ).values('subject_id').annotate(n=Count('id')).values_list('subject_id', 'n')
+    )
+    with transaction.atomic():
+        for subject_id in subject_ids:
+            SeatCounter.objects.update_or_create(
+                subject_id=subject_id,
+                academic_year=academic_year,
+                semester=semester,
+                defaults={'taken': counts.get(subject_id, 0)},
+            )
+
+
+def seat_map(subjects, academic_year=None, semester=None):
+    """Return seats taken for many subjects in one query.
+
+    With a term: {subject_id: taken}. Without one: {(subject_id, academic_year, semester): taken}.
+    Subjects without a counter row have no seats taken.
+    """
+    subject_ids = [getattr(subject, 'id', subject) for subject in subjects]
+    qs = SeatCounter.objects.filter(subject_id__in=subject_ids)
+    if academic_year is None:
+        return {
+            (subject_id, year, sem): taken
+            for subject_id, year, sem, taken in qs.values_list('subject_id', 'academic_year', 'semester', 'taken')
+        }
+    qs = qs.filter(academic_year=academic_year, semester=semester)
+    return dict(qs.values_list('subject_id', 'taken'))
+
+
+def attach_seat_info(subjects, academic_year, semester):
+    """Set current_enrollment / available_slots / is_available on each subject
+    (the values the Subject methods of the same names compute) using one query."""
+    subjects = list(subjects)
+    taken = seat_map(subjects, academic_year, semester)
+    for subject in subjects:
+        subject.current_enrollment = taken.get(subject.id, 0)
+        subject.available_slots = subject.max_capacity - subject.current_enrollment
+        subject.is_available = subject.current_enrollment < subject.max_capacity
+    return subjects
@@ -0,0 +1,60 @@
+"""Keep ``SeatCounter`` rows in step with enrollment status changes, and the
+schedule index and subject catalog in step with subject changes."""
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from sims.catalog import bump
+from .catalog import CATALOG
+from .models import Enrollment, Subject, Teacher
+from .schedule import invalidate_schedule_index
+from .seats import adjust_seats, holds_seat
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_seat_changed(sender, instance, created, **kwargs):
+    if getattr(instance, '_seat_reserved', False):
+        # save_holding_seat already took the seat with a conditional update
+        instance._seat_reserved = False
+        return
+
+    loaded = getattr(instance, '_loaded_values', None)
+    if created or loaded is None:
+        before = None
+    else:
+        before = (loaded.get('subject_id'), loaded.get('academic_year'), loaded.get('semester'), loaded.get('status'))
+    after = (instance.subject_id, instance.academic_year, instance.semester, instance.status)
+    if before == after:
+        return
+
+    if before is not None and holds_seat(before[3]):
+        adjust_seats(*before[:3], -1)
+    if holds_seat(after[3]):
+        adjust_seats(*after[:3], +1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_seat_released(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    if holds_seat(loaded.get('status', instance.status)):
+        adjust_seats(instance.subject_id, instance.academic_year, instance.semester, -1)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_changed(sender, **kwargs):
+    invalidate_schedule_index()
+    bump(CATALOG)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def instructor_changed(sender, **kwargs):
+    bump(CATALOG)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def instructor_user_changed(sender, instance, update_fields=None, **kwargs):
+    # catalog entries carry instructor names; logins only touch last_login
+    if getattr(instance, 'role', None) == 'teacher' and set(update_fields or ()) != {'last_login'}:
+        bump(CATALOG)
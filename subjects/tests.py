@@ -0,0 +1,332 @@
+import datetime
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User, StudentParent, StudentProfile
+from notifications.models import Notification
+from subjects.models import Subject, Enrollment, RegistrationRequest, Teacher
+from subjects.registration_queue import _claim_batch, _queued_ids, enqueue_registration, process_batch
+from subjects.catalog import grade_catalog
+from subjects.schedule import find_overlaps, schedule_index, time_mask
+from subjects.enrollment import bulk_enroll
+from subjects.seats import save_holding_seat, seat_map
+from subjects.timetable import student_timetable
+
+
+class BulkEnrollTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='English', code='ENG4', grade_level=4)
+        self.students = []
+        for idx in range(4):
+            user = User.objects.create_user(username=f'learner{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'LRN{idx:04d}', grade_level=4 if idx < 3 else 5)
+            self.students.append(user)
+        Enrollment.objects.create(student=self.students[0], subject=self.subject, academic_year='2024-2025', semester='first', status='pending')
+        Enrollment.objects.create(student=self.students[1], subject=self.subject, academic_year='2024-2025', semester='first', status='approved')
+
+    def test_creates_missing_promotes_existing_and_skips_other_grades(self):
+        students = User.objects.filter(role='student')
+        result = bulk_enroll(students, [self.subject], '2024-2025', 'first', status='approved')
+        self.assertEqual((result.created, result.promoted, result.skipped), (1, 1, 2))
+        self.assertEqual(len(result.failures), 1)
+        self.assertEqual(
+            set(Enrollment.objects.filter(subject=self.subject).values_list('student_id', 'status')),
+            {(self.students[0].id, 'approved'), (self.students[1].id, 'approved'), (self.students[2].id, 'approved')},
+        )
+
+        again = bulk_enroll(students, [self.subject], '2024-2025', 'first', status='approved')
+        self.assertEqual((again.created, again.promoted), (0, 0))
+
+    def test_rows_inserted_by_a_concurrent_run_are_not_counted(self):
+        atomic = transaction.atomic
+
+        def racing_atomic(*args, **kwargs):
+            # another run enrolls the same student before this one writes
+            patcher.stop()
+            Enrollment.objects.create(student=self.students[2], subject=self.subject, academic_year='2024-2025', semester='first', status='approved')
+            return atomic(*args, **kwargs)
+
+        patcher = mock.patch('subjects.enrollment.transaction.atomic', side_effect=racing_atomic)
+        patcher.start()
+        result = bulk_enroll(User.objects.filter(role='student'), [self.subject], '2024-2025', 'first', status='approved')
+        self.assertEqual((result.created, result.promoted, result.skipped), (0, 1, 3))
+
+    def test_invalid_academic_year_enrolls_nobody(self):
+        result = bulk_enroll(User.objects.filter(role='student'), [self.subject], '2024', 'first')
+        self.assertEqual(result.enrolled, 0)
+        self.assertEqual(Enrollment.objects.count(), 2)
+
+
+class SeatCounterTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Art', code='ART4', grade_level=4, max_capacity=2)
+        self.students = []
+        for idx in range(3):
+            user = User.objects.create_user(username=f'artist{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'ART{idx:04d}', grade_level=4)
+            self.students.append(user)
+
+    def _taken(self):
+        return self.subject.current_enrollment_count('2024-2025', 'first')
+
+    def _enrollment(self, student, status='pending'):
+        return Enrollment(student=student, subject=self.subject, academic_year='2024-2025', semester='first', status=status)
+
+    def test_status_changes_move_the_counter(self):
+        enrollment = self._enrollment(self.students[0], status='active')
+        enrollment.save()
+        self.assertEqual(self._taken(), 1)
+        enrollment.status = 'dropped'
+        enrollment.save()
+        self.assertEqual(self._taken(), 0)
+        enrollment = Enrollment.objects.get(pk=enrollment.pk)
+        enrollment.status = 'approved'
+        enrollment.save()
+        self.assertEqual(self._taken(), 1)
+        enrollment.delete()
+        self.assertEqual(self._taken(), 0)
+
+    def test_reservation_never_exceeds_capacity(self):
+        results = [save_holding_seat(self._enrollment(student, status='active')) for student in self.students]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(self._taken(), 2)
+        self.assertEqual(Enrollment.objects.filter(subject=self.subject).count(), 2)
+
+        # re-saving an enrollment that already holds a seat does not take another
+        existing = Enrollment.objects.get(student=self.students[0])
+        self.assertTrue(save_holding_seat(existing))
+        self.assertEqual(self._taken(), 2)
+
+    def test_moving_a_seat_holder_frees_its_old_seat(self):
+        other = Subject.objects.create(name='Sculpture', code='SCU4', grade_level=4, max_capacity=2)
+        self.assertTrue(save_holding_seat(self._enrollment(self.students[0], status='active')))
+        enrollment = Enrollment.objects.get(student=self.students[0])
+        enrollment.subject = other
+        self.assertTrue(save_holding_seat(enrollment))
+        self.assertEqual(self._taken(), 0)
+        self.assertEqual(other.current_enrollment_count('2024-2025', 'first'), 1)
+
+    def test_bulk_enroll_recounts(self):
+        bulk_enroll(User.objects.filter(role='student'), [self.subject], '2024-2025', 'first', status='approved')
+        self.assertEqual(seat_map([self.subject], '2024-2025', 'first'), {self.subject.id: 3})
+
+
+class RegistrationQueueTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Drama', code='DRA5', grade_level=5, max_capacity=1)
+        self.other_grade = Subject.objects.create(name='Drama 6', code='DRA6', grade_level=6)
+        self.students = []
+        for idx in range(2):
+            user = User.objects.create_user(username=f'actor{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'DRA{idx:04d}', grade_level=5)
+            self.students.append(user)
+
+    def test_first_come_first_served(self):
+        first = enqueue_registration(self.students[0], [self.subject.id, self.other_grade.id], '2024-2025', 'first')
+        second = enqueue_registration(self.students[1], [str(self.subject.id)], '2024-2025', 'first')
+        self.assertFalse(Enrollment.objects.exists())
+
+        self.assertEqual(process_batch(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'done')
+        self.assertEqual(first.outcome[str(self.subject.id)], 'active')
+        self.assertIn('Grade 6', first.outcome[str(self.other_grade.id)])
+        self.assertEqual(second.outcome[str(self.subject.id)], 'waitlisted')
+        self.assertEqual(self.subject.current_enrollment_count('2024-2025', 'first'), 1)
+        self.assertEqual(Notification.objects.filter(title='Subject registration processed').count(), 2)
+        self.assertEqual(process_batch(), 0)
+
+    def test_duplicate_request_is_reported(self):
+        enqueue_registration(self.students[0], [self.subject.id], '2024-2025', 'first')
+        enqueue_registration(self.students[0], [self.subject.id], '2024-2025', 'first')
+        process_batch()
+        outcomes = [r.outcome[str(self.subject.id)] for r in RegistrationRequest.objects.order_by('id')]
+        self.assertEqual(outcomes, ['active', 'already enrolled'])
+
+    def test_request_left_processing_by_a_dead_worker_is_requeued(self):
+        registration = enqueue_registration(self.students[0], [self.subject.id], '2024-2025', 'first')
+        RegistrationRequest.objects.filter(pk=registration.pk).update(
+            status='processing', claimed_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        with override_settings(REGISTRATION_CLAIM_TIMEOUT_SECONDS=600):
+            self.assertEqual(process_batch(), 1)
+        registration.refresh_from_db()
+        self.assertEqual(registration.status, 'done')
+        self.assertEqual(registration.outcome[str(self.subject.id)], 'active')
+
+    def test_two_workers_reading_the_same_requests_claim_each_once(self):
+        for student in self.students:
+            enqueue_registration(student, [self.subject.id], '2024-2025', 'first')
+        ids = _queued_ids(10)
+        # both workers read the queue before either one claimed it
+        with mock.patch('subjects.registration_queue._queued_ids', return_value=ids):
+            first = _claim_batch(10)
+            second = _claim_batch(10)
+        self.assertEqual([r.pk for r in first], ids)
+        self.assertEqual(second, [])
+        self.assertEqual(RegistrationRequest.objects.values('claim_token').distinct().count(), 1)
+
+
+class ScheduleIndexTests(TestCase):
+    def setUp(self):
+        teacher_user = User.objects.create_user(username='sched_teacher', password='pass', role='teacher')
+        self.teacher = Teacher.objects.create(user=teacher_user, teacher_id='T-SCHED', department='Science')
+        self.math = self._subject('MTH7', 'mon', 9, 0, 10, 0)
+        self.science = self._subject('SCI7', 'mon', 9, 30, 10, 30)
+        self.music = self._subject('MUS7', 'mon', 10, 0, 11, 0)
+
+    def _subject(self, code, day, h1, m1, h2, m2, **extra):
+        return Subject.objects.create(
+            name=code, code=code, grade_level=7, day_of_week=day,
+            start_time=datetime.time(h1, m1), end_time=datetime.time(h2, m2), **extra,
+        )
+
+    def test_masks_and_sweep(self):
+        self.assertEqual(time_mask('mon', datetime.time(0, 0), datetime.time(0, 10)), 0b11)
+        self.assertEqual(time_mask('', datetime.time(9), datetime.time(10)), 0)
+        index = schedule_index()
+        pairs = find_overlaps(index.lookup([self.math.id, self.science.id, self.music.id]))
+        self.assertEqual(
+            [(a.code, b.code) for a, b in pairs],
+            [('MTH7', 'SCI7'), ('SCI7', 'MUS7')],
+        )
+        # back-to-back classes do not conflict
+        self.assertEqual(find_overlaps(index.lookup([self.math.id, self.music.id])), [])
+
+    def test_index_is_cached_and_refreshed_on_save(self):
+        schedule_index()
+        with self.assertNumQueries(0):
+            schedule_index().lookup([self.math.id])
+        self.music.start_time = datetime.time(9, 45)
+        self.music.save()
+        self.assertEqual(len(find_overlaps(schedule_index().lookup([self.math.id, self.music.id]))), 1)
+
+    def test_clean_rejects_instructor_double_booking(self):
+        self.math.instructor = self.teacher
+        self.math.save()
+        clash = Subject(
+            name='Lab', code='LAB7', grade_level=7, instructor=self.teacher, day_of_week='mon',
+            start_time=datetime.time(9, 55), end_time=datetime.time(10, 30),
+        )
+        with self.assertRaisesMessage(ValidationError, 'Time conflict with MTH7'):
+            clash.clean()
+        clash.start_time = datetime.time(10, 0)
+        clash.clean()
+
+    def test_clean_sees_bookings_the_schedule_index_missed(self):
+        schedule_index()
+        # QuerySet.update() skips the signal that refreshes the index
+        Subject.objects.filter(pk=self.science.pk).update(instructor=self.teacher)
+        clash = Subject(
+            name='Lab', code='LAB7', grade_level=7, instructor=self.teacher, day_of_week='mon',
+            start_time=datetime.time(10, 0), end_time=datetime.time(10, 45),
+        )
+        with self.assertRaisesMessage(ValidationError, 'Time conflict with SCI7'):
+            clash.clean()
+
+
+class GradeCatalogTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.teacher_user = User.objects.create_user(username='cat_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=self.teacher_user, teacher_id='T-CAT', department='Maths')
+        self.maths = Subject.objects.create(name='Maths', code='MTH6', grade_level=6, instructor=teacher)
+        Subject.objects.create(name='maths ', code='MTH6B', grade_level=6)
+        self.art = Subject.objects.create(name='Art', code='ART6', grade_level=6, subject_type='elective')
+        Subject.objects.create(name='Biology', code='BIO6', grade_level=6, is_active=False)
+
+    def test_catalog_is_deduplicated_and_cached(self):
+        with self.assertNumQueries(1):
+            subjects = grade_catalog(6)
+        self.assertEqual([s.code for s in subjects], ['ART6', 'MTH6'])
+        with self.assertNumQueries(0):
+            self.assertEqual(grade_catalog(6)[1].instructor.user.username, 'cat_teacher')
+        self.assertEqual([s.code for s in grade_catalog(6, ['core'])], ['MTH6'])
+
+    def test_changes_bump_the_generation(self):
+        grade_catalog(6)
+        self.art.name = 'Drawing'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.art.save()
+        self.assertEqual([s.name for s in grade_catalog(6)], ['Drawing', 'Maths'])
+        self.teacher_user.first_name = 'Ada'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_user.save()
+        self.assertEqual(grade_catalog(6)[1].instructor.user.first_name, 'Ada')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maths.delete()
+        self.assertEqual([s.code for s in grade_catalog(6)], ['ART6', 'MTH6B'])
+
+
+class TimetableTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.teacher_user = User.objects.create_user(username='tt_teacher', password='pass', role='teacher', first_name='Ada', last_name='Byron')
+        teacher = Teacher.objects.create(user=self.teacher_user, teacher_id='T-TT', department='Maths')
+        nine, ten, eleven = datetime.time(9), datetime.time(10), datetime.time(11)
+        self.maths = Subject.objects.create(name='Maths', code='MTH7', grade_level=7, instructor=teacher, day_of_week='mon', start_time=nine, end_time=ten, room='R1')
+        self.english = Subject.objects.create(name='English', code='ENG7', grade_level=7, day_of_week='wed', start_time=nine, end_time=ten)
+        self.art = Subject.objects.create(name='Art', code='ART7', grade_level=7, subject_type='elective', day_of_week='sat', start_time=ten, end_time=eleven)
+        self.reading = Subject.objects.create(name='Reading', code='RD7', grade_level=7)
+        self.student = User.objects.create_user(username='tt_student', password='pass', role='student')
+        StudentProfile.objects.create(user=self.student, student_id='TT0001', grade_level=7)
+        for subject in (self.maths, self.english, self.art, self.reading):
+            Enrollment.objects.create(student=self.student, subject=subject, academic_year='2025-2026', semester='first', status='approved')
+        Enrollment.objects.create(student=self.student, subject=self.english, academic_year='2024-2025', semester='second', status='approved')
+
+    def test_grid_is_built_from_enrollments_and_cached_per_grade(self):
+        with self.assertNumQueries(2):
+            timetable = student_timetable(self.student)
+        self.assertEqual(timetable.term, ('2025-2026', 'first'))
+        self.assertEqual([code for code, _ in timetable.days], ['mon', 'tue', 'wed', 'thu', 'fri', 'sat'])
+        self.assertEqual([(row['start'], row['end']) for row in timetable.rows], [
+            (datetime.time(9), datetime.time(10)), (datetime.time(10), datetime.time(11)),
+        ])
+        first = timetable.rows[0]['cells']
+        self.assertEqual(([e.code for e in first[0]], [e.code for e in first[2]]), (['MTH7'], ['ENG7']))
+        self.assertEqual(first[0][0].instructor, 'Ada Byron')
+        self.assertEqual(timetable.rows[1]['cells'][5][0].code, 'ART7')
+        self.assertEqual([e.code for e in timetable.unscheduled], ['RD7'])
+
+        with self.assertNumQueries(1):
+            older = student_timetable(self.student, '2024-2025', 'second')
+        self.assertEqual([e.code for e in older.entries], ['ENG7'])
+        self.assertEqual([code for code, _ in older.days], ['mon', 'tue', 'wed', 'thu', 'fri'])
+
+    def test_subject_changes_reach_the_cached_grid(self):
+        student_timetable(self.student)
+        self.maths.room = 'Lab 2'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maths.save()
+        self.assertEqual(student_timetable(self.student).rows[0]['cells'][0][0].room, 'Lab 2')
+
+    def test_exports(self):
+        self.client.force_login(self.student)
+        data = self.client.get(reverse('view_subjects_export', args=['json'])).json()
+        self.assertEqual([c['code'] for c in data['classes']], ['MTH7', 'ENG7', 'ART7'])
+        self.assertEqual(data['classes'][0]['start'], '09:00')
+
+        response = self.client.get(reverse('view_subjects_export', args=['ics']))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        self.assertIn('LOCATION:R1', body)
+        self.assertEqual(self.client.get(reverse('view_subjects_export', args=['pdf'])).status_code, 404)
+
+    def test_parent_schedule_page(self):
+        parent = User.objects.create_user(username='tt_parent', password='pass', role='parent')
+        StudentParent.objects.create(parent=parent, student=self.student, relationship='Mother')
+        self.client.force_login(parent)
+        response = self.client.get(reverse('child_schedule', args=[self.student.id]))
+        self.assertContains(response, 'MTH7')
+        self.assertContains(response, 'Not yet scheduled')
+        response = self.client.get(reverse('child_schedule_export', args=[self.student.id, 'json']), {'academic_year': '2024-2025', 'semester': 'second'})
+        self.assertEqual([c['code'] for c in response.json()['classes']], ['ENG7'])
+
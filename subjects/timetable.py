@@ -0,0 +1,207 @@
+"""Weekly timetables built from the subjects' own schedules.
+
+A grade's subjects (day, times, room, instructor) are the same for every
+student in it, so they are cached per grade in the ``subjects`` catalog (see
+``sims.catalog``); subject, teacher and instructor-name changes bump it. A
+student's timetable is one enrollment query -- the subject ids and grades of
+their seat-holding enrollments for a term -- laid over those cached grades,
+electives from another grade included, so no cell costs a query.
+
+``Timetable.rows`` is the day x period grid the templates render;
+``as_json`` and ``as_ical`` are the export formats.
+"""
+import datetime
+from collections import namedtuple
+from functools import cached_property
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils import timezone
+
+from sims.catalog import cached
+from .catalog import CATALOG
+from .models import Enrollment, Subject, Teacher
+from .schedule import DAY_INDEX, DAY_NAMES
+from .seats import SEAT_HOLDING_STATUSES
+
+WEEKDAYS = [code for code, _ in Teacher.DAYS_OF_WEEK[:5]]
+EXPORT_FORMATS = ('json', 'ics')
+
+
+class TimetableEntry(namedtuple('TimetableEntry', [
+    'subject_id', 'code', 'name', 'subject_type', 'grade_level',
+    'day_of_week', 'start_time', 'end_time', 'room', 'instructor',
+])):
+    __slots__ = ()
+
+    @classmethod
+    def from_subject(cls, subject):
+        instructor = subject.instructor
+        user = getattr(instructor, 'user', None) if instructor is not None else None
+        return cls(
+            subject.pk, subject.code, subject.name, subject.subject_type, subject.grade_level,
+            subject.day_of_week, subject.start_time, subject.end_time, subject.room,
+            (user.get_full_name() or user.username) if user is not None else '',
+        )
+
+    @property
+    def is_scheduled(self):
+        return bool(self.day_of_week in DAY_INDEX and self.start_time and self.end_time)
+
+    @property
+    def day_display(self):
+        return DAY_NAMES.get(self.day_of_week, self.day_of_week)
+
+    @property
+    def time_display(self):
+        return f"{self.start_time.strftime('%H:%M')} - {self.end_time.strftime('%H:%M')}"
+
+
+def grade_timetable(grade_level):
+    """{subject_id: TimetableEntry} for the active subjects of ``grade_level``."""
+    def build():
+        subjects = Subject.objects.filter(grade_level=grade_level, is_active=True).select_related('instructor__user')
+        return {subject.id: TimetableEntry.from_subject(subject) for subject in subjects}
+
+    return cached(CATALOG, f'timetable:{grade_level}', build)
+
+
+class Timetable:
+    """A student's subjects for one term, scheduled ones laid out by day and period."""
+
+    def __init__(self, entries, term=None, terms=()):
+        self.term = term
+        self.terms = list(terms)
+        self.entries = sorted(
+            (entry for entry in entries if entry.is_scheduled),
+            key=lambda entry: (DAY_INDEX[entry.day_of_week], entry.start_time, entry.end_time, entry.code),
+        )
+        self.unscheduled = sorted((entry for entry in entries if not entry.is_scheduled), key=lambda entry: entry.name)
+
+    def __bool__(self):
+        return bool(self.entries or self.unscheduled)
+
+    @cached_property
+    def days(self):
+        """[(code, name)]: Monday to Friday, plus Saturday when a class is on it."""
+        used = {entry.day_of_week for entry in self.entries}
+        return [(code, name) for code, name in Teacher.DAYS_OF_WEEK if code in WEEKDAYS or code in used]
+
+    @cached_property
+    def periods(self):
+        return sorted({(entry.start_time, entry.end_time) for entry in self.entries})
+
+    @cached_property
+    def rows(self):
+        """[{'start', 'end', 'cells'}], one per period; ``cells`` holds a list
+        of entries per day (more than one only when classes clash)."""
+        column = {code: idx for idx, (code, _) in enumerate(self.days)}
+        row_for = {period: idx for idx, period in enumerate(self.periods)}
+        rows = [{'start': start, 'end': end, 'cells': [[] for _ in self.days]} for start, end in self.periods]
+        for entry in self.entries:
+            rows[row_for[(entry.start_time, entry.end_time)]]['cells'][column[entry.day_of_week]].append(entry)
+        return rows
+
+    def as_json(self):
+        def item(entry):
+            data = {
+                'subject_id': entry.subject_id,
+                'code': entry.code,
+                'name': entry.name,
+                'subject_type': entry.subject_type,
+                'room': entry.room,
+                'instructor': entry.instructor,
+            }
+            if entry.is_scheduled:
+                data.update(
+                    day=entry.day_of_week,
+                    start=entry.start_time.strftime('%H:%M'),
+                    end=entry.end_time.strftime('%H:%M'),
+                )
+            return data
+
+        academic_year, semester = self.term or (None, None)
+        return {
+            'academic_year': academic_year,
+            'semester': semester,
+            'days': [code for code, _ in self.days],
+            'periods': [{'start': start.strftime('%H:%M'), 'end': end.strftime('%H:%M')} for start, end in self.periods],
+            'classes': [item(entry) for entry in self.entries],
+            'unscheduled': [item(entry) for entry in self.unscheduled],
+        }
+
+    def as_ical(self, calendar_name, start=None):
+        """The scheduled classes as weekly repeating events, beginning with the
+        week of ``start`` (default today) for ``TIMETABLE_ICAL_WEEKS`` weeks."""
+        start = start or timezone.localdate()
+        monday = start - datetime.timedelta(days=start.weekday())
+        weeks = getattr(settings, 'TIMETABLE_ICAL_WEEKS', 20)
+        stamp = timezone.now().astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        term = '-'.join(self.term) if self.term else 'current'
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//SIMS//Timetable//EN',
+            'CALSCALE:GREGORIAN',
+            f'X-WR-CALNAME:{_ical_text(calendar_name)}',
+        ]
+        for entry in self.entries:
+            day = monday + datetime.timedelta(days=DAY_INDEX[entry.day_of_week])
+            lines += [
+                'BEGIN:VEVENT',
+                f'UID:{term}-{entry.subject_id}-{entry.day_of_week}@sims',
+                f'DTSTAMP:{stamp}',
+                f"DTSTART:{datetime.datetime.combine(day, entry.start_time).strftime('%Y%m%dT%H%M%S')}",
+                f"DTEND:{datetime.datetime.combine(day, entry.end_time).strftime('%Y%m%dT%H%M%S')}",
+                f'RRULE:FREQ=WEEKLY;COUNT={weeks}',
+                f'SUMMARY:{_ical_text(f"{entry.code} - {entry.name}")}',
+            ]
+            if entry.room:
+                lines.append(f'LOCATION:{_ical_text(entry.room)}')
+            if entry.instructor:
+                lines.append(f'DESCRIPTION:{_ical_text("Instructor: " + entry.instructor)}')
+            lines.append('END:VEVENT')
+        lines.append('END:VCALENDAR')
+        return '\r\n'.join(lines) + '\r\n'
+
+
+def _ical_text(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def student_timetable(student, academic_year=None, semester=None):
+    """``student``'s Timetable for a term (default: the latest term they hold
+    enrollments in), from a single query when their grades are cached."""
+    rows = list(
+        Enrollment.objects.filter(student=student, status__in=SEAT_HOLDING_STATUSES)
+        .values_list('academic_year', 'semester', 'subject_id', 'subject__grade_level')
+    )
+    # 'first' < 'second', so the latest term also sorts last
+    terms = sorted({(row[0], row[1]) for row in rows}, reverse=True)
+    term = (academic_year, semester) if academic_year and semester else (terms[0] if terms else None)
+    grades = {}
+    entries = []
+    for year, sem, subject_id, grade_level in rows:
+        if (year, sem) != term:
+            continue
+        if grade_level not in grades:
+            grades[grade_level] = grade_timetable(grade_level)
+        entry = grades[grade_level].get(subject_id)
+        if entry is not None and entry not in entries:
+            entries.append(entry)
+    return Timetable(entries, term, terms)
+
+
+def export_response(timetable, fmt, name):
+    """The timetable as a JSON or iCalendar download; 404 for other formats."""
+    if fmt not in EXPORT_FORMATS:
+        raise Http404('Unknown timetable format')
+    slug = ''.join(ch if ch.isalnum() else '-' for ch in name).strip('-').lower() or 'timetable'
+    if fmt == 'json':
+        return JsonResponse(timetable.as_json())
+    response = HttpResponse(timetable.as_ical(f'{name} timetable'), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{slug}-timetable.ics"'
+    return response
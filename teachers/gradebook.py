@@ -0,0 +1,221 @@
+"""Term gradebook: grouped score averages for a teacher's subjects in one term.
+
+The teacher pages used to issue an Enrollment query plus an ``Avg`` query for
+every student on the roster, and another ``Avg`` per subject. Here each kind of
+average is a single ``values().annotate()`` query, so page cost no longer
+depends on how many students are enrolled.
+
+``save_class_scores`` is the write side: a whole class's component scores are
+validated in memory and applied with bulk writes in one transaction.
+"""
+from django.db import transaction
+from django.db.models import Avg, Count, Exists, OuterRef
+
+from ranks.models import Grade
+from subjects.models import Enrollment
+
+ENROLLED_STATUSES = ('approved', 'active')
+
+# maximum points per component; they add up to the 100 point total
+COMPONENT_WEIGHTS = {'quiz': 5, 'mid': 25, 'assignment': 20, 'final': 50}
+GRADE_FIELDS = {'quiz': 'quiz_score', 'mid': 'mid_score', 'assignment': 'assignment_score', 'final': 'final_exam_score'}
+
+LETTER_GRADE_TO_SCORE = {
+    'A+': 98,
+    'A': 95,
+    'A-': 92,
+    'B+': 88,
+    'B': 85,
+    'B-': 82,
+    'C+': 78,
+    'C': 75,
+    'C-': 72,
+    'D+': 68,
+    'D': 65,
+    'D-': 62,
+    'F': 55,
+}
+
+
+def letter_grade_to_numeric(letter):
+    """Map letter grades to an elementary-friendly 100 point scale."""
+    if not letter:
+        return None
+    return LETTER_GRADE_TO_SCORE.get(letter.strip().upper())
+
+
+class TermGradebook:
+    """Scores for ``subjects`` restricted to students enrolled in them for the
+    given academic year and semester."""
+
+    def __init__(self, subjects, academic_year, semester):
+        self.subjects = subjects
+        self.academic_year = academic_year
+        self.semester = semester
+        self._student_averages = None
+        self._subject_averages = None
+
+    def enrollments(self):
+        return Enrollment.objects.filter(
+            subject__in=self.subjects,
+            academic_year=self.academic_year,
+            semester=self.semester,
+            status__in=ENROLLED_STATUSES,
+        )
+
+    def grades(self):
+        """Grade rows whose student is enrolled in that subject for this term."""
+        term_enrollment = Enrollment.objects.filter(
+            student=OuterRef('student'),
+            subject=OuterRef('subject'),
+            academic_year=self.academic_year,
+            semester=self.semester,
+            status__in=ENROLLED_STATUSES,
+        )
+        return Grade.objects.filter(subject__in=self.subjects).filter(Exists(term_enrollment))
+
+    def student_averages(self):
+        """Return {student_id: average score across this gradebook's subjects}."""
+        if self._student_averages is None:
+            rows = self.grades().values('student_id').annotate(average=Avg('score')).order_by()
+            self._student_averages = {
+                row['student_id']: round(row['average'], 2) if row['average'] is not None else None
+                for row in rows
+            }
+        return self._student_averages
+
+    def subject_averages(self):
+        """Return {subject_id: {'average': ..., 'graded': n}} for this term."""
+        if self._subject_averages is None:
+            rows = self.grades().values('subject_id').annotate(average=Avg('score'), graded=Count('score')).order_by()
+            self._subject_averages = {
+                row['subject_id']: {
+                    'average': round(row['average'], 2) if row['average'] is not None else None,
+                    'graded': row['graded'],
+                }
+                for row in rows
+            }
+        return self._subject_averages
+
+    def subject_average(self, subject):
+        return self.subject_averages().get(getattr(subject, 'id', subject), {}).get('average')
+
+
+def _parse_int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def score_components(quiz=None, mid=None, assignment=None, final_exam=None, score=None, override_avg=None):
+    """Validate and clamp one student's input.
+
+    Returns (total, {component: points}). Component inputs win over ``score``;
+    each is clamped to its weight and missing ones count as 0, unless
+    ``override_avg`` replaces the total. A bare ``score`` is split across the
+    components in proportion to their weights. Raises ValueError for a
+    ``score`` that is not a number.
+    """
+    components = {
+        'quiz': _parse_int(quiz), 'mid': _parse_int(mid),
+        'assignment': _parse_int(assignment), 'final': _parse_int(final_exam),
+    }
+    if any(value is not None for value in components.values()):
+        components = {
+            name: max(0, min(weight, components[name] or 0)) for name, weight in COMPONENT_WEIGHTS.items()
+        }
+        total = max(0, min(100, sum(components.values())))
+        override = _parse_int(override_avg)
+        if override is not None:
+            total = max(0, min(100, override))
+        return total, components
+
+    if score is None or score == '':
+        return None, {}
+    try:
+        total = max(0, min(100, int(float(score))))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid score')
+    # allocate the total so the components are visible after saving
+    components = {name: max(0, min(weight, int(round(total * weight / 100.0)))) for name, weight in COMPONENT_WEIGHTS.items()}
+    diff = total - sum(components.values())
+    if diff:
+        components['final'] = max(0, min(COMPONENT_WEIGHTS['final'], components['final'] + diff))
+    return total, components
+
+
+def save_class_scores(subject, rows):
+    """Save many students' scores for ``subject`` at once.
+
+    ``rows`` are dicts with ``student_id`` and any of ``quiz``, ``mid``,
+    ``assignment``, ``final_exam``, ``score``, ``override_avg`` and ``result``.
+    Returns (saved, errors, average): ``saved`` lists each student's new total,
+    ``errors`` the rows that were rejected, and ``average`` the subject's
+    recomputed average score.
+    """
+    from ranks.standings import refresh_for_subject_bulk
+    from ranks.stats import SubjectStats, invalidate_subject_stats
+
+    errors = []
+    parsed = {}
+    for row in rows:
+        student_id = _parse_int(row.get('student_id')) if isinstance(row, dict) else None
+        if student_id is None:
+            errors.append({'student_id': None, 'message': 'Missing student_id'})
+            continue
+        try:
+            total, components = score_components(
+                row.get('quiz'), row.get('mid'), row.get('assignment'), row.get('final_exam'),
+                row.get('score'), row.get('override_avg'),
+            )
+        except ValueError as e:
+            errors.append({'student_id': student_id, 'message': str(e)})
+            continue
+        if total is None and not components and row.get('result') is None:
+            continue  # nothing entered for this student
+        parsed[student_id] = (total, components, row.get('result'))
+
+    # latest term wins when a student has taken the subject more than once
+    enrollments = {
+        enrollment.student_id: enrollment
+        for enrollment in Enrollment.objects.filter(
+            subject=subject, student_id__in=parsed, student__role='student', status__in=ENROLLED_STATUSES,
+        ).order_by('academic_year', 'semester')
+    }
+    for student_id in [student_id for student_id in parsed if student_id not in enrollments]:
+        errors.append({'student_id': student_id, 'message': 'Student is not enrolled in this subject'})
+        del parsed[student_id]
+
+    grades = {grade.student_id: grade for grade in Grade.objects.filter(subject=subject, student_id__in=parsed)}
+    created, changed, results = [], [], []
+    saved = []
+    for student_id, (total, components, result) in parsed.items():
+        grade = grades.get(student_id)
+        if grade is None:
+            grade = Grade(student_id=student_id, subject=subject)
+            created.append(grade)
+        else:
+            changed.append(grade)
+        if total is not None:
+            grade.score = total
+        for name, points in components.items():
+            setattr(grade, GRADE_FIELDS[name], points)
+        if result is not None:
+            grade.remarks = result
+            enrollment = enrollments[student_id]
+            enrollment.result = str(result)[:50]
+            results.append(enrollment)
+        saved.append({'student_id': student_id, 'total': grade.score})
+
+    with transaction.atomic():
+        Grade.objects.bulk_create(created)
+        Grade.objects.bulk_update(changed, ['score', *GRADE_FIELDS.values(), 'remarks'])
+        Enrollment.objects.bulk_update(results, ['result'])
+        # bulk writes skip the per-row signals, so refresh the standings here
+        refresh_for_subject_bulk(list(parsed), subject.id)
+    invalidate_subject_stats(subject.id)
+
+    return saved, errors, SubjectStats.for_subject(subject).mean
@@ -0,0 +1,156 @@
+"""Gradebook import from CSV or XLSX files.
+
+Rows are read as a stream (``csv`` over the uploaded file, or openpyxl in
+read-only mode for ``.xlsx``) and handled ``IMPORT_CHUNK_ROWS`` at a time, so
+memory stays flat however long the sheet is: each chunk's student IDs are
+resolved with one ``IN`` query (``students.lookup``, so IDs match
+case-insensitively) and its scores are applied through ``save_class_scores``
+with bulk operations, all chunks in one transaction. Problems are reported per
+sheet row instead of aborting the import.
+
+Recognised columns (header names are case-insensitive): ``student_id``,
+``quiz``, ``mid``, ``assignment``, ``final`` and ``score`` (a total out of 100
+or a letter grade; ``grade`` and ``total`` are accepted too), plus an optional
+``remarks``.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.db import transaction
+
+from students.lookup import resolve_students
+from .gradebook import letter_grade_to_numeric, save_class_scores
+
+try:
+    from openpyxl import load_workbook
+except Exception:
+    load_workbook = None
+
+IMPORT_CHUNK_ROWS = 500
+
+COLUMN_ALIASES = {
+    'student_id': 'student_id', 'student id': 'student_id', 'id': 'student_id',
+    'quiz': 'quiz',
+    'mid': 'mid', 'midterm': 'mid',
+    'assignment': 'assignment',
+    'final': 'final_exam', 'final_exam': 'final_exam', 'final exam': 'final_exam',
+    'score': 'score', 'total': 'score', 'grade': 'score',
+    'remarks': 'result', 'result': 'result',
+}
+
+
+class ImportFileError(Exception):
+    """The file cannot be read at all (bad format or missing columns)."""
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(uploaded):
+    text = io.TextIOWrapper(uploaded, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f'Could not read the CSV file: {e}')
+    finally:
+        text.detach()
+
+
+def _xlsx_rows(uploaded):
+    if load_workbook is None:
+        raise ImportFileError('XLSX import requires openpyxl. Install with `pip install openpyxl` or upload a CSV.')
+    try:
+        workbook = load_workbook(uploaded, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f'Could not read the XLSX file: {e}')
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_sheet(uploaded):
+    """Yield (row number, {column: value}) for each non-empty data row."""
+    name = (getattr(uploaded, 'name', '') or '').lower()
+    rows = _xlsx_rows(uploaded) if name.endswith('.xlsx') else _csv_rows(uploaded)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty.')
+    columns = [COLUMN_ALIASES.get(_cell(title).lower()) for title in header]
+    if 'student_id' not in columns:
+        raise ImportFileError('The file needs a student_id column.')
+    for number, row in enumerate(rows, start=2):
+        values = {column: _cell(value) for column, value in zip(columns, row) if column}
+        if any(values.values()):
+            yield number, values
+
+
+def _score(value):
+    """Numeric totals pass through; letter grades map to the 100 point scale."""
+    if not value:
+        return value
+    try:
+        float(value)
+        return value
+    except ValueError:
+        letter = letter_grade_to_numeric(value)
+        return letter if letter is not None else value
+
+
+def _import_chunk(subject, chunk):
+    """Import one chunk of (row number, values); returns (saved, errors)."""
+    profiles = {
+        identifier: user.id
+        for identifier, user in resolve_students(
+            {values['student_id'] for _, values in chunk if values.get('student_id')},
+            students_only=True, kinds=['student_id'],
+        ).items()
+    }
+
+    errors = []
+    rows = []
+    line_for = {}
+    for number, values in chunk:
+        external_id = values.get('student_id', '')
+        user_id = profiles.get(external_id)
+        if user_id is None:
+            errors.append({'row': number, 'student_id': external_id, 'message': 'Unknown student ID'})
+            continue
+        row = {key: value for key, value in values.items() if key != 'student_id' and value != ''}
+        if 'score' in row:
+            row['score'] = _score(row['score'])
+        row['student_id'] = user_id
+        rows.append(row)
+        line_for[user_id] = (number, external_id)
+
+    saved, rejected, _ = save_class_scores(subject, rows)
+    for error in rejected:
+        number, external_id = line_for.get(error['student_id'], (None, ''))
+        errors.append({'row': number, 'student_id': external_id, 'message': error['message']})
+    return len(saved), errors
+
+
+def import_scores(subject, uploaded):
+    """Import a gradebook sheet into ``subject``.
+
+    Returns (saved, errors): the number of students saved and a list of
+    {'row', 'student_id', 'message'} for rows that were skipped. Raises
+    ImportFileError when the file itself is unusable.
+    """
+    saved = 0
+    errors = []
+    rows = read_sheet(uploaded)
+    with transaction.atomic():
+        while chunk := list(islice(rows, IMPORT_CHUNK_ROWS)):
+            chunk_saved, chunk_errors = _import_chunk(subject, chunk)
+            saved += chunk_saved
+            errors.extend(chunk_errors)
+    errors.sort(key=lambda error: error['row'] or 0)
+    return saved, errors
@@ -0,0 +1,326 @@
+import datetime
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from ranks.models import ClassStanding, Grade
+from subjects.attendance import TermAttendance, record_roll_call
+from subjects.models import AttendanceLog, Enrollment, Subject, Teacher
+from users.models import StudentParent, StudentProfile, User
+from teachers.gradebook import TermGradebook, score_components
+
+
+class TermGradebookTests(TestCase):
+    def setUp(self):
+        self.maths = Subject.objects.create(name='Maths', code='MTH4B', grade_level=4)
+        self.science = Subject.objects.create(name='Science', code='SCI4B', grade_level=4)
+        self.students = []
+        for idx in range(4):
+            user = User.objects.create_user(username=f'book_student{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'BK{idx:04d}', grade_level=4)
+            self.students.append(user)
+        first, second, last_year, dropped = self.students
+        for student, subject, year, status in [
+            (first, self.maths, '2024-2025', 'active'), (first, self.science, '2024-2025', 'approved'),
+            (second, self.maths, '2024-2025', 'active'),
+            (last_year, self.maths, '2023-2024', 'active'),
+            (dropped, self.science, '2024-2025', 'dropped'),
+        ]:
+            Enrollment.objects.create(student=student, subject=subject, academic_year=year, semester='first', status=status)
+        for student, subject, score in [
+            (first, self.maths, 80), (first, self.science, 91), (second, self.maths, 60),
+            (last_year, self.maths, 10), (dropped, self.science, 20),
+        ]:
+            Grade.objects.create(student=student, subject=subject, score=score)
+
+    def test_averages_cover_the_term_roster_in_one_query_each(self):
+        gradebook = TermGradebook([self.maths, self.science], '2024-2025', 'first')
+        with self.assertNumQueries(2):
+            students = gradebook.student_averages()
+            subjects = gradebook.subject_averages()
+            gradebook.student_averages()
+            self.assertEqual(gradebook.subject_average(self.science), 91.0)
+        # other terms' and dropped students' grades stay out
+        self.assertEqual(students, {self.students[0].id: 85.5, self.students[1].id: 60.0})
+        self.assertEqual(subjects, {
+            self.maths.id: {'average': 70.0, 'graded': 2},
+            self.science.id: {'average': 91.0, 'graded': 1},
+        })
+        self.assertIsNone(TermGradebook([self.maths], '2022-2023', 'first').subject_average(self.maths))
+
+
+class ClassScoreBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(username='grade_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=self.teacher_user, teacher_id='T-GRADE', department='Maths')
+        self.subject = Subject.objects.create(name='Maths', code='MTH4', grade_level=4, instructor=teacher)
+        self.students = []
+        for idx in range(3):
+            user = User.objects.create_user(username=f'grade_student{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'G{idx:04d}', grade_level=4)
+            Enrollment.objects.create(student=user, subject=self.subject, academic_year='2024-2025', semester='first', status='active')
+            self.students.append(user)
+        Grade.objects.create(student=self.students[0], subject=self.subject, score=50)
+        self.client.force_login(self.teacher_user)
+
+    def _post(self, rows):
+        return self.client.post(
+            reverse('save_class_scores'), json.dumps({'subject_id': self.subject.id, 'rows': rows}),
+            content_type='application/json',
+        )
+
+    def test_components_are_clamped_and_a_bare_score_is_allocated(self):
+        self.assertEqual(score_components('9', '30', '10', '40'), (80, {'quiz': 5, 'mid': 25, 'assignment': 10, 'final': 40}))
+        self.assertEqual(score_components('1', None, None, None, override_avg='88')[0], 88)
+        self.assertEqual(score_components(score='80'), (80, {'quiz': 4, 'mid': 20, 'assignment': 16, 'final': 40}))
+        self.assertEqual(score_components(), (None, {}))
+        with self.assertRaises(ValueError):
+            score_components(score='abc')
+
+    def test_whole_class_is_saved_in_one_request(self):
+        outsider = User.objects.create_user(username='grade_outsider', password='pass', role='student')
+        rows = [
+            {'student_id': self.students[0].id, 'quiz': 5, 'mid': 20, 'assignment': 20, 'final_exam': 45},
+            {'student_id': self.students[1].id, 'score': '60'},
+            {'student_id': self.students[2].id, 'score': ''},
+            {'student_id': outsider.id, 'score': 70},
+            {'student_id': self.students[2].id, 'score': 'abc'},
+        ]
+        with self.assertNumQueries(23):
+            response = self._post(rows)
+        data = response.json()
+        self.assertEqual(data['saved'], [
+            {'student_id': self.students[0].id, 'total': 90},
+            {'student_id': self.students[1].id, 'total': 60},
+        ])
+        self.assertEqual(sorted(e['student_id'] for e in data['errors']), sorted([outsider.id, self.students[2].id]))
+        self.assertEqual(data['avg'], 75.0)
+
+        grade = Grade.objects.get(student=self.students[0], subject=self.subject)
+        self.assertEqual((grade.score, grade.quiz_score, grade.final_exam_score), (90, 5, 45))
+        self.assertFalse(Grade.objects.filter(student=self.students[2]).exists())
+        ranks = dict(ClassStanding.objects.filter(grade_level=4).values_list('student_id', 'rank'))
+        self.assertEqual(ranks, {self.students[0].id: 1, self.students[1].id: 2, self.students[2].id: None})
+
+    def test_other_teachers_subject_is_rejected(self):
+        other = User.objects.create_user(username='other_teacher', password='pass', role='teacher')
+        self.client.force_login(other)
+        response = self._post([{'student_id': self.students[0].id, 'score': 10}])
+        self.assertEqual(response.status_code, 403)
+
+    def test_statistics_endpoint_and_report_share_subject_stats(self):
+        data = self.client.get(reverse('get_subject_statistics', args=[self.subject.id])).json()
+        self.assertEqual((data['total_students'], data['scored_students'], data['average_score']), (1, 1, 50.0))
+        self.assertEqual(data['score_distribution']['0-59'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post([{'student_id': self.students[1].id, 'score': 90}])
+        data = self.client.get(reverse('get_subject_statistics', args=[self.subject.id])).json()
+        self.assertEqual((data['scored_students'], data['average_score'], data['percentiles']['50']), (2, 70.0, 50))
+
+        response = self.client.get(reverse('performance_reports'), {
+            'subject_id': self.subject.id, 'academic_year': '2024-2025', 'semester': 'first',
+        })
+        self.assertEqual(response.context['score_distribution']['90-100'], 1)
+        self.assertEqual(response.context['avg_score'], 70.0)
+
+
+class GradebookImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        teacher_user = User.objects.create_user(username='import_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=teacher_user, teacher_id='T-IMPORT', department='Maths')
+        self.subject = Subject.objects.create(name='Science', code='SCI4', grade_level=4, instructor=teacher)
+        self.students = []
+        for idx in range(2):
+            user = User.objects.create_user(username=f'import_student{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'IMP{idx}', grade_level=4)
+            Enrollment.objects.create(student=user, subject=self.subject, academic_year='2024-2025', semester='first', status='active')
+            self.students.append(user)
+        self.client.force_login(teacher_user)
+
+    def _upload(self, content, name='grades.csv'):
+        return self.client.post(
+            reverse('bulk_grade_upload', args=[self.subject.id]),
+            {'grade_file': SimpleUploadedFile(name, content.encode('utf-8'), content_type='text/csv')},
+        )
+
+    def test_csv_components_and_letter_grades_are_imported(self):
+        response = self._upload('Student ID,Quiz,Mid,Assignment,Final,Remarks\r\nIMP0,5,20,15,"40",Good\r\n')
+        self.assertRedirects(response, reverse('enter_grades') + f'?subject_id={self.subject.id}', fetch_redirect_response=False)
+        grade = Grade.objects.get(student=self.students[0], subject=self.subject)
+        self.assertEqual((grade.score, grade.mid_score, grade.remarks), (80, 20, 'Good'))
+
+        self._upload('student_id,grade\nIMP1,B\n')
+        self.assertEqual(Grade.objects.get(student=self.students[1], subject=self.subject).score, 85)
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self):
+        response = self._upload('student_id,score\nIMP0,77\nNOPE,50\nIMP1,abc\n\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(e['row'], e['student_id'], e['message']) for e in response.context['errors']],
+            [(3, 'NOPE', 'Unknown student ID'), (4, 'IMP1', 'Invalid score')],
+        )
+        self.assertEqual(Grade.objects.get(student=self.students[0]).score, 77)
+        self.assertFalse(Grade.objects.filter(student=self.students[1]).exists())
+
+    def test_sheet_is_imported_in_chunks(self):
+        from teachers.importer import import_scores
+
+        sheet = SimpleUploadedFile('grades.csv', b'student_id,score\nIMP0,60\nNOPE,50\nIMP1,A\nIMP0,70\n')
+        with mock.patch('teachers.importer.IMPORT_CHUNK_ROWS', 2):
+            saved, errors = import_scores(self.subject, sheet)
+        self.assertEqual((saved, [(e['row'], e['student_id']) for e in errors]), (3, [(3, 'NOPE')]))
+        self.assertEqual(
+            dict(Grade.objects.filter(subject=self.subject).values_list('student_id', 'score')),
+            {self.students[0].id: 70, self.students[1].id: 95},
+        )
+
+    def test_file_without_student_id_column_is_rejected(self):
+        response = self._upload('name,score\nx,10\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['errors'], [])
+        self.assertFalse(Grade.objects.exists())
+
+
+class RequestIdentityTests(TestCase):
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(username='id_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=self.teacher_user, teacher_id='T-ID', department='Maths')
+        self.subject = Subject.objects.create(name='Maths', code='MTH5', grade_level=5, instructor=teacher)
+        other_user = User.objects.create_user(username='id_other', password='pass', role='teacher')
+        other = Teacher.objects.create(user=other_user, teacher_id='T-ID2', department='Art')
+        self.other_subject = Subject.objects.create(name='Art', code='ART5', grade_level=5, instructor=other)
+        self.unassigned = Subject.objects.create(name='Music', code='MUS5', grade_level=5)
+        self.client.force_login(self.teacher_user)
+
+    def test_student_profile_is_loaded_once_and_primes_the_user(self):
+        from users.identity import RequestIdentity
+
+        student = User.objects.create_user(username='id_student', password='pass', role='student')
+        StudentProfile.objects.create(user=student, student_id='ID0001', grade_level=5)
+        student = User.objects.get(id=student.id)
+        identity = RequestIdentity(student)
+        with self.assertNumQueries(1):
+            self.assertEqual(identity.student_profile.student_id, 'ID0001')
+            self.assertEqual(identity.profile, identity.student_profile)
+            self.assertTrue(hasattr(student, 'studentprofile'))
+            self.assertIsNone(identity.parent_profile)
+            self.assertFalse(identity.teaches(self.subject))
+
+    def test_student_pages_prime_the_lazy_request_user(self):
+        # request.user is a SimpleLazyObject behind the middleware
+        student = User.objects.create_user(username='id_page_student', password='pass', role='student')
+        StudentProfile.objects.create(user=student, student_id='ID0002', grade_level=5)
+        self.client.force_login(student)
+        response = self.client.get(reverse('view_subjects'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.identity.student_profile.student_id, 'ID0002')
+
+    def test_teacher_subjects_are_resolved_once(self):
+        from users.identity import RequestIdentity
+
+        identity = RequestIdentity(User.objects.get(id=self.teacher_user.id))
+        with self.assertNumQueries(2):
+            self.assertTrue(identity.teaches(self.subject))
+            self.assertTrue(identity.teaches(str(self.subject.id)))
+            self.assertFalse(identity.teaches(self.other_subject.id))
+
+    def test_instructor_required_guards_subject_pages(self):
+        response = self.client.get(reverse('enter_grades'), {'subject_id': self.other_subject.id})
+        self.assertRedirects(response, reverse('teacher_dashboard'), fetch_redirect_response=False)
+        response = self.client.get(reverse('enter_grades'), {'subject_id': 999999})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('enter_grades'), {'subject_id': self.subject.id})
+        self.assertEqual(response.status_code, 200)
+        # rosters of subjects without an instructor stay viewable
+        response = self.client.get(reverse('class_rosters'), {'subject_id': self.unassigned.id})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('enter_grades'), {'subject_id': self.unassigned.id})
+        self.assertRedirects(response, reverse('teacher_dashboard'), fetch_redirect_response=False)
+
+
+class ClassAttendanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(username='roll_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=self.teacher_user, teacher_id='T-ROLL', department='Maths')
+        self.subject = Subject.objects.create(name='History', code='HIS5', grade_level=5, instructor=teacher)
+        self.students = []
+        for idx in range(3):
+            user = User.objects.create_user(username=f'roll_student{idx}', password='pass', role='student')
+            StudentProfile.objects.create(user=user, student_id=f'R{idx:04d}', grade_level=5)
+            Enrollment.objects.create(student=user, subject=self.subject, academic_year='2024-2025', semester='first', status='active')
+            self.students.append(user)
+        self.client.force_login(self.teacher_user)
+
+    def _roll_call(self, date, *statuses):
+        marks = {student.id: status for student, status in zip(self.students, statuses)}
+        return record_roll_call(self.subject, date, marks, '2024-2025', 'first')
+
+    def test_roll_call_is_one_upsert_and_summaries_come_from_the_bits(self):
+        monday = datetime.date(2024, 9, 2)
+        with self.assertNumQueries(5):  # enrollments, logs, upsert + savepoint pair
+            self.assertEqual(self._roll_call(monday, 'present', 'absent', 'late'), (3, []))
+        self._roll_call(monday + datetime.timedelta(days=1), 'absent', 'present', 'excused')
+        # a day before the first roll call moves the start of the log back
+        self._roll_call(monday - datetime.timedelta(days=4), 'present', 'present', 'absent')
+        self._roll_call(monday + datetime.timedelta(days=2), 'present', 'present', 'present')
+        # correcting a mark replaces it
+        self._roll_call(monday, 'present', 'present', 'late')
+
+        logs = {log.enrollment.student_id: TermAttendance(log) for log in AttendanceLog.objects.select_related('enrollment')}
+        first, second, third = (logs[student.id] for student in self.students)
+        self.assertEqual(first.status_on(monday - datetime.timedelta(days=4)), 'present')
+        self.assertEqual(first.summary(), {
+            'counts': {'present': 3, 'absent': 1, 'late': 0, 'excused': 0, 'recorded': 4},
+            'rate': 75.0, 'absences': 1, 'streak': 1,
+        })
+        self.assertEqual(second.summary()['streak'], 4)
+        self.assertEqual(third.summary(), {
+            'counts': {'present': 1, 'absent': 1, 'late': 1, 'excused': 1, 'recorded': 4},
+            'rate': 66.7, 'absences': 1, 'streak': 2,
+        })
+        self.assertEqual(third.recent(2), [(monday + datetime.timedelta(days=2), 'present'), (monday + datetime.timedelta(days=1), 'excused')])
+
+    def test_rejected_marks_are_reported(self):
+        outsider = User.objects.create_user(username='roll_outsider', password='pass', role='student')
+        saved, errors = record_roll_call(
+            self.subject, datetime.date(2024, 9, 2),
+            {self.students[0].id: 'present', self.students[1].id: 'asleep', outsider.id: 'present', 'x': 'present'},
+            '2024-2025', 'first',
+        )
+        self.assertEqual(saved, 1)
+        self.assertEqual(len(errors), 3)
+
+    def test_dates_outside_the_academic_year_are_rejected(self):
+        saved, errors = self._roll_call(datetime.date(2031, 9, 2), 'present', 'present', 'present')
+        self.assertEqual((saved, errors[0]['student_id']), (0, None))
+        self.assertIn('outside the 2024-2025 academic year', errors[0]['message'])
+        self.assertFalse(AttendanceLog.objects.exists())
+
+        log = AttendanceLog(start_date=datetime.date(2024, 9, 2))
+        with self.assertRaises(ValueError):
+            TermAttendance(log).mark(datetime.date(2023, 9, 1), 'present')
+
+    def test_attendance_page_posts_the_whole_class(self):
+        url = reverse('class_attendance')
+        data = {'subject_id': self.subject.id, 'academic_year': '2024-2025', 'semester': 'first', 'date': '2024-09-02'}
+        data.update({f'status_{student.id}': 'absent' for student in self.students})
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(url, {k: v for k, v in data.items() if not k.startswith('status_')})
+        self.assertEqual([row['status'] for row in response.context['roster']], ['absent'] * 3)
+        self.assertEqual(response.context['class_absences'], 3)
+
+        parent = User.objects.create_user(username='roll_parent', password='pass', role='parent')
+        StudentParent.objects.create(parent=parent, student=self.students[0], relationship='Father')
+        self.client.force_login(parent)
+        response = self.client.get(reverse('child_attendance', args=[self.students[0].id]))
+        self.assertEqual(response.context['attendance'][0]['absences'], 1)
+        self.assertContains(response, 'HIS5')
@@ -5,6 +5,7 @@ urlpatterns = [
     path('dashboard/', views.teacher_dashboard, name='teacher_dashboard'),
     path('enter-grades/', views.enter_grades, name='enter_grades'),
     path('class-rosters/', views.class_rosters, name='class_rosters'),
+    path('attendance/', views.class_attendance, name='class_attendance'),
     path('performance-reports/', views.performance_reports, name='performance_reports'),
     path('performance-reports/export-csv/', views.performance_reports_csv, name='performance_reports_csv'),
     path('performance-reports/download-pdf/', views.performance_reports_pdf, name='performance_reports_pdf'),
@@ -15,4 +16,5 @@ urlpatterns = [
     path('subject-statistics/<int:subject_id>/', views.get_subject_statistics, name='get_subject_statistics'),
     
     path('save-score/', views.save_student_score, name='save_student_score'),
+    path('save-scores/', views.save_class_scores_view, name='save_class_scores'),
 ]
\ No newline at end of file
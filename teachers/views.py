@@ -1,22 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, Count, F
 from django.db.models import Avg
-from users.decorators import teacher_required, registrar_required
+from users.decorators import instructor_required, teacher_required, registrar_required
 from users.models import User
 from subjects.models import Subject, Enrollment
+from subjects.enrollment import bulk_enroll
+from subjects.attendance import STATUS_CODES, record_roll_call, term_attendance
 from ranks.models import Grade, rank_students_for_subject
+from ranks.ranking import competition_ranks, rank_map, with_ranks
+from ranks.stats import SubjectStats
+from reports.exports import blank, full_name, iter_values, stream_csv
 from ranks.forms import GradeForm
 from django.http import JsonResponse
 from django.http import HttpResponse
-import csv
+import datetime
 import io
+import json
 from django.db.utils import OperationalError
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from .forms import BulkAssignForm
+from .gradebook import TermGradebook, save_class_scores, score_components
+from .importer import ImportFileError, import_scores
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
-from notifications.models import Notification
 from django.template.loader import render_to_string
 
 try:
@@ -29,24 +38,6 @@ except Exception:
     HTML = None
 
 
-def get_teacher_profile(user):
-    """Ensure a Teacher profile exists for the given User. Returns Teacher instance or None."""
-    try:
-        from subjects.models import Teacher as TeacherModel
-        teacher_obj, created = TeacherModel.objects.get_or_create(
-            user=user,
-            defaults={
-                'teacher_id': f'T{user.id}',
-                'department': '',
-                'phone_number': '',
-                'office_location': ''
-            }
-        )
-        return teacher_obj
-    except Exception:
-        return None
-
-
 def _get_current_academic_year():
     import datetime
     now = datetime.datetime.now()
@@ -69,7 +60,10 @@ def _get_current_semester():
 
 def enroll_students_for_subject(subject, academic_year=None, semester=None, status='approved'):
     """Enroll all students in the system matching subject.grade_level into this subject
-    for the provided academic_year and semester if they are not already enrolled."""
+    for the provided academic_year and semester if they are not already enrolled.
+
+    Existing enrollments with a different status are promoted to ``status``.
+    Returns a BulkEnrollmentResult (created / promoted / skipped counts)."""
     if academic_year is None:
         academic_year = _get_current_academic_year()
     if semester is None:
@@ -77,34 +71,7 @@ def enroll_students_for_subject(subject, academic_year=None, semester=None, stat
 
     # find students with matching grade level
     students = User.objects.filter(role='student', studentprofile__grade_level=subject.grade_level)
-    enrolled = 0
-    for student in students:
-        try:
-            existing = Enrollment.objects.filter(student=student, subject=subject, academic_year=academic_year, semester=semester).first()
-            if existing:
-                # If there's an existing enrollment (e.g., pending), promote it to the desired status
-                if existing.status != status:
-                    existing.status = status
-                    existing.is_auto_assigned = True
-                    try:
-                        existing.save()
-                    except Exception:
-                        pass
-                    enrolled += 1
-                continue
-
-            Enrollment.objects.create(
-                student=student,
-                subject=subject,
-                academic_year=academic_year,
-                semester=semester,
-                status=status,
-                is_auto_assigned=True
-            )
-            enrolled += 1
-        except Exception:
-            continue
-    return enrolled
+    return bulk_enroll(students, [subject], academic_year, semester, status=status, promote=True)
 
 @teacher_required
 def teacher_dashboard(request):
@@ -119,11 +86,7 @@ def teacher_dashboard(request):
         semester_filter = _get_current_semester()
 
     # annotate each subject (assigned to this teacher) with the number of approved/active students for the selected term
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        teacher_qs = Subject.objects.filter(instructor=teacher_obj, is_active=True)
-    else:
-        teacher_qs = Subject.objects.filter(instructor__user=request.user, is_active=True)
+    teacher_qs = request.identity.taught_subjects().filter(is_active=True)
     if grade_level_filter:
         try:
             teacher_qs = teacher_qs.filter(grade_level=int(grade_level_filter))
@@ -178,48 +141,29 @@ def teacher_dashboard(request):
 
     # distinct students across this teacher's subjects
     # Respect academic year / semester filters when listing students
-    # use the already-determined filters for term
-    ay = academic_year_filter
-    sem = semester_filter
-    enrolled_qs = Enrollment.objects.filter(subject__in=teacher_subjects, status__in=['approved', 'active'], academic_year=ay, semester=sem).select_related('student')
+    gradebook = TermGradebook(teacher_qs, academic_year_filter, semester_filter)
     distinct_students = {}
-    for en in enrolled_qs:
+    for en in gradebook.enrollments().select_related('student'):
         distinct_students[en.student.id] = en.student
 
-    # compute per-student average across this teacher's subjects
-    student_averages = {}
-    for student_id, student in distinct_students.items():
-        # restrict averaging to this term: find which of the teacher's subjects this student is enrolled in for the term
-        subject_ids_for_term = Enrollment.objects.filter(student__id=student_id, subject__in=teacher_subjects, academic_year=ay, semester=sem, status__in=['approved', 'active']).values_list('subject_id', flat=True)
-        if subject_ids_for_term:
-            avg = Grade.objects.filter(student__id=student_id, subject__id__in=subject_ids_for_term).aggregate(avg=Avg('score'))['avg']
-        else:
-            avg = None
-        student_averages[student_id] = {'student': student, 'average': round(avg, 2) if avg is not None else None}
+    # per-student average across this teacher's subjects for the term (one grouped query)
+    averages = gradebook.student_averages()
+    student_averages = {
+        student_id: {'student': student, 'average': averages.get(student_id)}
+        for student_id, student in distinct_students.items()
+    }
 
     # compute ranking (higher average -> better rank). Students with None average go last.
     ranked = sorted([{'id': sid, 'avg': data['average'], 'student': data['student']} for sid, data in student_averages.items()], key=lambda x: (-(x['avg'] or -1), x['student'].get_full_name()))
     # assign ranks (ties receive same rank)
-    last_avg = None
-    rank = 0
-    ties = 0
-    for i, item in enumerate(ranked, start=1):
-        if item['avg'] is None:
-            item['rank'] = None
-            continue
-        if item['avg'] != last_avg:
-            rank = i
-            last_avg = item['avg']
-        item['rank'] = rank
+    rank_map = competition_ranks((item['id'], item['avg']) for item in ranked)
+    for item in ranked:
+        item['rank'] = rank_map.get(item['id'])
 
-    # build per-subject averages
+    # per-subject averages for the term (one grouped query)
     subject_averages = {}
     for s in teacher_subjects:
-        avg = Grade.objects.filter(subject=s).aggregate(avg=Avg('score'))['avg']
-        subject_averages[s.id] = round(avg, 2) if avg is not None else None
-    # Get unread notifications for the teacher
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+        s.average = subject_averages[s.id] = gradebook.subject_average(s)
     
     # term filters (prefer GET, else current)
     academic_year = request.GET.get('academic_year') or _get_current_academic_year()
@@ -255,9 +199,8 @@ def teacher_dashboard(request):
         'num_subjects': teacher_subjects.count(),
         'distinct_student_count': len(distinct_students),
         'student_averages': student_averages,
+        'subject_averages': subject_averages,
         'student_ranking': ranked,
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
     }
     return render(request, 'teachers/teacher_dashboard.html', context)
 
@@ -288,7 +231,7 @@ def claim_subject(request, subject_id):
     subject.instructor = teacher_obj
     subject.save()
     try:
-        enrolled = enroll_students_for_subject(subject)
+        enrolled = enroll_students_for_subject(subject).enrolled
         if enrolled:
             messages.info(request, f'Auto-enrolled {enrolled} students for {subject.code}.')
     except Exception:
@@ -346,7 +289,7 @@ def assign_subjects_for_term(request):
         subj.save()
         try:
             # enroll students for provided term
-            enrolled = enroll_students_for_subject(subj, academic_year=academic_year, semester=semester)
+            enrolled = enroll_students_for_subject(subj, academic_year=academic_year, semester=semester).enrolled
             if enrolled:
                 messages.info(request, f'Auto-enrolled {enrolled} students for {subj.code}.')
         except Exception:
@@ -399,7 +342,7 @@ def assign_selected_subjects(request):
         subj.instructor = teacher_obj
         subj.save()
         try:
-            enrolled = enroll_students_for_subject(subj, academic_year=academic_year, semester=semester)
+            enrolled = enroll_students_for_subject(subj, academic_year=academic_year, semester=semester).enrolled
             if enrolled:
                 messages.info(request, f'Auto-enrolled {enrolled} students for {subj.code}.')
         except Exception:
@@ -409,33 +352,14 @@ def assign_selected_subjects(request):
     messages.success(request, f'Assigned {assigned} selected subjects to {teacher_user.get_full_name()}.')
     return redirect('registrar_dashboard')
 
-@teacher_required
+@instructor_required()
 def enter_grades(request):
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        teacher_subjects = Subject.objects.filter(instructor=teacher_obj, is_active=True)
-    else:
-        teacher_subjects = Subject.objects.filter(instructor__user=request.user, is_active=True)
+    teacher_subjects = request.identity.taught_subjects().filter(is_active=True)
     selected_subject_id = request.GET.get('subject_id')
 
     if selected_subject_id:
+        # instructor_required has already checked the teacher teaches it
         subject = get_object_or_404(Subject, id=selected_subject_id)
-        # Only allow entering grades if the logged-in teacher is the instructor
-        # Support matching by Teacher profile or instructor.user
-        teacher_obj = get_teacher_profile(request.user)
-        instructor_ok = False
-        try:
-            if subject.instructor is None:
-                instructor_ok = False
-            elif teacher_obj is not None and subject.instructor == teacher_obj:
-                instructor_ok = True
-            elif hasattr(subject.instructor, 'user') and subject.instructor.user == request.user:
-                instructor_ok = True
-        except Exception:
-            instructor_ok = False
-        if not instructor_ok:
-            messages.error(request, 'You are not the instructor for the selected subject.')
-            return redirect('teacher_dashboard')
         # Filter enrollments by academic year & semester (default to current)
         academic_year = request.GET.get('academic_year') or _get_current_academic_year()
         semester = request.GET.get('semester') or _get_current_semester()
@@ -477,39 +401,14 @@ def enter_grades(request):
 
         # compute per-student average across this teacher's subjects for the selected term
         student_ids = [en.student.id for en in enrollments]
-        student_averages = {}
         try:
-            for sid in student_ids:
-                subj_ids = Enrollment.objects.filter(student__id=sid, subject__in=teacher_subjects, academic_year=academic_year, semester=semester, status__in=['approved','active']).values_list('subject_id', flat=True)
-                if subj_ids:
-                    avg = Grade.objects.filter(student__id=sid, subject__id__in=subj_ids).aggregate(avg=Avg('score'))['avg']
-                else:
-                    avg = None
-                student_averages[sid] = round(avg,2) if avg is not None else None
+            averages = TermGradebook(teacher_subjects, academic_year, semester).student_averages()
+            student_averages = {sid: averages.get(sid) for sid in student_ids}
         except Exception:
             student_averages = {sid: None for sid in student_ids}
 
         # compute ranking for students by their average (higher is better); ties receive same rank
-        ranking = []
-        for sid, avg in student_averages.items():
-            ranking.append({'student_id': sid, 'avg': avg})
-        ranking = sorted(ranking, key=lambda x: (-(x['avg'] or -1), x['student_id']))
-        last_avg = None
-        last_rank = 0
-        rank_map = {}
-        idx = 0
-        for item in ranking:
-            idx += 1
-            if item['avg'] is None:
-                rank = None
-            else:
-                if item['avg'] == last_avg:
-                    rank = last_rank
-                else:
-                    rank = idx
-                    last_rank = rank
-                    last_avg = item['avg']
-            rank_map[item['student_id']] = rank
+        rank_map = competition_ranks(student_averages.items())
 
         # attach average and rank to enrollments for template
         for en in enrollments:
@@ -665,31 +564,14 @@ def enter_grades(request):
     }
     return render(request, 'teachers/enter_grades.html', context)
 
-@teacher_required
+# rosters of unassigned subjects may be viewed; other teachers' subjects may not
+@instructor_required(allow_unassigned=True)
 def class_rosters(request):
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        teacher_subjects = Subject.objects.filter(instructor=teacher_obj, is_active=True)
-    else:
-        teacher_subjects = Subject.objects.filter(instructor__user=request.user, is_active=True)
+    teacher_subjects = request.identity.taught_subjects().filter(is_active=True)
     selected_subject_id = request.GET.get('subject_id')
     
     if selected_subject_id:
         subject = get_object_or_404(Subject, id=selected_subject_id)
-        # allow viewing rosters even for unassigned subjects; but if assigned to another teacher, restrict
-        instructor_ok = False
-        try:
-            if subject.instructor is None:
-                instructor_ok = True  # allow viewing unassigned subjects
-            elif teacher_obj is not None and subject.instructor == teacher_obj:
-                instructor_ok = True
-            elif hasattr(subject.instructor, 'user') and subject.instructor.user == request.user:
-                instructor_ok = True
-        except Exception:
-            instructor_ok = False
-        if subject.instructor and not instructor_ok:
-            messages.error(request, 'You are not the instructor for the selected subject.')
-            return redirect('teacher_dashboard')
         academic_year = request.GET.get('academic_year') or _get_current_academic_year()
         semester = request.GET.get('semester') or _get_current_semester()
         enrollments = Enrollment.objects.filter(subject=subject, academic_year=academic_year, semester=semester, status__in=['approved', 'active']).select_related('student')
@@ -704,147 +586,130 @@ def class_rosters(request):
     }
     return render(request, 'teachers/class_rosters.html', context)
 
-@teacher_required
+@instructor_required()
+def class_attendance(request):
+    """Daily roll call for one of the teacher's subjects.
+
+    A POST marks the whole class for the date in one write
+    (``subjects.attendance.record_roll_call``); the roster shows each student's
+    mark for that date and their term rate, absences and streak.
+    """
+    teacher_subjects = request.identity.taught_subjects().filter(is_active=True)
+    selected_subject_id = request.GET.get('subject_id') or request.POST.get('subject_id')
+    academic_year = request.GET.get('academic_year') or request.POST.get('academic_year') or _get_current_academic_year()
+    semester = request.GET.get('semester') or request.POST.get('semester') or _get_current_semester()
+    try:
+        date = datetime.date.fromisoformat(request.GET.get('date') or request.POST.get('date') or '')
+    except ValueError:
+        date = timezone.localdate()
+
+    subject = get_object_or_404(Subject, id=selected_subject_id) if selected_subject_id else None
+    if subject is not None and request.method == 'POST':
+        marks = {
+            key[len('status_'):]: value
+            for key, value in request.POST.items() if key.startswith('status_')
+        }
+        saved, errors = record_roll_call(subject, date, marks, academic_year, semester)
+        if errors:
+            messages.warning(request, f'Attendance saved for {saved} students; {len(errors)} marks were rejected ({errors[0]["message"]}).')
+        else:
+            messages.success(request, f'Attendance saved for {saved} students on {date:%B %d, %Y}.')
+        query = f'subject_id={subject.id}&academic_year={academic_year}&semester={semester}&date={date.isoformat()}'
+        return redirect(f"{reverse('class_attendance')}?{query}")
+
+    roster = []
+    if subject is not None:
+        enrollments = Enrollment.objects.filter(
+            subject=subject, academic_year=academic_year, semester=semester, status__in=['approved', 'active'],
+        ).select_related('student', 'attendance_log').order_by('student__last_name', 'student__first_name', 'student__username')
+        for enrollment in enrollments:
+            term = term_attendance(enrollment)
+            roster.append({'student': enrollment.student, 'status': term.status_on(date), **term.summary()})
+    rates = [row['rate'] for row in roster if row['rate'] is not None]
+
+    context = {
+        'teacher_subjects': teacher_subjects,
+        'selected_subject': subject,
+        'academic_year': academic_year,
+        'semester': semester,
+        'date': date,
+        'roster': roster,
+        'statuses': list(STATUS_CODES),
+        'class_rate': round(sum(rates) / len(rates), 1) if rates else None,
+        'class_absences': sum(row['absences'] for row in roster),
+    }
+    return render(request, 'teachers/class_attendance.html', context)
+
+@instructor_required(allow_unassigned=True)
 def performance_reports(request):
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        teacher_subjects = Subject.objects.filter(instructor=teacher_obj, is_active=True)
-    else:
-        teacher_subjects = Subject.objects.filter(instructor__user=request.user, is_active=True)
+    teacher_subjects = request.identity.taught_subjects().filter(is_active=True)
     selected_subject_id = request.GET.get('subject_id')
     
     if selected_subject_id:
         subject = get_object_or_404(Subject, id=selected_subject_id)
-        instructor_ok = False
-        try:
-            if subject.instructor is None:
-                instructor_ok = False
-            elif teacher_obj is not None and subject.instructor == teacher_obj:
-                instructor_ok = True
-            elif hasattr(subject.instructor, 'user') and subject.instructor.user == request.user:
-                instructor_ok = True
-        except Exception:
-            instructor_ok = False
-        if subject.instructor and not instructor_ok:
-            messages.error(request, 'You are not the instructor for the selected subject.')
-            return redirect('teacher_dashboard')
         academic_year = request.GET.get('academic_year') or _get_current_academic_year()
         semester = request.GET.get('semester') or _get_current_semester()
+        gradebook = TermGradebook([subject], academic_year, semester)
         try:
             # Restrict grades to students actually enrolled in this subject for the selected term
-            student_ids = Enrollment.objects.filter(subject=subject, academic_year=academic_year, semester=semester, status__in=['approved', 'active']).values_list('student_id', flat=True)
-            if student_ids:
-                grades = Grade.objects.filter(subject=subject, student__id__in=student_ids).select_related('student')
+            if gradebook.enrollments().exists():
+                grades = gradebook.grades().select_related('student')
+                stats = SubjectStats.for_subject(subject, academic_year, semester)
             else:
                 # Fallback: if no enrollments are found for the selected term (possible term/format mismatch),
                 # fall back to any saved Grade records for this subject so existing results are visible.
                 grades = Grade.objects.filter(subject=subject).select_related('student')
+                stats = SubjectStats.for_subject(subject)
         except OperationalError:
             messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
             grades = []
-
-        # Calculate numeric statistics (average score out of 100) and ranking
-        if grades:
-            numeric_scores = [g.score for g in grades if g.score is not None]
-            avg_score = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
-            # build simple distribution buckets
-            score_distribution = {
-                '90-100': len([s for s in numeric_scores if s >= 90]),
-                '80-89': len([s for s in numeric_scores if 80 <= s < 90]),
-                '70-79': len([s for s in numeric_scores if 70 <= s < 80]),
-                '60-69': len([s for s in numeric_scores if 60 <= s < 70]),
-                '0-59': len([s for s in numeric_scores if s < 60]),
-            }
-            # compute ranks based on the `grades` queryset we're displaying so ranks match the table
-            grades_list = list(grades)
-            scored = [g for g in grades_list if g.score is not None]
-            scored.sort(key=lambda x: x.score, reverse=True)
-            last_score = None
-            last_rank = 0
-            idx = 0
-            rank_map = {}
-            for g in scored:
-                idx += 1
-                if g.score == last_score:
-                    rank = last_rank
-                else:
-                    rank = idx
-                    last_rank = rank
-                    last_score = g.score
-                rank_map[g.student.id] = rank
-            # prepare a list pairing each grade with its computed rank for the template
-            grades_with_rank = [{'grade': g, 'rank': rank_map.get(g.student.id)} for g in grades_list]
-            # also build subject_ranking for legacy template sections if needed
-            subject_ranking = [(g.student, g.score, rank_map.get(g.student.id)) for g in scored]
-        else:
-            avg_score = 0
-            score_distribution = {}
-            subject_ranking = []
-            grades_with_rank = []
+            stats = None
     else:
         subject = None
+        stats = None
         # support grade-level / term-wide reports when no subject is selected
         selected_grade_level = request.GET.get('grade_level')
         academic_year = request.GET.get('academic_year') or _get_current_academic_year()
         semester = request.GET.get('semester') or _get_current_semester()
+        gradebook = TermGradebook(teacher_subjects, academic_year, semester)
         if selected_grade_level:
             try:
-                student_ids = Enrollment.objects.filter(
-                    subject__in=teacher_subjects,
-                    academic_year=academic_year,
-                    semester=semester,
-                    status__in=['approved', 'active'],
-                    student__studentprofile__grade_level=selected_grade_level
-                ).values_list('student_id', flat=True)
-                if student_ids:
-                    grades = Grade.objects.filter(student__id__in=student_ids, subject__in=teacher_subjects).select_related('student','subject')
+                if gradebook.enrollments().filter(student__studentprofile__grade_level=selected_grade_level).exists():
+                    grades = gradebook.grades().filter(student__studentprofile__grade_level=selected_grade_level).select_related('student','subject')
                 else:
                     grades = Grade.objects.filter(student__studentprofile__grade_level=selected_grade_level, subject__in=teacher_subjects).select_related('student','subject')
             except OperationalError:
                 grades = []
         else:
             grades = []
-        avg_score = 0
-        score_distribution = {}
-        subject_ranking = []
-
-        # If grades were collected (either by subject or grade-level), compute stats and ranks
-        if grades:
-            numeric_scores = [g.score for g in grades if g.score is not None]
-            avg_score = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
-            score_distribution = {
-                '90-100': len([s for s in numeric_scores if s >= 90]),
-                '80-89': len([s for s in numeric_scores if 80 <= s < 90]),
-                '70-79': len([s for s in numeric_scores if 70 <= s < 80]),
-                '60-69': len([s for s in numeric_scores if 60 <= s < 70]),
-                '0-59': len([s for s in numeric_scores if s < 60]),
-            }
-            grades_list = list(grades)
-            scored = [g for g in grades_list if g.score is not None]
-            scored.sort(key=lambda x: x.score, reverse=True)
-            last_score = None
-            last_rank = 0
-            idx = 0
-            rank_map = {}
-            for g in scored:
-                idx += 1
-                if g.score == last_score:
-                    rank = last_rank
-                else:
-                    rank = idx
-                    last_rank = rank
-                    last_score = g.score
-                rank_map[g.student.id] = rank
-            grades_with_rank = [{'grade': g, 'rank': rank_map.get(g.student.id)} for g in grades_list]
-            subject_ranking = [(g.student, g.score, rank_map.get(g.student.id)) for g in scored]
-
-        context = {
+
+    avg_score = 0
+    score_distribution = {}
+    subject_ranking = []
+    grades_with_rank = []
+
+    # If grades were collected (either by subject or grade-level), compute stats and ranks
+    if grades:
+        # compute ranks over the `grades` queryset we're displaying so ranks match the table
+        grades_list = with_ranks(grades, 'score')
+        # count, average and score bands come from the database, not the loaded rows
+        if stats is None:
+            stats = SubjectStats.from_queryset(grades)
+        avg_score = stats.mean or 0
+        score_distribution = stats.distribution
+        # prepare a list pairing each grade with its computed rank for the template
+        grades_with_rank = [{'grade': g, 'rank': g.rank} for g in grades_list]
+        # also build subject_ranking for legacy template sections if needed
+        subject_ranking = [(g.student, g.score, g.rank) for g in grades_list if g.score is not None]
+
+    context = {
         'teacher_subjects': teacher_subjects,
         'selected_subject': subject,
         'grades': grades,
         'grades_with_rank': grades_with_rank,
         'avg_score': round(avg_score, 2),
         'score_distribution': score_distribution,
+        'stats': stats,
         'subject_ranking': subject_ranking,
         'grade_choices': getattr(Subject, 'GRADE_LEVEL_CHOICES', []),
         'academic_year_choices': [f"{y}-{y+1}" for y in range(int(_get_current_academic_year().split('-')[0]) - 3, int(_get_current_academic_year().split('-')[0]) + 1)],
@@ -855,7 +720,7 @@ def performance_reports(request):
     return render(request, 'teachers/performance_reports.html', context)
 
 
-@teacher_required
+@instructor_required(allow_unassigned=True)
 def performance_reports_csv(request):
     """Export the performance table as CSV for the selected subject and term.
     Query params: subject_id, academic_year (optional), semester (optional)
@@ -865,75 +730,38 @@ def performance_reports_csv(request):
         return HttpResponseBadRequest('Missing subject_id')
 
     subject = get_object_or_404(Subject, id=selected_subject_id)
-    # permission check: allow if instructor matches teacher profile or user
-    teacher_obj = get_teacher_profile(request.user)
-    instructor_ok = False
-    try:
-        if subject.instructor is None:
-            instructor_ok = False
-        elif teacher_obj is not None and subject.instructor == teacher_obj:
-            instructor_ok = True
-        elif hasattr(subject.instructor, 'user') and subject.instructor.user == request.user:
-            instructor_ok = True
-    except Exception:
-        instructor_ok = False
-    if subject.instructor and not instructor_ok:
-        messages.error(request, 'You are not the instructor for the selected subject.')
-        return redirect('teacher_dashboard')
 
     academic_year = request.GET.get('academic_year') or _get_current_academic_year()
     semester = request.GET.get('semester') or _get_current_semester()
 
     try:
         student_ids = Enrollment.objects.filter(subject=subject, academic_year=academic_year, semester=semester, status__in=['approved', 'active']).values_list('student_id', flat=True)
-        if student_ids:
-            grades = Grade.objects.filter(subject=subject, student__id__in=student_ids).select_related('student')
+        if student_ids.exists():
+            grades = Grade.objects.filter(subject=subject, student__id__in=student_ids)
         else:
-            grades = Grade.objects.filter(subject=subject).select_related('student')
+            grades = Grade.objects.filter(subject=subject)
+        # ranks use the same logic as the view; only (id, rank) pairs are held
+        ranks = rank_map(grades, 'id')
     except OperationalError:
         messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
         return redirect('performance_reports')
 
-    # compute ranks for CSV using same logic as the view
-    grades_list = list(grades)
-    scored = [g for g in grades_list if g.score is not None]
-    scored.sort(key=lambda x: x.score, reverse=True)
-    last_score = None
-    last_rank = 0
-    idx = 0
-    rank_map = {}
-    for g in scored:
-        idx += 1
-        if g.score == last_score:
-            rank = last_rank
-        else:
-            rank = idx
-            last_rank = rank
-            last_score = g.score
-        rank_map[g.student.id] = rank
-
-    # Build CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Rank', 'Student', 'Quiz', 'Mid', 'Assignment', 'Final', 'Total', 'Remarks'])
-    for g in grades_list:
-        rank = rank_map.get(g.student.id, '')
-        row = [rank, g.student.get_full_name() or g.student.username, g.quiz_score or '', g.mid_score or '', g.assignment_score or '', g.final_exam_score or '', g.score or '', (g.remarks or '')]
-        writer.writerow(row)
+    def rows():
+        yield ['Rank', 'Student', 'Quiz', 'Mid', 'Assignment', 'Final', 'Total', 'Remarks']
+        fields = ('id', 'student__first_name', 'student__last_name', 'student__username',
+                  'quiz_score', 'mid_score', 'assignment_score', 'final_exam_score', 'score', 'remarks')
+        for gid, first, last, username, quiz, mid, assignment, final, score, remarks in iter_values(
+            grades.order_by(F('score').desc(nulls_last=True), 'id'), *fields
+        ):
+            yield [ranks.get(gid, ''), full_name(first, last, username), blank(quiz), blank(mid), blank(assignment), blank(final), blank(score), remarks or '']
 
-    resp = HttpResponse(output.getvalue(), content_type='text/csv')
-    resp['Content-Disposition'] = f'attachment; filename="performance_{subject.code}.csv"'
-    return resp
+    return stream_csv(f"performance_{subject.code}.csv", rows())
 
 
-@teacher_required
+@instructor_required(allow_unassigned=True)
 def performance_reports_pdf(request):
     """Return a PDF of student performance filtered by subject or grade_level and term."""
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        teacher_subjects = Subject.objects.filter(instructor=teacher_obj, is_active=True)
-    else:
-        teacher_subjects = Subject.objects.filter(instructor__user=request.user, is_active=True)
+    teacher_subjects = request.identity.taught_subjects().filter(is_active=True)
 
     selected_subject_id = request.GET.get('subject_id')
     selected_grade_level = request.GET.get('grade_level')
@@ -944,19 +772,6 @@ def performance_reports_pdf(request):
     title = 'Student Performance'
     if selected_subject_id:
         subject = get_object_or_404(Subject, id=selected_subject_id)
-        # permission check
-        teacher_ok = False
-        try:
-            if subject.instructor is None:
-                teacher_ok = False
-            elif teacher_obj is not None and subject.instructor == teacher_obj:
-                teacher_ok = True
-            elif hasattr(subject.instructor, 'user') and subject.instructor.user == request.user:
-                teacher_ok = True
-        except Exception:
-            teacher_ok = False
-        if subject.instructor and not teacher_ok:
-            return HttpResponse('Forbidden', status=403)
         try:
             student_ids = Enrollment.objects.filter(subject=subject, academic_year=academic_year, semester=semester, status__in=['approved','active']).values_list('student_id', flat=True)
             if student_ids:
@@ -964,7 +779,13 @@ def performance_reports_pdf(request):
             else:
                 grades_qs = Grade.objects.filter(subject=subject).select_related('student')
         except Exception:
+            student_ids = None
             grades_qs = []
+        # the statistics cover the same grades as the rows
+        if student_ids:
+            stats = SubjectStats.for_subject(subject, academic_year, semester)
+        else:
+            stats = SubjectStats.for_subject(subject)
         title = f'Student Performance - {getattr(subject, "name", str(subject))}'
     elif selected_grade_level:
         try:
@@ -975,9 +796,11 @@ def performance_reports_pdf(request):
                 grades_qs = Grade.objects.filter(student__studentprofile__grade_level=selected_grade_level, subject__in=teacher_subjects).select_related('student','subject')
         except Exception:
             grades_qs = []
+        stats = SubjectStats.from_queryset(grades_qs) if hasattr(grades_qs, 'aggregate') else SubjectStats()
         title = f'Student Performance - Grade {selected_grade_level} ({academic_year} {semester})'
     else:
         grades_qs = Grade.objects.none()
+        stats = SubjectStats()
 
     for g in grades_qs:
         rows.append([
@@ -987,7 +810,16 @@ def performance_reports_pdf(request):
             g.graded_at.strftime('%Y-%m-%d %H:%M') if getattr(g, 'graded_at', None) else ''
         ])
 
-    html = render_to_string('admin/report_pdf.html', {'title': title, 'headers': ['Student','Subject','Quiz','Mid','Assignment','Final','Total','Remarks','Graded At'], 'rows': rows})
+    summary = [
+        [measure, '' if value is None else value] for measure, value in [
+            ('Students', stats.count), ('Scored', stats.scored), ('Average', stats.mean), ('Median', stats.median),
+            ('Min', stats.min), ('Max', stats.max), ('Std. deviation', stats.stddev),
+        ]
+    ] + [[f'Scores {label}', count] for label, count in stats.distribution.items()]
+    html = render_to_string('admin/report_pdf.html', {'title': title, 'sections': [
+        {'title': 'Summary', 'headers': ['Measure', 'Value'], 'rows': summary},
+        {'title': 'Students', 'headers': ['Student','Subject','Quiz','Mid','Assignment','Final','Total','Remarks','Graded At'], 'rows': rows},
+    ]})
     if HTML is not None:
         pdf = HTML(string=html).write_pdf()
         resp = HttpResponse(pdf, content_type='application/pdf')
@@ -1006,13 +838,8 @@ def performance_reports_pdf(request):
 
 @teacher_required
 def update_student_grade(request, enrollment_id):
-    # allow instructor match by Teacher profile or instructor.user
-    teacher_obj = get_teacher_profile(request.user)
     try:
-        if teacher_obj is not None:
-            enrollment = Enrollment.objects.get(id=enrollment_id, subject__instructor=teacher_obj)
-        else:
-            enrollment = Enrollment.objects.get(id=enrollment_id, subject__instructor__user=request.user)
+        enrollment = Enrollment.objects.get(id=enrollment_id, subject__in=request.identity.taught_subjects())
     except Enrollment.DoesNotExist:
         enrollment = get_object_or_404(Enrollment, id=enrollment_id)
         messages.error(request, 'You are not the instructor for this enrollment.')
@@ -1062,23 +889,12 @@ def view_student_performance(request, student_id):
     # Get subjects taught by this teacher that the student is enrolled in
     academic_year = request.GET.get('academic_year') or _get_current_academic_year()
     semester = request.GET.get('semester') or _get_current_semester()
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        student_courses = Subject.objects.filter(
-            instructor=teacher_obj,
-            enrollments__student=student,
-            enrollments__status__in=['approved', 'active'],
-            enrollments__academic_year=academic_year,
-            enrollments__semester=semester,
-        ).distinct()
-    else:
-        student_courses = Subject.objects.filter(
-            instructor__user=request.user,
-            enrollments__student=student,
-            enrollments__status__in=['approved', 'active'],
-            enrollments__academic_year=academic_year,
-            enrollments__semester=semester,
-        ).distinct()
+    student_courses = request.identity.taught_subjects().filter(
+        enrollments__student=student,
+        enrollments__status__in=['approved', 'active'],
+        enrollments__academic_year=academic_year,
+        enrollments__semester=semester,
+    ).distinct()
     
     # Get grades for these courses
     try:
@@ -1099,97 +915,37 @@ def view_student_performance(request, student_id):
 
 @teacher_required
 def bulk_grade_upload(request, subject_id):
-    """Handle bulk score upload via CSV"""
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        subject = get_object_or_404(Subject, id=subject_id, instructor=teacher_obj)
-    else:
-        subject = get_object_or_404(Subject, id=subject_id, instructor__user=request.user)
+    """Import a gradebook sheet (CSV or XLSX) for one subject."""
+    subject = get_object_or_404(request.identity.taught_subjects(), id=subject_id)
     
+    errors = []
     if request.method == 'POST' and request.FILES.get('grade_file'):
-        grade_file = request.FILES['grade_file']
-        # Simple CSV processing (you might want to use csv module for more complex files)
         try:
-            # This is a simplified example - implement proper CSV parsing
-            lines = grade_file.read().decode('utf-8').split('\n')
-            processed_count = 0
-            
-            for line in lines[1:]:  # Skip header
-                if line.strip():
-                    parts = line.split(',')
-                    if len(parts) >= 2:
-                        student_id = parts[0].strip()
-                        grade_value = parts[1].strip()
-                        
-                        # Find student and update grade
-                        try:
-                            student = User.objects.get(
-                                studentprofile__student_id=student_id,
-                                role='student'
-                            )
-                            try:
-                                grade, created = Grade.objects.get_or_create(
-                                    student=student,
-                                    subject=subject,
-                                    defaults={'score': None}
-                                )
-                            except OperationalError:
-                                continue
-                            if not created:
-                                # store the submitted letter grade into remarks for trace
-                                grade.remarks = f'entered_grade:{grade_value}'
-                                grade.save()
-                            if not created:
-                                grade.grade = grade_value
-                                grade.save()
-                            processed_count += 1
-                        except User.DoesNotExist:
-                            continue
-            
-            messages.success(request, f'Successfully processed grades for {processed_count} students.')
-            
-        except Exception as e:
-            messages.error(request, f'Error processing file: {str(e)}')
-        
-        return redirect('enter_grades')
-    
+            saved, errors = import_scores(subject, request.FILES['grade_file'])
+        except ImportFileError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'Successfully processed grades for {saved} students.')
+            if not errors:
+                return redirect(f"{reverse('enter_grades')}?subject_id={subject.id}")
+            messages.warning(request, f'{len(errors)} row(s) were not imported; see the report below.')
+
     context = {
         'subject': subject,
+        'errors': errors,
     }
     return render(request, 'teachers/bulk_grade_upload.html', context)
 
 @teacher_required
 def get_subject_statistics(request, subject_id):
     """API endpoint for subject statistics (for charts)"""
-    teacher_obj = get_teacher_profile(request.user)
-    if teacher_obj is not None:
-        subject = get_object_or_404(Subject, id=subject_id, instructor=teacher_obj)
-    else:
-        subject = get_object_or_404(Subject, id=subject_id, instructor__user=request.user)
+    subject = get_object_or_404(request.identity.taught_subjects(), id=subject_id)
     try:
-        grades = Grade.objects.filter(subject=subject)
+        data = SubjectStats.for_subject(subject).as_dict()
     except OperationalError:
         messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
-        grades = []
-    
-    # Numeric distribution buckets and average score
-    numeric_scores = [g.score for g in grades if g.score is not None]
-    distribution = {
-        '90-100': len([s for s in numeric_scores if s >= 90]),
-        '80-89': len([s for s in numeric_scores if 80 <= s < 90]),
-        '70-79': len([s for s in numeric_scores if 70 <= s < 80]),
-        '60-69': len([s for s in numeric_scores if 60 <= s < 70]),
-        '0-59': len([s for s in numeric_scores if s < 60]),
-    }
-    avg_score = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
+        data = SubjectStats().as_dict()
 
-    data = {
-        'score_distribution': distribution,
-        'average_score': round(avg_score, 2),
-        'total_students': grades.count(),
-        'scored_students': len(numeric_scores),
-    }
-    
     return JsonResponse(data)
 
 
@@ -1215,11 +971,7 @@ def save_student_score(request):
         return JsonResponse({'success': False, 'message': 'Missing student_id or subject_id'}, status=400)
 
     try:
-        teacher_obj = get_teacher_profile(request.user)
-        if teacher_obj is not None:
-            subject = Subject.objects.get(id=subject_id, instructor=teacher_obj)
-        else:
-            subject = Subject.objects.get(id=subject_id, instructor__user=request.user)
+        subject = request.identity.taught_subjects().get(id=subject_id)
     except Subject.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Subject not found or you are not the instructor'}, status=403)
 
@@ -1233,71 +985,14 @@ def save_student_score(request):
     except Enrollment.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Student is not enrolled in this subject'}, status=400)
 
-    # validate and store score
-    parsed_score = None
-    # component parsing
-    def parse_int(v, default=None):
-        if v is None or v == '':
-            return default
-        try:
-            return int(float(v))
-        except Exception:
-            return default
-
-    parsed_quiz = parse_int(quiz)
-    parsed_mid = parse_int(mid)
-    parsed_assignment = parse_int(assignment)
-    parsed_final = parse_int(final_exam)
-    # support override average (manual edit from UI)
-    override_avg = request.POST.get('override_avg')
     try:
-        parsed_override = int(float(override_avg)) if override_avg not in (None, '') else None
-    except Exception:
-        parsed_override = None
-
-    if any(x is not None for x in [parsed_quiz, parsed_mid, parsed_assignment, parsed_final]):
-        # clamp components
-        parsed_quiz = 0 if parsed_quiz is None else max(0, min(5, parsed_quiz))
-        parsed_mid = 0 if parsed_mid is None else max(0, min(25, parsed_mid))
-        parsed_assignment = 0 if parsed_assignment is None else max(0, min(20, parsed_assignment))
-        parsed_final = 0 if parsed_final is None else max(0, min(50, parsed_final))
-        parsed_score = parsed_quiz + parsed_mid + parsed_assignment + parsed_final
-        parsed_score = max(0, min(100, parsed_score))
-        # if teacher provided an override average, use it instead
-        if parsed_override is not None:
-            parsed_score = max(0, min(100, parsed_override))
-    else:
-        if score is not None and score != '':
-            try:
-                parsed_score = int(float(score))
-            except ValueError:
-                return JsonResponse({'success': False, 'message': 'Invalid score'}, status=400)
-            if parsed_score < 0:
-                parsed_score = 0
-            if parsed_score > 100:
-                parsed_score = 100
-
-    # If only an overall score was provided (no component inputs), allocate
-    # the total proportionally across components so they are visible after save.
-    if parsed_score is not None and all(x is None for x in [parsed_quiz, parsed_mid, parsed_assignment, parsed_final]):
-        try:
-            total_val = parsed_score
-            weights = {'quiz':5, 'mid':25, 'assignment':20, 'final':50}
-            alloc = {}
-            for k,w in weights.items():
-                v = int(round(total_val * (w/100.0)))
-                v = max(0, min(w, v))
-                alloc[k] = v
-            s = sum(alloc.values())
-            diff = total_val - s
-            if diff != 0:
-                alloc['final'] = max(0, min(weights['final'], alloc['final'] + diff))
-            parsed_quiz = alloc['quiz']
-            parsed_mid = alloc['mid']
-            parsed_assignment = alloc['assignment']
-            parsed_final = alloc['final']
-        except Exception:
-            pass
+        parsed_score, components = score_components(quiz, mid, assignment, final_exam, score, request.POST.get('override_avg'))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid score'}, status=400)
+    parsed_quiz = components.get('quiz')
+    parsed_mid = components.get('mid')
+    parsed_assignment = components.get('assignment')
+    parsed_final = components.get('final')
 
     # Create or update Grade (ranks.models.Grade)
     try:
@@ -1349,6 +1044,34 @@ def save_student_score(request):
 
     return JsonResponse({'success': True, 'message': 'Saved', 'avg': avg, 'total': total_return})
 
+@teacher_required
+@require_POST
+def save_class_scores_view(request):
+    """AJAX endpoint to save a whole class's scores for a subject in one request.
+
+    JSON body: {"subject_id": ..., "rows": [{"student_id", "quiz", "mid",
+    "assignment", "final_exam", "score", "override_avg", "result"}, ...]}
+    Returns JSON {success, saved: [{student_id, total}], errors: [...], avg}.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    rows = payload.get('rows') if isinstance(payload, dict) else None
+    subject_id = payload.get('subject_id') if isinstance(payload, dict) else None
+    if not subject_id or not isinstance(rows, list):
+        return JsonResponse({'success': False, 'message': 'Missing subject_id or rows'}, status=400)
+
+    try:
+        subject = request.identity.taught_subjects().get(id=subject_id)
+    except (Subject.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Subject not found or you are not the instructor'}, status=403)
+
+    saved, errors, avg = save_class_scores(subject, rows)
+    return JsonResponse({'success': not errors, 'message': 'Saved' if not errors else 'Some rows were not saved',
+                         'saved': saved, 'errors': errors, 'avg': avg})
+
+
 def get_grade_point(grade_letter):
     """Convert letter grade to grade point - helper function"""
     if not grade_letter:
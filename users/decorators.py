@@ -1,4 +1,7 @@
+from functools import wraps
+
 from django.contrib.auth.decorators import login_required
+from django.http import Http404
 from django.shortcuts import redirect
 from django.contrib import messages
 
@@ -28,4 +31,29 @@ def registrar_required(view_func):
 def finance_required(view_func):
     return login_required(role_required('finance')(view_func))
 def parent_required(view_func):  # ADD PARENT DECORATOR
-    return login_required(role_required('parent')(view_func))
\ No newline at end of file
+    return login_required(role_required('parent')(view_func))
+
+def instructor_required(subject_param='subject_id', allow_unassigned=False):
+    """Teacher-only view that also requires teaching the subject named by
+    ``subject_param`` (a URL kwarg, or a GET/POST parameter). Requests without
+    that parameter pass through. With ``allow_unassigned`` a subject that has
+    no instructor yet is allowed too."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            from subjects.models import Subject
+            from .identity import identity_for
+
+            subject_id = kwargs.get(subject_param) or request.GET.get(subject_param) or request.POST.get(subject_param)
+            if subject_id and not str(subject_id).isdigit():
+                raise Http404('Subject not found')
+            if subject_id and not identity_for(request).teaches(subject_id):
+                unassigned = allow_unassigned and Subject.objects.filter(id=subject_id, instructor__isnull=True).exists()
+                if not unassigned:
+                    if not Subject.objects.filter(id=subject_id).exists():
+                        raise Http404('Subject not found')
+                    messages.error(request, 'You are not the instructor for the selected subject.')
+                    return redirect('teacher_dashboard')
+            return view_func(request, *args, **kwargs)
+        return teacher_required(wrapper)
+    return decorator
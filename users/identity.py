@@ -0,0 +1,103 @@
+"""Per-request identity: the signed-in user's role profile, resolved once.
+
+``RoleProfileMiddleware`` attaches a ``RequestIdentity`` to every request as
+``request.identity``. It is built the first time a view touches it and then
+shared by the decorators, views and helpers of that request, so asking "which
+StudentProfile / Teacher / ParentProfile is this?" or "does this user teach
+subject 42?" costs one query per request instead of one per call site.
+
+Loading a profile also primes the user's one-to-one cache, so
+``request.user.studentprofile`` (and ``hasattr`` checks on it) afterwards hit
+no database.
+"""
+from functools import cached_property
+
+
+def get_teacher_profile(user):
+    """Ensure a Teacher profile exists for the given User. Returns Teacher instance or None."""
+    try:
+        from subjects.models import Teacher as TeacherModel
+        teacher_obj, created = TeacherModel.objects.get_or_create(
+            user=user,
+            defaults={
+                'teacher_id': f'T{user.id}',
+                'department': '',
+                'phone_number': '',
+                'office_location': ''
+            }
+        )
+        return teacher_obj
+    except Exception:
+        return None
+
+
+def _prime(user, accessor, profile):
+    """Cache ``profile`` (or its absence) on the user's reverse one-to-one."""
+    # request.user is a SimpleLazyObject; __class__ is proxied, type() is not
+    getattr(user.__class__, accessor).related.set_cached_value(user, profile)
+    return profile
+
+
+class RequestIdentity:
+    """Role profile of ``user``; only the profile matching the user's role is loaded."""
+
+    def __init__(self, user):
+        self.user = user
+        self.role = getattr(user, 'role', None) if user.is_authenticated else None
+
+    @cached_property
+    def student_profile(self):
+        from .models import StudentProfile
+
+        if self.role != 'student':
+            return None
+        return _prime(self.user, 'studentprofile', StudentProfile.objects.filter(user=self.user).first())
+
+    @cached_property
+    def parent_profile(self):
+        from .models import ParentProfile
+
+        if self.role != 'parent':
+            return None
+        return _prime(self.user, 'parentprofile', ParentProfile.objects.filter(user=self.user).first())
+
+    @cached_property
+    def teacher(self):
+        """The user's ``subjects.Teacher`` row, created on first use like the teacher pages always did."""
+        if self.role != 'teacher':
+            return None
+        return get_teacher_profile(self.user)
+
+    @property
+    def profile(self):
+        return {'student': self.student_profile, 'parent': self.parent_profile, 'teacher': self.teacher}.get(self.role)
+
+    def taught_subjects(self):
+        """Queryset of the subjects this user is the instructor of."""
+        from subjects.models import Subject
+
+        if self.role != 'teacher':
+            return Subject.objects.none()
+        if self.teacher is not None:
+            return Subject.objects.filter(instructor=self.teacher)
+        return Subject.objects.filter(instructor__user=self.user)
+
+    @cached_property
+    def taught_subject_ids(self):
+        if self.role != 'teacher':
+            return frozenset()
+        return frozenset(self.taught_subjects().values_list('id', flat=True))
+
+    def teaches(self, subject):
+        try:
+            return int(getattr(subject, 'id', subject)) in self.taught_subject_ids
+        except (TypeError, ValueError):
+            return False
+
+
+def identity_for(request):
+    """``request.identity``, created here when the middleware did not run."""
+    identity = getattr(request, 'identity', None)
+    if identity is None:
+        identity = request.identity = RequestIdentity(request.user)
+    return identity
@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from .identity import RequestIdentity
+
+
+class RoleProfileMiddleware:
+    """Attach ``request.identity`` (see ``users.identity``); nothing is queried
+    until a view uses it. Must come after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.identity = SimpleLazyObject(lambda: RequestIdentity(request.user))
+        return self.get_response(request)
@@ -18,6 +18,7 @@ urlpatterns = [
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('check-schedule-conflicts/', views.check_schedule_conflicts_ajax, name='check_schedule_conflicts'),
     path('subjects/', views.view_subjects, name='view_subjects'),
+    path('subjects/export/<str:fmt>/', views.view_subjects_export, name='view_subjects_export'),
     path('students/subject-registration/', views.subject_registration, name='subject_registration'),
     path('ranks/', views.view_ranks, name='view_ranks'),
     path('homework/', views.view_homework, name='view_homework'),
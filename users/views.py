@@ -12,9 +12,16 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import User, StudentProfile, TeacherProfile, ParentProfile, StudentParent
 from subjects.models import Subject, Enrollment
+from subjects.enrollment import bulk_enroll
+from subjects.catalog import grade_catalog
+from subjects.seats import attach_seat_info, save_holding_seat
+from subjects.schedule import ScheduleEntry, find_overlaps, schedule_index
+from subjects.timetable import export_response, student_timetable
+from subjects.registration_queue import enqueue_registration, intake_mode_enabled, open_request_for
+from teachers.gradebook import letter_grade_to_numeric
 from payments.models import Payment
-from notifications.models import Announcement, Notification
-from django.core.mail import EmailMultiAlternatives
+from notifications.models import Announcement
+from notifications.outbox import queue_emails
 from django.template.loader import render_to_string
 from django.contrib.auth.views import PasswordResetView, PasswordResetDoneView
 from django.conf import settings
@@ -160,19 +167,15 @@ def register(request):
                 
                 student_id_link = form.cleaned_data.get('student_id_link')
                 if student_id_link:
-                    try:
-                        student = User.objects.get(
-                            studentprofile__student_id=student_id_link.strip(),
-                            role='student'
-                        )
+                    from students.lookup import resolve_student
+                    student = resolve_student(student_id_link, students_only=True, kinds=['student_id'])
+                    if student is not None:
                         StudentParent.objects.create(
                             parent=user,
                             student=student,
                             relationship=form.cleaned_data.get('relationship', 'Parent'),
                             is_primary=True
                         )
-                    except User.DoesNotExist:
-                        pass
             
             messages.success(request, 'Registration successful! Please wait for admin approval.')
             return redirect('login')
@@ -198,8 +201,6 @@ def refresh_auth_token(request):
 # Dashboard and Main Views
 @login_required
 def dashboard(request):
-    user = request.user
-    
     total_students = User.objects.filter(role='student', is_approved=True).count()
     total_teachers = User.objects.filter(role='teacher', is_approved=True).count()
     
@@ -208,42 +209,42 @@ def dashboard(request):
     
     pending_approvals = User.objects.filter(is_approved=False).count()
     
-    # Get unread notifications for the user
-    unread_notifications = Notification.objects.filter(user=user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=user, is_read=False).count()
-    
+    # unread_notifications / unread_count come from the notifications context processor
     context = {
         'total_students': total_students,
         'total_teachers': total_teachers,
         'total_subjects': total_subjects,
         'pending_approvals': pending_approvals,
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
     }
     
     return render(request, 'dashboard.html', context)
 
 @login_required
 def view_subjects(request):
-    if not hasattr(request.user, 'studentprofile'):
+    if request.identity.student_profile is None:
         messages.error(request, "This page is only available for students.")
         return redirect('dashboard')
     
-    subjects = [
-        {'name': 'Mathematics', 'teacher': 'Mr. Smith', 'schedule': 'Mon, Wed 9:00 AM'},
-        {'name': 'English', 'teacher': 'Ms. Johnson', 'schedule': 'Tue, Thu 10:00 AM'},
-        {'name': 'Science', 'teacher': 'Dr. Brown', 'schedule': 'Mon, Fri 11:00 AM'},
-        {'name': 'Social Studies', 'teacher': 'Mrs. Davis', 'schedule': 'Tue, Thu 1:00 PM'},
-    ]
-    
+    timetable = student_timetable(request.user, request.GET.get('academic_year'), request.GET.get('semester'))
+
     context = {
-        'subjects': subjects,
+        'timetable': timetable,
     }
     return render(request, 'students/view_subjects.html', context)
 
+
+@login_required
+def view_subjects_export(request, fmt):
+    if request.identity.student_profile is None:
+        messages.error(request, "This page is only available for students.")
+        return redirect('dashboard')
+
+    timetable = student_timetable(request.user, request.GET.get('academic_year'), request.GET.get('semester'))
+    return export_response(timetable, fmt, request.user.get_full_name() or request.user.username)
+
 @login_required
 def view_ranks(request):
-    if not hasattr(request.user, 'studentprofile'):
+    if request.identity.student_profile is None:
         messages.error(request, "This page is only available for students.")
         return redirect('dashboard')
     
@@ -261,7 +262,7 @@ def view_ranks(request):
 
 @login_required
 def view_homework(request):
-    if not hasattr(request.user, 'studentprofile'):
+    if request.identity.student_profile is None:
         messages.error(request, "This page is only available for students.")
         return redirect('dashboard')
     
@@ -329,157 +330,83 @@ def enroll_student_in_default_subjects(student_user, grade_level, academic_year=
     - Creates Enrollment objects with provided academic_year and semester (defaults to current)
     - Returns a tuple: (enrolled_count, failures) where failures is list of (subject, reason)
     """
-    from django.core.exceptions import ValidationError
-    from django.db import IntegrityError
-
     if academic_year is None:
         academic_year = get_current_academic_year()
     if semester is None:
         semester = get_current_semester()
 
-    enrolled_count = 0
-    failures = []
-
     # Use configurable subject types from settings
     subject_types = getattr(settings, 'AUTO_ENROLL_SUBJECT_TYPES', ['core'])
     try:
-        subjects_qs = Subject.objects.filter(
-            grade_level=grade_level,
-            is_active=True,
-            subject_type__in=subject_types
-        ).order_by('code')
-        # Deduplicate subjects by name (case-insensitive). Prefer first occurrence (ordered by code).
-        subjects = []
-        seen = set()
-        for s in subjects_qs:
-            key = (s.name or '').strip().lower()
-            if key and key not in seen:
-                subjects.append(s)
-                seen.add(key)
+        # cached and already deduplicated by name (lowest code wins)
+        subjects = grade_catalog(grade_level, subject_types)
     except Exception as e:
         return (0, [(None, f'Failed to load subjects: {e}')])
 
-    for subj in subjects:
-        try:
-            # skip if enrollment already exists for this student/subject/term
-            existing = Enrollment.objects.filter(
-                student=student_user,
-                subject=subj,
-                academic_year=academic_year,
-                semester=semester
-            ).first()
-            if existing:
-                continue
-            
-            # Also skip if the student is already enrolled in a subject with the same name
-            name_conflict = Enrollment.objects.filter(
-                student=student_user,
-                subject__name__iexact=subj.name,
-                academic_year=academic_year,
-                semester=semester,
-                status__in=('active','approved')
-            ).exists()
-            if name_conflict:
-                # avoid enrolling duplicate subject names (different subject records)
-                continue
+    # Also skip subjects whose name the student is already actively enrolled in
+    # (avoid enrolling duplicate subject names from different subject records)
+    enrolled_names = {
+        (name or '').strip().lower()
+        for name in Enrollment.objects.filter(
+            student=student_user,
+            academic_year=academic_year,
+            semester=semester,
+            status__in=('active', 'approved'),
+        ).values_list('subject__name', flat=True)
+    }
+    subjects = [s for s in subjects if (s.name or '').strip().lower() not in enrolled_names]
 
-            Enrollment.objects.create(
-                student=student_user,
-                subject=subj,
-                academic_year=academic_year,
-                semester=semester,
-                status=status,
-                is_auto_assigned=True
-            )
-            enrolled_count += 1
-        except ValidationError as ve:
-            failures.append((subj, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
-        except IntegrityError as ie:
-            failures.append((subj, str(ie)))
-        except Exception as e:
-            failures.append((subj, str(e)))
+    try:
+        result = bulk_enroll(
+            User.objects.filter(pk=student_user.pk),
+            subjects,
+            academic_year,
+            semester,
+            status=status,
+            promote=False,
+        )
+    except Exception as e:
+        return (0, [(None, f'Failed to enroll subjects: {e}')])
 
-    return (enrolled_count, failures)
+    failures = [(subj, reason) for _student_id, subj, reason in result.failures]
+    return (result.created, failures)
 
 def check_schedule_conflicts(student, selected_subjects, academic_year, semester):
     """
     Check for scheduling conflicts between selected subjects
     """
+    subjects_by_id = {subject.id: subject for subject in selected_subjects}
+    entries = [ScheduleEntry.from_subject(subject) for subject in subjects_by_id.values()]
+
     conflicts = []
-    
-    # Get subjects with schedule information
-    scheduled_subjects = [s for s in selected_subjects if s.day_of_week and s.start_time and s.end_time]
-    
-    # Group by day and check for time conflicts
-    days_schedule = {}
-    for subject in scheduled_subjects:
-        if subject.day_of_week not in days_schedule:
-            days_schedule[subject.day_of_week] = []
-        days_schedule[subject.day_of_week].append(subject)
-    
-    # Check for time conflicts on each day
-    for day, subjects in days_schedule.items():
-        # Sort by start time
-        subjects.sort(key=lambda x: x.start_time)
-        
-        for i in range(len(subjects)):
-            for j in range(i + 1, len(subjects)):
-                subject1 = subjects[i]
-                subject2 = subjects[j]
-                
-                # Check if times overlap
-                if (subject1.start_time < subject2.end_time and 
-                    subject1.end_time > subject2.start_time):
-                    
-                    conflicts.append({
-                        'subject1': subject1,
-                        'subject2': subject2,
-                        'day': subject1.get_day_of_week_display() if hasattr(subject1, 'get_day_of_week_display') else subject1.day_of_week,
-                        'time1': f"{subject1.start_time.strftime('%H:%M')} - {subject1.end_time.strftime('%H:%M')}",
-                        'time2': f"{subject2.start_time.strftime('%H:%M')} - {subject2.end_time.strftime('%H:%M')}",
-                    })
-    
+    for entry1, entry2 in find_overlaps([entry for entry in entries if entry.mask]):
+        conflicts.append({
+            'subject1': subjects_by_id[entry1.subject_id],
+            'subject2': subjects_by_id[entry2.subject_id],
+            'day': entry1.day_display,
+            'time1': entry1.time_display,
+            'time2': entry2.time_display,
+        })
     return conflicts
 
-LETTER_GRADE_TO_SCORE = {
-    'A+': 98,
-    'A': 95,
-    'A-': 92,
-    'B+': 88,
-    'B': 85,
-    'B-': 82,
-    'C+': 78,
-    'C': 75,
-    'C-': 72,
-    'D+': 68,
-    'D': 65,
-    'D-': 62,
-    'F': 55,
-}
-
-
-def letter_grade_to_numeric(letter):
-    """Map letter grades to an elementary-friendly 100 point scale."""
-    if not letter:
-        return None
-    return LETTER_GRADE_TO_SCORE.get(letter.strip().upper())
-
-
-def compute_numeric_scores(student, enrollments):
+def compute_numeric_scores(student, enrollments, rank_scores=None):
     """
     Return a tuple of (score_map, total, count, average) for the given enrollments.
     score_map maps enrollment.id -> numeric score (0-100) or None.
+    rank_scores ({subject_id: score}) skips the Grade lookup when the caller
+    already loaded the student's scores.
     """
     subject_ids = [en.subject_id for en in enrollments if getattr(en, 'subject_id', None)]
-    rank_scores = {}
-    if RankGrade is not None and subject_ids:
-        try:
-            rank_scores = {
-                rg.subject_id: rg.score
-                for rg in RankGrade.objects.filter(student=student, subject_id__in=subject_ids)
-            }
-        except Exception:
-            rank_scores = {}
+    if rank_scores is None:
+        rank_scores = {}
+        if RankGrade is not None and subject_ids:
+            try:
+                rank_scores = {
+                    rg.subject_id: rg.score
+                    for rg in RankGrade.objects.filter(student=student, subject_id__in=subject_ids)
+                }
+            except Exception:
+                rank_scores = {}
 
     score_map = {}
     total = 0.0
@@ -514,6 +441,8 @@ def build_rank_map(entries):
     entries: iterable of {'student_id': id, 'grade_level': grade, 'average': value}
     returns {student_id: rank}
     """
+    from ranks.ranking import competition_ranks
+
     grade_groups = defaultdict(list)
     for entry in entries:
         grade = entry.get('grade_level')
@@ -524,25 +453,18 @@ def build_rank_map(entries):
         grade_groups[grade].append((student_id, avg))
 
     rank_map = {}
-    for grade, students in grade_groups.items():
-        students.sort(key=lambda item: item[1], reverse=True)
-        rank = 0
-        previous = None
-        for idx, (student_id, avg) in enumerate(students, start=1):
-            if previous != avg:
-                rank = idx
-                previous = avg
-            rank_map[student_id] = rank
+    for students in grade_groups.values():
+        rank_map.update(competition_ranks(students))
     return rank_map
 
 # users/views.py - UPDATE THE VIEW
 @login_required
 def subject_registration(request):
-    if not hasattr(request.user, 'studentprofile'):
+    if request.identity.student_profile is None:
         messages.error(request, "This page is only available for students.")
         return redirect('dashboard')
     
-    student_profile = request.user.studentprofile
+    student_profile = request.identity.student_profile
     current_grade = student_profile.grade_level
     current_academic_year = get_current_academic_year()
     current_semester = get_current_semester()
@@ -570,10 +492,7 @@ def subject_registration(request):
             # NEW: If conflicts found and user didn't force register, show warning
             if conflicts and 'force_register' not in request.POST:
                 # Prepare context with conflict information
-                available_subjects = Subject.objects.filter(
-                    is_active=True,
-                    grade_level=current_grade
-                ).select_related('instructor', 'instructor__user').order_by('name')
+                available_subjects = grade_catalog(current_grade)
                 
                 enrolled_subjects = Enrollment.objects.filter(
                     student=request.user,
@@ -600,6 +519,25 @@ def subject_registration(request):
                 messages.error(request, "Selected subjects are not available for your grade level or are inactive.")
                 return redirect('subject_registration')
 
+            if intake_mode_enabled():
+                # Queue the selection; process_registration_queue allocates the seats
+                enqueue_registration(
+                    request.user,
+                    [subject.id for subject in selected_subjects],
+                    current_academic_year,
+                    current_semester,
+                    requested_status='active',
+                )
+                if conflicts:
+                    conflict_obj = ScheduleConflict.objects.create(
+                        student=request.user,
+                        academic_year=current_academic_year,
+                        semester=current_semester
+                    )
+                    conflict_obj.conflicting_subjects.set([c['subject1'] for c in conflicts] + [c['subject2'] for c in conflicts])
+                messages.info(request, "Your registration has been received and is being processed. You will be notified when it is complete.")
+                return redirect('subject_registration')
+
             enrolled_count = 0
             failed = []
             with transaction.atomic():
@@ -617,11 +555,14 @@ def subject_registration(request):
                             if existing_enrollment.status in ('active', 'approved'):
                                 messages.info(request, f"You are already enrolled in {subject.name} for {current_academic_year} {student_profile.get_current_semester_display()}.")
                             else:
-                                # Reactivate dropped enrollment
+                                # Reactivate dropped enrollment if a seat is still free
                                 existing_enrollment.status = 'active'
-                                existing_enrollment.save()
-                                enrolled_count += 1
-                                messages.success(request, f"Re-enrolled in {subject.name}!")
+                                if save_holding_seat(existing_enrollment):
+                                    enrolled_count += 1
+                                    messages.success(request, f"Re-enrolled in {subject.name}!")
+                                else:
+                                    messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
+                                    failed.append((subject, 'full'))
                         else:
                             # Ensure subject grade level matches student's grade
                             try:
@@ -633,27 +574,26 @@ def subject_registration(request):
                                 failed.append((subject, f"Subject is for Grade {subject.grade_level} but student is Grade {student_grade}"))
                                 continue
 
-                            # Check subject capacity
-                            current_enrollment = subject.current_enrollment_count(current_academic_year, current_semester)
-
-                            if current_enrollment < subject.max_capacity:
-                                try:
-                                    Enrollment.objects.create(
-                                        student=request.user,
-                                        subject=subject,
-                                        academic_year=current_academic_year,
-                                        semester=current_semester,
-                                        status='active'
-                                    )
+                            # Reserve a seat and create the enrollment together; the
+                            # conditional seat update refuses once the subject is full
+                            try:
+                                enrollment = Enrollment(
+                                    student=request.user,
+                                    subject=subject,
+                                    academic_year=current_academic_year,
+                                    semester=current_semester,
+                                    status='active'
+                                )
+                                if save_holding_seat(enrollment):
                                     enrolled_count += 1
                                     messages.success(request, f"Successfully enrolled in {subject.name}!")
-                                except ValidationError as ve:
-                                    failed.append((subject, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
-                                except IntegrityError as ie:
-                                    failed.append((subject, str(ie)))
-                            else:
-                                messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
-                                failed.append((subject, 'full'))
+                                else:
+                                    messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
+                                    failed.append((subject, 'full'))
+                            except ValidationError as ve:
+                                failed.append((subject, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
+                            except IntegrityError as ie:
+                                failed.append((subject, str(ie)))
                     except Subject.DoesNotExist:
                         failed.append((subject, 'missing'))
                     except (IntegrityError, ValidationError) as e:
@@ -686,12 +626,6 @@ def subject_registration(request):
             return redirect('subject_registration')
     
     try:
-        # UPDATED: Get available subjects with instructor and schedule info
-        available_subjects = Subject.objects.filter(
-            is_active=True,
-            grade_level=current_grade
-        ).select_related('instructor', 'instructor__user').order_by('name')
-        
         # Get currently enrolled subjects for this academic year and semester
         enrolled_subjects = Enrollment.objects.filter(
             student=request.user,
@@ -702,22 +636,9 @@ def subject_registration(request):
         
         enrolled_subject_ids = [enrollment.subject.id for enrollment in enrolled_subjects]
         
-        # UPDATED: Deduplicate available subjects by name (case-insensitive) and add enhanced enrollment info
-        deduped = []
-        seen_names = set()
-        for subject in available_subjects:
-            key = (subject.name or '').strip().lower()
-            if not key:
-                continue
-            if key in seen_names:
-                continue
-            # mark as seen and include
-            seen_names.add(key)
-            subject.current_enrollment = subject.current_enrollment_count(current_academic_year, current_semester)
-            subject.available_slots = subject.available_slots(current_academic_year, current_semester)
-            subject.is_available = subject.is_available(current_academic_year, current_semester)
-            deduped.append(subject)
-        available_subjects = deduped
+        # available subjects come from the cached, name-deduplicated grade catalog;
+        # seat counts for every listed subject come from one query
+        available_subjects = attach_seat_info(grade_catalog(current_grade), current_academic_year, current_semester)
             
     except Exception as e:
         print(f"Error in subject registration: {str(e)}")
@@ -735,6 +656,7 @@ def subject_registration(request):
         'current_semester': student_profile.get_current_semester_display(),
         'max_subjects': 8,
         'max_credits': 24,
+        'pending_registration': open_request_for(request.user) if intake_mode_enabled() else None,
     }
     # Support JSON responses for API/JS clients
     wants_json = (
@@ -772,11 +694,11 @@ def subject_registration(request):
     return render(request, 'students/subject_registration.html', context)
 @login_required
 def view_transcripts(request):
-    if not hasattr(request.user, 'studentprofile'):
+    if request.identity.student_profile is None:
         messages.error(request, "This page is only available for students.")
         return redirect('dashboard')
     
-    student_profile = request.user.studentprofile
+    student_profile = request.identity.student_profile
     context = {
         'student_profile': student_profile,
     }
@@ -795,9 +717,8 @@ def student_dashboard(request):
         messages.error(request, "You don't have permission to access the student dashboard.")
         return redirect('dashboard')
     
-    try:
-        student_profile = request.user.studentprofile
-    except StudentProfile.DoesNotExist:
+    student_profile = request.identity.student_profile
+    if student_profile is None:
         messages.error(request, "Student profile not found. Please contact administration.")
         return redirect('dashboard')
     
@@ -1054,110 +975,43 @@ def post_announcement(request):
             is_active=is_active
         )
         
-        # Get all users who should receive this announcement
-        # If target_roles is empty (all selected), get all active users
-        # Otherwise, filter by the selected roles
-        if target_roles and len(target_roles) > 0:
-            recipients = User.objects.filter(role__in=target_roles, is_active=True)
-        else:
-            # Empty list means all users
-            recipients = User.objects.filter(is_active=True)
-        
-        # Create notifications and send emails
-        notifications_created = 0
-        emails_sent = 0
-        emails_failed = 0
-        
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@localhost')
-        site_name = getattr(settings, 'SITE_NAME', 'SIMS')
-        
-        print(f"\n=== POSTING ANNOUNCEMENT ===")
-        print(f"Title: {title}")
-        print(f"Target roles: {target_roles}")
-        print(f"Send email: {send_email}")
-        print(f"Total recipients: {recipients.count()}")
-        print(f"From email: {from_email}")
-        
-        for user in recipients:
-            # Create notification for each user
-            try:
-                # Check if notification already exists to avoid duplicates
-                notification, created = Notification.objects.get_or_create(
-                    user=user,
-                    title=title,
-                    message=content,
-                    defaults={'link': f'/announcements/'}
-                )
-                if created:
-                    notifications_created += 1
-            except Exception as e:
-                print(f"Failed to create notification for {user.username}: {e}")
-                import traceback
-                traceback.print_exc()
-            
-            # Send email if requested and user has email
-            if send_email:
-                if not user.email:
-                    print(f"⚠ User {user.username} has no email address, skipping email")
-                    continue
-                try:
-                    subject = f"[{site_name}] {title}"
-                    # Format content properly - replace newlines with <br> for HTML
-                    formatted_content = content.replace('\n', '<br>').replace('\r', '')
-                    text_content = f"{content}\n\nPosted on {announcement.created_at.strftime('%B %d, %Y at %H:%M')}\n\n---\n{site_name}"
-                    html_content = f"""
-                    <html>
-                    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                            <h2 style="color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px;">{title}</h2>
-                            <div style="margin: 20px 0;">
-                                {formatted_content}
-                            </div>
-                            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
-                            <p style="color: #7f8c8d; font-size: 12px;">
-                                Posted on {announcement.created_at.strftime('%B %d, %Y at %H:%M')}<br>
-                                ---<br>
-                                {site_name}
-                            </p>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [user.email])
-                    msg.attach_alternative(html_content, "text/html")
-                    # Try to send email - first with fail_silently=False to see errors
-                    try:
-                        result = msg.send(fail_silently=False)
-                        emails_sent += 1
-                        print(f"✓ Email sent successfully to {user.email} ({user.get_full_name()})")
-                    except Exception as send_error:
-                        emails_failed += 1
-                        print(f"✗ SMTP Error sending to {user.email}: {send_error}")
-                        # Try with fail_silently=True as fallback
-                        try:
-                            msg.send(fail_silently=True)
-                            print(f"  (Retried silently)")
-                        except:
-                            pass
-                except Exception as e:
-                    emails_failed += 1
-                    print(f"✗ Exception preparing email for {user.email}: {e}")
-                    import traceback
-                    traceback.print_exc()
-        
-        print(f"\n=== ANNOUNCEMENT POSTING SUMMARY ===")
-        print(f"Notifications created: {notifications_created}")
-        print(f"Emails sent: {emails_sent}")
-        print(f"Emails failed: {emails_failed}")
-        print(f"=====================================\n")
-        
+        # The announcement is stored once; readers are matched to it by role
+        # when they load their announcements, so nothing is written per user.
         success_msg = f'Announcement posted successfully!'
-        if notifications_created > 0:
-            success_msg += f' Notifications created: {notifications_created}.'
+        
         if send_email:
-            success_msg += f' Emails sent: {emails_sent}'
-            if emails_failed > 0:
-                success_msg += f' (Failed: {emails_failed} - check console/terminal for details)'
+            site_name = getattr(settings, 'SITE_NAME', 'SIMS')
+            posted_on = announcement.created_at.strftime('%B %d, %Y at %H:%M')
+            # Format content properly - replace newlines with <br> for HTML
+            formatted_content = content.replace('\n', '<br>').replace('\r', '')
+            text_content = f"{content}\n\nPosted on {posted_on}\n\n---\n{site_name}"
+            html_content = f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                    <h2 style="color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px;">{title}</h2>
+                    <div style="margin: 20px 0;">
+                        {formatted_content}
+                    </div>
+                    <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+                    <p style="color: #7f8c8d; font-size: 12px;">
+                        Posted on {posted_on}<br>
+                        ---<br>
+                        {site_name}
+                    </p>
+                </div>
+            </body>
+            </html>
+            """
+            recipients = User.objects.filter(is_active=True).exclude(email='')
+            if target_roles:
+                recipients = recipients.filter(role__in=target_roles)
+            # Emails are queued here and delivered by the send_queued_email worker
+            emails_queued = queue_emails(
+                {'subject': f"[{site_name}] {title}", 'body': text_content, 'html_body': html_content, 'to': [email]}
+                for email in recipients.values_list('email', flat=True)
+            )
+            success_msg += f' Emails queued: {emails_queued}'
         
         messages.success(request, success_msg)
         return redirect('admin_panel')
@@ -1177,24 +1031,22 @@ def check_schedule_conflicts_ajax(request):
             if not subject_ids:
                 return JsonResponse({'conflicts': [], 'has_conflicts': False})
             
-            selected_subjects = Subject.objects.filter(
-                id__in=subject_ids
-            ).select_related('instructor', 'instructor__user')
-            
-            conflicts = check_schedule_conflicts(request.user, selected_subjects, '', '')
+            # Answered from the in-memory schedule index, without touching the subjects table
+            entries = schedule_index().lookup(subject_ids)
+            conflicts = find_overlaps(entries)
             
             conflict_data = []
-            for conflict in conflicts:
+            for entry1, entry2 in conflicts:
                 conflict_data.append({
-                    'subject1_name': conflict['subject1'].name,
-                    'subject1_code': conflict['subject1'].code,
-                    'subject1_schedule': conflict['subject1'].schedule_display,
-                    'subject2_name': conflict['subject2'].name,
-                    'subject2_code': conflict['subject2'].code,
-                    'subject2_schedule': conflict['subject2'].schedule_display,
-                    'day': conflict['day'],
-                    'time1': conflict['time1'],
-                    'time2': conflict['time2'],
+                    'subject1_name': entry1.name,
+                    'subject1_code': entry1.code,
+                    'subject1_schedule': entry1.schedule_display,
+                    'subject2_name': entry2.name,
+                    'subject2_code': entry2.code,
+                    'subject2_schedule': entry2.schedule_display,
+                    'day': entry1.day_display,
+                    'time1': entry1.time_display,
+                    'time2': entry2.time_display,
                 })
             
             return JsonResponse({
@@ -1218,15 +1070,10 @@ def is_registrar(user):
 @user_passes_test(is_registrar)
 def registrar_dashboard(request):
     """Registrar dashboard view"""
-    # Get unread notifications for the registrar
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
     
     context = {
         'page_title': 'Registrar Dashboard',
         'user': request.user,
-        'unread_notifications': unread_notifications,
-        'unread_count': unread_count,
     }
     return render(request, 'registrar/dashboard.html', context)
 # users/views.py or registrar/views.py
@@ -1391,7 +1238,7 @@ from subjects.models import Enrollment, Grade
 from django.db import OperationalError
 try:
     from ranks.models import Grade as RankGrade
-    from ranks.models import calculate_student_average, rank_students_for_subject
+    from ranks.models import calculate_student_average
 except Exception:
     RankGrade = None
 
@@ -1575,6 +1422,21 @@ def generate_transcript(request, student_id):
             "then restart the server."))
         return redirect('manage_academic_records')
     
+    # Load the student's scores and per-subject ranks up front: one query each
+    # instead of re-ranking every subject's class inside the loop below
+    rank_scores = {}
+    subject_ranks = {}
+    try:
+        if RankGrade is not None:
+            from ranks.ranking import student_subject_ranks
+            rank_scores = dict(
+                RankGrade.objects.filter(student=student, score__isnull=False).values_list('subject_id', 'score')
+            )
+            subject_ranks = student_subject_ranks(student)
+    except OperationalError:
+        messages.error(request, "Database schema for ranks not found. Run `python manage.py migrate ranks`.")
+        return redirect('manage_academic_records')
+
     # Group by academic year and semester and collect numeric scores where available
     transcripts_by_year = {}
     detailed_rows = []
@@ -1584,22 +1446,8 @@ def generate_transcript(request, student_id):
             transcripts_by_year[key] = []
 
         # Try to get numeric score from ranks.Grade if available
-        numeric_score = None
-        subject_rank = None
-        try:
-            if RankGrade is not None:
-                rg = RankGrade.objects.filter(student=student, subject=enrollment.subject).first()
-                if rg and rg.score is not None:
-                    numeric_score = rg.score
-                    # compute subject rank
-                    subject_rankings = rank_students_for_subject(enrollment.subject)
-                    for s, sc, r in subject_rankings:
-                        if s.id == student.id:
-                            subject_rank = r
-                            break
-        except OperationalError:
-            messages.error(request, "Database schema for ranks not found. Run `python manage.py migrate ranks`.")
-            return redirect('manage_academic_records')
+        numeric_score = rank_scores.get(enrollment.subject_id)
+        subject_rank = subject_ranks.get(enrollment.subject_id) if numeric_score is not None else None
 
         # If numeric score not available, check enrollment.result field
         if numeric_score is None:
@@ -1685,30 +1533,13 @@ def generate_transcript(request, student_id):
         if graded_count > 0:
             numeric_average = total_result / graded_count
 
-    # Compute student's rank among peers in same grade (by numeric average)
+    # Student's rank among peers in the same grade comes from the class standing
     student_rank = None
     try:
         if RankGrade is not None:
-            peers = User.objects.filter(role='student', studentprofile__grade_level=student.studentprofile.grade_level)
-            peer_averages = []
-            for p in peers:
-                avg = calculate_student_average(p) or 0
-                peer_averages.append((p.id, avg))
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            rank = 0
-            last_score = None
-            idx = 0
-            for pid, avg in peer_averages:
-                idx += 1
-                if avg == last_score:
-                    # same rank
-                    pass
-                else:
-                    rank = idx
-                    last_score = avg
-                if pid == student.id:
-                    student_rank = rank
-                    break
+            from ranks.standings import current_standing
+            standing = current_standing(student)
+            student_rank = standing.rank if standing is not None else None
     except OperationalError:
         student_rank = None
 